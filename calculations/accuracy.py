@@ -20,3 +20,37 @@ def compare(predicted_data, real_data):
     result = match_pixels[match_pixels]
     result = 100.0 * result.shape[0] / (height * width)
     return result
+
+
+def mean_iou(predicted_data, real_data, num_classes):
+    """Mean intersection over union of the classes.
+
+    Classes which are absent both in prediction and in real data are not
+    counted.
+
+    Args:
+        predicted_data: numpy array, int32 - [..., height, width].
+            Array of the prediction.
+        real_data: numpy array, int32 - [..., height, width].
+            Array of the real.
+        num_classes: int32.
+            The number of classes.
+
+    Returns:
+        result: float32.
+            Mean IoU in percents.
+    """
+    predicted_data = np.asarray(predicted_data).ravel().astype(np.int64)
+    real_data = np.asarray(real_data).ravel().astype(np.int64)
+
+    # Confusion matrix - [real, predicted].
+    confusion = np.bincount(real_data * num_classes + predicted_data,
+                            minlength=num_classes ** 2)
+    confusion = confusion.reshape((num_classes, num_classes))
+
+    intersection = np.diag(confusion)
+    union = confusion.sum(axis=0) + confusion.sum(axis=1) - intersection
+
+    present = union > 0
+    result = 100.0 * np.mean(intersection[present] / union[present])
+    return result
@@ -0,0 +1,251 @@
+#!/usr/bin/env python
+
+"""Autotune session thread pools of FCN16VGG on the current host.
+
+Intra-op and inter-op thread pool sizes and batch sizes are swept over the
+inference (or training step) graph and the fastest setting is saved into
+the session profile, which utils.session_config loads automatically.
+Every thread pool setting is measured in a fresh process, as TensorFlow
+sizes its thread pools only once per process:
+
+    $ python autotune.py --mode inference --height 180 --width 320
+    $ python autotune.py --mode training --batch-sizes 1,2,5
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import socket
+import sys
+import time
+
+import numpy as np
+import tensorflow as tf
+
+import fcn16_vgg
+import loss
+import utils
+
+logging.basicConfig(format='%(asctime)s %(levelname)s %(message)s',
+                    level=logging.INFO,
+                    stream=sys.stdout)
+
+
+def thread_candidates(cpu_count):
+    """Intra-op and inter-op pool sizes to try.
+
+    Args:
+        cpu_count: int32.
+
+    Returns:
+        candidates: list of tuples - [(intra_op_threads, inter_op_threads)].
+    """
+    intra = set([cpu_count, max(1, cpu_count // 2)])
+    threads = 1
+    while threads < cpu_count:
+        intra.add(threads)
+        threads *= 2
+
+    return [(intra_threads, inter_threads)
+            for intra_threads in sorted(intra)
+            for inter_threads in (1, 2)
+            if intra_threads * inter_threads <= cpu_count or inter_threads == 1]
+
+
+def build_graph(mode, height, width, num_classes, vgg16_npy_path):
+    """Build the measured graph in a new tf.Graph.
+
+    Returns:
+        graph: tf.Graph.
+        input_placeholder: tensor.
+        output_placeholder: tensor.
+            None in inference mode.
+        fetch: tensor or operation.
+    """
+    graph = tf.Graph()
+    with graph.as_default():
+        input_placeholder = tf.placeholder(tf.uint8, [None, height, width, 3])
+        output_placeholder = None
+
+        vgg_fcn = fcn16_vgg.FCN16VGG(vgg16_npy_path)
+        with tf.name_scope('content_vgg'):
+            vgg_fcn.build(input_placeholder, train=mode == 'training',
+                          num_classes=num_classes)
+
+        if mode == 'training':
+            output_placeholder = tf.placeholder(tf.uint8, [None, height, width])
+            with tf.name_scope('loss'):
+                training_loss = loss.sparse_loss(vgg_fcn.upscore32, output_placeholder,
+                                                 num_classes,
+                                                 regularization_losses=vgg_fcn.regularization_losses)
+            fetch = tf.train.AdamOptimizer(0.0001).minimize(training_loss)
+        else:
+            fetch = vgg_fcn.pred_up
+
+        graph.add_to_collection('init', tf.global_variables_initializer())
+
+    return graph, input_placeholder, output_placeholder, fetch
+
+
+def _measure(mode, height, width, num_classes, vgg16_npy_path,
+             intra_threads, inter_threads, batch_sizes, runs):
+    """Measure one thread pool setting at every batch size.
+
+    TensorFlow sizes its thread pools once per process (by the first
+    session), so every setting is measured in its own fresh process.
+
+    Returns:
+        results: list of dictionaries.
+    """
+    graph, input_placeholder, output_placeholder, fetch = build_graph(
+        mode, height, width, num_classes, vgg16_npy_path)
+    init = graph.get_collection('init')[0]
+
+    config = tf.ConfigProto(allow_soft_placement=True,
+                            intra_op_parallelism_threads=intra_threads,
+                            inter_op_parallelism_threads=inter_threads)
+    config.gpu_options.allow_growth = True
+
+    results = []
+    with tf.Session(graph=graph, config=config) as sess:
+        sess.run(init)
+
+        for batch_size in batch_sizes:
+            feed_dict = {input_placeholder: np.random.randint(
+                0, 256, (batch_size, height, width, 3)).astype(np.uint8)}
+            if output_placeholder is not None:
+                feed_dict[output_placeholder] = np.random.randint(
+                    0, num_classes, (batch_size, height, width)).astype(np.uint8)
+
+            sess.run(fetch, feed_dict=feed_dict)
+            start_time = time.time()
+            for _ in range(runs):
+                sess.run(fetch, feed_dict=feed_dict)
+            latency = (time.time() - start_time) / runs
+
+            results.append({'intra_op_parallelism_threads': intra_threads,
+                            'inter_op_parallelism_threads': inter_threads,
+                            'batch_size': batch_size,
+                            'latency': latency,
+                            'images_per_second': batch_size / latency})
+
+    return results
+
+
+def autotune(mode, height, width, batch_sizes, runs=5, num_classes=3,
+             vgg16_npy_path='./vgg16.npy', max_latency=None):
+    """Measure throughput of every thread pool and batch size setting.
+
+    Every thread pool setting runs in a fresh spawned process, see _measure.
+
+    Args:
+        mode: string.
+            'inference' or 'training'.
+        height: int32.
+        width: int32.
+        batch_sizes: list, int32.
+        runs: int32.
+            Measured runs of every setting, after one warm up run.
+        num_classes: int32.
+        vgg16_npy_path: string.
+        max_latency: float32.
+            Settings with slower batches (seconds) are not chosen.
+
+    Returns:
+        best: dictionary - {'intra_op_parallelism_threads',
+            'inter_op_parallelism_threads', 'batch_size', 'images_per_second'}.
+        results: list of dictionaries.
+    """
+    context = multiprocessing.get_context('spawn')
+
+    results = []
+    for intra_threads, inter_threads in thread_candidates(multiprocessing.cpu_count()):
+        pool = context.Pool(1)
+        try:
+            setting_results = pool.apply(_measure, (
+                mode, height, width, num_classes, vgg16_npy_path,
+                intra_threads, inter_threads, batch_sizes, runs))
+        finally:
+            pool.close()
+            pool.join()
+
+        for result in setting_results:
+            print('intra %2d, inter %d, batch %2d: %7.1f ms, %6.2f images/s'
+                  % (intra_threads, inter_threads, result['batch_size'],
+                     1000.0 * result['latency'], result['images_per_second']))
+        results.extend(setting_results)
+
+    allowed = [result for result in results
+               if max_latency is None or result['latency'] <= max_latency]
+    best = max(allowed or results, key=lambda result: result['images_per_second'])
+
+    return best, results
+
+
+def save_profile(mode, settings, path=None):
+    """Save settings of a mode into the session profile of this host.
+
+    Args:
+        mode: string.
+        settings: dictionary.
+        path: string.
+            Profile path, utils.SESSION_PROFILE_PATH by default.
+    """
+    path = path or utils.SESSION_PROFILE_PATH
+    profile = {}
+    if os.path.exists(path):
+        with open(path) as profile_file:
+            profile = json.load(profile_file)
+
+    if profile.get('host') != socket.gethostname():
+        profile = {}
+    profile['host'] = socket.gethostname()
+    profile['cpu_count'] = multiprocessing.cpu_count()
+    profile[mode] = settings
+
+    with open(path, 'w') as profile_file:
+        json.dump(profile, profile_file, indent=2, sort_keys=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--mode', default='inference', choices=['inference', 'training'])
+    parser.add_argument('--height', type=int, default=180)
+    parser.add_argument('--width', type=int, default=320)
+    parser.add_argument('--batch-sizes', default='1,2,4,8',
+                        help='Comma separated batch sizes.')
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--max-latency', type=float, default=None,
+                        help='Milliseconds, slower batches are not chosen.')
+    parser.add_argument('--vgg16-npy-path', default='./vgg16.npy')
+    parser.add_argument('--output', default=None,
+                        help='Profile path, %s by default.' % utils.SESSION_PROFILE_PATH)
+    args = parser.parse_args()
+
+    batch_sizes = [int(batch_size) for batch_size in args.batch_sizes.split(',')]
+    max_latency = args.max_latency / 1000.0 if args.max_latency else None
+
+    best, _ = autotune(args.mode, args.height, args.width, batch_sizes, args.runs,
+                       vgg16_npy_path=args.vgg16_npy_path, max_latency=max_latency)
+
+    settings = dict((key, best[key]) for key in ('intra_op_parallelism_threads',
+                                                 'inter_op_parallelism_threads',
+                                                 'batch_size', 'images_per_second'))
+    save_profile(args.mode, settings, args.output)
+
+    print('Best %s setting: intra %d, inter %d, batch %d, %.2f images/s'
+          % (args.mode, best['intra_op_parallelism_threads'],
+             best['inter_op_parallelism_threads'], best['batch_size'],
+             best['images_per_second']))
+    print("Saved into '%s'." % (args.output or utils.SESSION_PROFILE_PATH))
+
+
+if __name__ == '__main__':
+    main()
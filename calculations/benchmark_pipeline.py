@@ -0,0 +1,236 @@
+#!/usr/bin/env python
+
+"""Samples/s and peak memory of the data pipeline at growing dataset sizes.
+
+Synthetic datasets (see synthetic_dataset.py) of every size are generated
+once into the work directory, then every stage runs in a fresh process,
+so its peak memory (above the memory of imported modules) is not hidden
+by earlier stages:
+
+    read_files      utils.read_files: JPEG decoding and label rasterization.
+    rasterization   JSON parsing and utils.polygons_to_regions only.
+    training_input  loading the compiled dataset, splitting it and one
+                    epoch of training batches.
+    evaluation      pixel accuracy and mIoU over the compiled labels.
+
+The dataset is compiled (train.compile_dataset) once per size before the
+stages and this is not measured.
+
+    $ python benchmark_pipeline.py --sizes 1000,10000,100000 --work-dir ../synthetic
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import argparse
+import glob
+import json
+import multiprocessing
+import os
+import resource
+import time
+
+import numpy as np
+
+import accuracy
+import synthetic_dataset
+import train
+import utils
+
+STAGES = ['read_files', 'rasterization', 'training_input', 'evaluation']
+
+
+def _peak_memory():
+    """Peak resident memory of this process in bytes."""
+    # ru_maxrss is in kilobytes on Linux.
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def _read_files(data_dir, config):
+    return len(utils.read_files(data_dir, sparse=True))
+
+
+def _rasterization(data_dir, config):
+    json_paths = glob.glob(os.path.join(data_dir, '*.json'))
+    for json_path in json_paths:
+        with open(json_path) as data_file:
+            data = json.load(data_file)
+        utils.polygons_to_regions(data['polygons'], config['height'], config['width'],
+                                  utils.CLASSES)
+    return len(json_paths)
+
+
+def _compile(config):
+    train.compile_dataset(config, recompile=True)
+
+
+def _training_input(data_dir, config):
+    input_set, output_set = train.compile_dataset(config)
+
+    train_input_set, train_output_set, _, _ \
+        = utils.train_test_split(input_set, output_set, config['test_size'])
+    train_input_set, train_output_set, _, _ \
+        = utils.train_test_split(train_input_set, train_output_set, config['valid_size'])
+
+    size = train_input_set.shape[0]
+    batch_size = config['batch_size']
+    order = np.random.permutation(size)
+    for offset in range(0, size, batch_size):
+        indices = np.sort(order[offset:(offset + batch_size)])
+        # Fancy indexing copies the batch, as the training feed does.
+        input_batch, output_batch = train_input_set[indices], train_output_set[indices]
+
+    return input_set.shape[0]
+
+
+def _evaluation(data_dir, config):
+    output_set = utils.sparse_labels(np.load(config['output_set']))
+
+    # Labels with 10% of pixels changed stand for predictions.
+    rng = np.random.RandomState(0)
+    predictions = output_set.copy()
+    changed = rng.random_sample(output_set.shape) < 0.1
+    predictions[changed] = rng.randint(0, config['num_classes'], np.count_nonzero(changed))
+
+    start_time = time.time()
+    batch_size = config['batch_size']
+    for offset in range(0, output_set.shape[0], batch_size):
+        np.mean(predictions[offset:(offset + batch_size)]
+                == output_set[offset:(offset + batch_size)])
+    accuracy.mean_iou(predictions, output_set, config['num_classes'])
+
+    return output_set.shape[0], time.time() - start_time
+
+
+STAGE_FUNCTIONS = {
+    'read_files': _read_files,
+    'rasterization': _rasterization,
+    'training_input': _training_input,
+    'evaluation': _evaluation,
+}
+
+
+def _run_stage(stage, data_dir, config):
+    """Run a stage in the current (fresh) process.
+
+    Returns:
+        samples: int32.
+        seconds: float32.
+        peak_memory: int32.
+            Peak memory above the memory after imports, bytes.
+    """
+    baseline = _peak_memory()
+    start_time = time.time()
+    result = STAGE_FUNCTIONS[stage](data_dir, config)
+    seconds = time.time() - start_time
+
+    if isinstance(result, tuple):
+        # The stage measured its time itself.
+        result, seconds = result
+
+    return result, seconds, max(0, _peak_memory() - baseline)
+
+
+def benchmark(sizes, work_dir, stages=STAGES, batch_size=5, **options):
+    """Generate datasets and measure every stage at every size.
+
+    Args:
+        sizes: list, int32.
+        work_dir: string.
+            Datasets of every size are generated into its subdirectories.
+        stages: list, string.
+        batch_size: int32.
+        options: see synthetic_dataset.make_sample.
+
+    Returns:
+        results: list of dictionaries - [{'size', 'stage', 'samples',
+            'seconds', 'samples_per_second', 'peak_memory'}].
+    """
+    context = multiprocessing.get_context('spawn')
+    results = []
+
+    for size in sizes:
+        data_dir = os.path.join(work_dir, str(size))
+        print("Generating %d samples in '%s'." % (size, data_dir))
+        synthetic_dataset.generate(data_dir, size, **options)
+
+        config = {
+            'resource': data_dir,
+            'input_set': os.path.join(data_dir, 'input_set.npy'),
+            'output_set': os.path.join(data_dir, 'output_set.npy'),
+            'height': options.get('height', 180),
+            'width': options.get('width', 320),
+            'num_classes': 3,
+            'test_size': 0.1,
+            'valid_size': 0.1,
+            'batch_size': batch_size,
+        }
+
+        # Not a stage, the compiled dataset is only read by the stages.
+        if 'training_input' in stages or 'evaluation' in stages:
+            pool = context.Pool(1)
+            try:
+                pool.apply(_compile, (config,))
+            finally:
+                pool.close()
+                pool.join()
+
+        for stage in stages:
+            pool = context.Pool(1)
+            try:
+                samples, seconds, peak_memory = pool.apply(_run_stage, (stage, data_dir, config))
+            finally:
+                pool.close()
+                pool.join()
+
+            result = {'size': size, 'stage': stage, 'samples': samples, 'seconds': seconds,
+                      'samples_per_second': samples / max(seconds, 1e-6),
+                      'peak_memory': peak_memory}
+            results.append(result)
+            print('%-8d %-16s %10.1f %14.1f %12.1f'
+                  % (size, stage, seconds, result['samples_per_second'],
+                     peak_memory / 2 ** 20))
+
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', default='1000,10000',
+                        help='Comma separated dataset sizes.')
+    parser.add_argument('--work-dir', default='../synthetic')
+    parser.add_argument('--stages', default=','.join(STAGES),
+                        help='Comma separated stages.')
+    parser.add_argument('--batch-size', type=int, default=5)
+    parser.add_argument('--polygons', default='1-3')
+    parser.add_argument('--complexity', type=int, default=12)
+    parser.add_argument('--class-mix', default='route=0.7,obstacle=0.3')
+    parser.add_argument('--output', default=None, help='JSON file of results.')
+    args = parser.parse_args()
+
+    stages = args.stages.split(',')
+    unknown = set(stages) - set(STAGES)
+    if unknown:
+        parser.error('Unknown stages: ' + ', '.join(sorted(unknown)))
+    stages = [stage for stage in STAGES if stage in stages]
+
+    polygons = tuple(int(value) for value in args.polygons.split('-'))
+    if len(polygons) == 1:
+        polygons = polygons * 2
+
+    print('%-8s %-16s %10s %14s %12s' % ('Size', 'Stage', 'Seconds', 'Samples/s',
+                                         'Peak (MB)'))
+    results = benchmark([int(size) for size in args.sizes.split(',')], args.work_dir,
+                        stages=stages, batch_size=args.batch_size, polygons=polygons,
+                        complexity=args.complexity,
+                        class_mix=synthetic_dataset.parse_class_mix(args.class_mix))
+
+    if args.output:
+        with open(args.output, 'w') as output_file:
+            json.dump(results, output_file, indent=2)
+
+
+if __name__ == '__main__':
+    main()
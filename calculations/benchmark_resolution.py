@@ -0,0 +1,61 @@
+#!/usr/bin/env python
+
+"""Latency / mIoU tradeoff of inference at different resolutions."""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import argparse
+import time
+
+import numpy as np
+
+import accuracy
+import inference
+import utils
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--model', default='./models/model.ckpt',
+                        help='Checkpoint of trained model.')
+    parser.add_argument('--input-set', default='input_set.npy')
+    parser.add_argument('--output-set', default='output_set.npy')
+    parser.add_argument('--scales', default='1.0,0.75,0.5,0.25',
+                        help='Comma separated inference scales.')
+    parser.add_argument('--limit', type=int, default=50,
+                        help='The number of evaluated images.')
+    args = parser.parse_args()
+
+    input_set = np.load(args.input_set)[:args.limit]
+    real_set = utils.sparse_labels(np.load(args.output_set)[:args.limit])
+
+    num_classes = 3
+    scales = [float(scale) for scale in args.scales.split(',')]
+    height, width = input_set.shape[1:3]
+
+    segmenter = inference.Segmenter(args.model, num_classes=num_classes)
+
+    print('%-8s %-10s %-14s %-10s' % ('Scale', 'Size', 'Latency (ms)', 'mIoU (%)'))
+    for scale in scales:
+        # Warm up run is not measured.
+        segmenter.predict(input_set[:1], scale)
+
+        latencies = []
+        predictions = []
+        for i in range(input_set.shape[0]):
+            start_time = time.time()
+            predictions.append(segmenter.predict(input_set[i:i + 1], scale)[0])
+            latencies.append(time.time() - start_time)
+
+        size = '%dx%d' % (int(round(width * scale)), int(round(height * scale)))
+        miou = accuracy.mean_iou(np.array(predictions), real_set, num_classes)
+        print('%-8.2f %-10s %-14.1f %-10.1f' % (scale, size,
+                                                1000 * np.mean(latencies), miou))
+
+    segmenter.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,168 @@
+#!/usr/bin/env python
+
+"""Classical CV detector gating FCN16VGG inference on a video.
+
+The cheap CVPathDetector runs on every frame and FCN16VGG runs only when
+the detector is not confident that the scene is the same as on the last
+FCN16VGG frame, or when the periodic refresh is due. Otherwise the last
+FCN16VGG label map is reused.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import argparse
+import time
+
+import cv2
+import numpy as np
+
+import accuracy
+import inference
+from cv.path_detector import CVPathDetector
+
+
+class CascadeSegmenter:
+    """Run the classical detector first and FCN16VGG only when needed.
+
+    Confidence is the minimum of:
+        - bumper stability: how little the adapted road colour moved since
+          the last FCN16VGG frame,
+        - mask agreement: IoU of detector path pixels with the detector
+          mask of the last FCN16VGG frame.
+
+    Args:
+        segmenter: inference.Segmenter.
+            Segmenter of BGR frames (channel_order='bgr').
+        detector: CVPathDetector.
+        min_confidence: float32.
+            FCN16VGG runs if confidence is lower.
+        refresh_interval: int32.
+            FCN16VGG runs at least every refresh_interval frames.
+        color_tolerance: float32.
+            Road colour movement which makes bumper stability zero.
+    """
+
+    def __init__(self, segmenter, detector=None, min_confidence=0.85,
+                 refresh_interval=30, color_tolerance=0.1):
+        self.segmenter = segmenter
+        self.detector = detector or CVPathDetector(blur_ksize=5)
+        self.min_confidence = min_confidence
+        self.refresh_interval = refresh_interval
+        self.color_tolerance = color_tolerance
+
+        self.frames = 0
+        self.cnn_frames = 0
+
+        self._reference_path = None
+        self._reference_color = None
+        self._prediction = None
+        self._since_cnn = 0
+
+    @property
+    def skipped_fraction(self):
+        return 1.0 - self.cnn_frames / max(1, self.frames)
+
+    def confidence(self, path):
+        """Confidence that the last FCN16VGG label map is still valid.
+
+        Args:
+            path: numpy array, bool - [height, width].
+                Path pixels of the current frame.
+
+        Returns:
+            confidence: float32 - [0, 1].
+        """
+        if self._reference_path is None or self._reference_path.shape != path.shape:
+            return 0.0
+
+        color_shift = np.linalg.norm(self.detector.mean_channel - self._reference_color)
+        stability = max(0.0, 1.0 - color_shift / self.color_tolerance)
+
+        union = np.count_nonzero(path | self._reference_path)
+        intersection = np.count_nonzero(path & self._reference_path)
+        agreement = intersection / union if union else 1.0
+
+        return min(stability, agreement)
+
+    def __call__(self, frame):
+        """Segment a frame.
+
+        Args:
+            frame: numpy array, uint8 - [height, width, 3].
+                BGR frame as read by OpenCV.
+
+        Returns:
+            prediction: numpy array, int64 - [height, width].
+            ran_cnn: bool.
+                Whether FCN16VGG was run on this frame.
+        """
+        path = self.detector(frame) == 0
+        confidence = self.confidence(path)
+
+        self.frames += 1
+        self._since_cnn += 1
+
+        ran_cnn = (self._prediction is None or
+                   self._since_cnn >= self.refresh_interval or
+                   confidence < self.min_confidence)
+
+        if ran_cnn:
+            self._prediction = self.segmenter.predict([frame])[0]
+            self._reference_path = path
+            self._reference_color = self.detector.mean_channel.copy()
+            self._since_cnn = 0
+            self.cnn_frames += 1
+
+        return self._prediction, ran_cnn
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('video', help='Test video.')
+    parser.add_argument('--model', default='./models/model.ckpt')
+    parser.add_argument('--min-confidence', type=float, default=0.85)
+    parser.add_argument('--refresh-interval', type=int, default=30)
+    parser.add_argument('--width', type=int, default=320)
+    parser.add_argument('--height', type=int, default=180)
+    args = parser.parse_args()
+
+    num_classes = 3
+    segmenter = inference.Segmenter(args.model, num_classes=num_classes,
+                                    channel_order='bgr')
+    cascade = CascadeSegmenter(segmenter, min_confidence=args.min_confidence,
+                               refresh_interval=args.refresh_interval)
+
+    cascade_time = 0.0
+    pixel_accuracy = []
+    miou = []
+
+    cap = cv2.VideoCapture(args.video)
+    while cap.isOpened():
+        ret, frame = cap.read()
+        if not ret:
+            break
+        frame = cv2.resize(frame, (args.width, args.height))
+
+        start_time = time.time()
+        prediction, _ = cascade(frame)
+        cascade_time += time.time() - start_time
+
+        # Agreement with FCN16VGG run on every frame.
+        full_prediction = segmenter.predict([frame])[0]
+        pixel_accuracy.append(accuracy.compare(prediction, full_prediction))
+        miou.append(accuracy.mean_iou(prediction, full_prediction, num_classes))
+    cap.release()
+    segmenter.close()
+
+    print('Frames: %d' % cascade.frames)
+    print('FCN16VGG frames: %d' % cascade.cnn_frames)
+    print('Skipped FCN16VGG: %.1f%%' % (100.0 * cascade.skipped_fraction))
+    print('Cascade time per frame: %.1f ms' % (1000.0 * cascade_time / max(1, cascade.frames)))
+    print('Pixel agreement with full FCN16VGG: %.1f%%' % np.mean(pixel_accuracy))
+    print('mIoU agreement with full FCN16VGG: %.1f%%' % np.mean(miou))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,207 @@
+"""Stream video files through the classical path detector.
+
+Run from the calculations folder:
+
+    $ python -m cv.batch_process ../resources --skip 2 --resize 0.5 \
+        --workers 4 --write overlay --output-dir out
+"""
+
+import argparse
+import csv
+import multiprocessing
+import os
+import time
+
+import cv2
+import numpy as np
+
+from cv.path_detector import CVPathDetector
+
+VIDEO_EXTENSIONS = ['avi', 'mp4', 'mov', 'mkv']
+
+# Colour of non-path pixels in overlay (BGR).
+OVERLAY_COLOR = [65, 94, 254]
+
+
+def find_videos(paths):
+    """Expand directories into video files.
+
+    Args:
+        paths: list, string.
+            Video files or directories.
+
+    Returns:
+        videos: list of tuples, string - [(path, name)].
+            Output name is the path relative to the given directory without
+            extension, so same-named videos of subdirectories do not clash.
+    """
+    videos = []
+    for path in paths:
+        if os.path.isdir(path):
+            for root, _, files in os.walk(path):
+                for file in sorted(files):
+                    extension = os.path.splitext(file)[1][1:].lower()
+                    if extension in VIDEO_EXTENSIONS:
+                        video = os.path.join(root, file)
+                        name = os.path.splitext(os.path.relpath(video, path))[0]
+                        videos.append((video, name))
+        elif os.path.isfile(path):
+            videos.append((path, os.path.splitext(os.path.basename(path))[0]))
+        else:
+            print("Video '" + path + "' not found.")
+
+    return videos
+
+
+def overlay(frame, mask, percentage=0.5):
+    """Colour non-path pixels of the frame.
+
+    Args:
+        frame: numpy array, uint8 - [height, width, 3].
+        mask: numpy array, uint8 - [height, width].
+        percentage: float32.
+            Weight of the frame in coloured pixels.
+
+    Returns:
+        frame: numpy array, uint8 - [height, width, 3].
+    """
+    frame = frame.copy()
+    edge = mask > 0
+    frame[edge] = (frame[edge] * percentage +
+                   np.array(OVERLAY_COLOR) * (1 - percentage)).astype(np.uint8)
+    return frame
+
+
+def process_video(path, output_dir=None, write='none', skip=1, resize=None, name=None):
+    """Run the detector over every skip-th frame of a video.
+
+    Args:
+        path: string.
+            Video file path.
+        output_dir: string.
+            Directory of written videos.
+        write: string.
+            'mask', 'overlay' or 'none'.
+        skip: int32.
+            Every skip-th frame is processed, other frames are not decoded.
+        resize: float32.
+            Frame scale factor, frames are not resized if None.
+        name: string.
+            Output name relative to output_dir, the file name by default.
+
+    Returns:
+        report: dictionary - {'file', 'frames', 'processed', 'seconds', 'fps'}.
+    """
+    cap = cv2.VideoCapture(path)
+    video_fps = cap.get(cv2.CAP_PROP_FPS) or 25.0
+
+    detector = CVPathDetector(blur_ksize=5)
+    writer = None
+
+    frames = 0
+    processed = 0
+    start_time = time.time()
+
+    while cap.isOpened():
+        # Skipped frames are only grabbed, not decoded.
+        if frames % skip != 0:
+            if not cap.grab():
+                break
+            frames += 1
+            continue
+
+        ret, frame = cap.read()
+        if not ret:
+            break
+        frames += 1
+
+        if resize:
+            frame = cv2.resize(frame, (0, 0), fx=resize, fy=resize)
+
+        mask = detector(frame)
+        processed += 1
+
+        if write == 'none':
+            continue
+
+        if writer is None:
+            name = name or os.path.splitext(os.path.basename(path))[0]
+            output_path = os.path.join(output_dir, name + '-' + write + '.avi')
+            # Workers may create the same subdirectory at once.
+            os.makedirs(os.path.dirname(output_path), exist_ok=True)
+            height, width = frame.shape[:2]
+            fourcc = cv2.VideoWriter_fourcc(*'XVID')
+            writer = cv2.VideoWriter(output_path, fourcc, video_fps / skip,
+                                     (width, height), write == 'overlay')
+
+        writer.write(overlay(frame, mask) if write == 'overlay' else mask)
+
+    seconds = time.time() - start_time
+
+    cap.release()
+    if writer is not None:
+        writer.release()
+
+    return {
+        'file': path,
+        'frames': frames,
+        'processed': processed,
+        'seconds': round(seconds, 3),
+        'fps': round(processed / seconds, 1) if seconds > 0 else 0.0
+    }
+
+
+def _process_video(args):
+    return process_video(*args)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('paths', nargs='+', help='Video files or directories.')
+    parser.add_argument('--output-dir', default='cv_output')
+    parser.add_argument('--write', choices=['none', 'mask', 'overlay'], default='none')
+    parser.add_argument('--skip', type=int, default=1,
+                        help='Process every n-th frame.')
+    parser.add_argument('--resize', type=float, default=None,
+                        help='Frame scale factor.')
+    parser.add_argument('--workers', type=int, default=multiprocessing.cpu_count(),
+                        help='The number of files processed in parallel.')
+    parser.add_argument('--report', default=None,
+                        help='CSV report path (default: <output-dir>/report.csv).')
+    args = parser.parse_args()
+
+    videos = find_videos(args.paths)
+    print('Found ' + str(len(videos)) + ' videos.')
+
+    if not os.path.exists(args.output_dir):
+        os.makedirs(args.output_dir)
+
+    tasks = [(video, args.output_dir, args.write, max(1, args.skip), args.resize, name)
+             for video, name in videos]
+
+    # Every worker runs single threaded OpenCV, parallelism is over files.
+    pool = multiprocessing.Pool(max(1, args.workers), initializer=cv2.setNumThreads,
+                                initargs=(1,))
+    reports = []
+    try:
+        for report in pool.imap_unordered(_process_video, tasks):
+            print('%s: %d frames, %d processed, %.1f FPS' % (
+                report['file'], report['frames'], report['processed'], report['fps']))
+            reports.append(report)
+    finally:
+        pool.close()
+        pool.join()
+
+    report_path = args.report or os.path.join(args.output_dir, 'report.csv')
+    with open(report_path, 'w') as report_file:
+        writer = csv.DictWriter(report_file,
+                                fieldnames=['file', 'frames', 'processed', 'seconds', 'fps'])
+        writer.writeheader()
+        writer.writerows(sorted(reports, key=lambda report: report['file']))
+
+    print('Report saved in file: ' + report_path)
+
+
+if __name__ == '__main__':
+    main()
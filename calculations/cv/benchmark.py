@@ -0,0 +1,103 @@
+"""Benchmark every stage of the classical path finding pipeline.
+
+Run from the calculations folder:
+
+    $ python -m cv.benchmark --resource ../resources/forest/video1.avi --frames 100
+"""
+
+import argparse
+import time
+
+import cv2
+import numpy as np
+
+from cv.cv_path_find import BlurStep, ClaheStep, DistanceStep, Pipeline, QuantizeStep, ThresholdStep
+from cv.cv_path_find import color_quantization
+from cv.quantization import ColorQuantizer
+
+
+def read_frames(path, num_frames, scale):
+    """Read first frames of a video, random frames if path is None.
+
+    Args:
+        path: string.
+            Video file path.
+        num_frames: int32.
+        scale: float32.
+            Frame scale factor.
+
+    Returns:
+        frames: list of numpy arrays, uint8 - [height, width, 3].
+    """
+    if path is None:
+        height, width = int(360 * scale), int(640 * scale)
+        return [np.random.randint(0, 256, (height, width, 3)).astype(np.uint8)
+                for _ in range(num_frames)]
+
+    frames = []
+    cap = cv2.VideoCapture(path)
+    while cap.isOpened() and len(frames) < num_frames:
+        ret, frame = cap.read()
+        if not ret:
+            break
+        frames.append(cv2.resize(frame, (0, 0), fx=scale, fy=scale))
+    cap.release()
+
+    return frames
+
+
+def compare_quantization(frames, k):
+    """Compare per frame k-means with cached centres quantizer.
+
+    Args:
+        frames: list of numpy arrays, uint8 - [height, width, 3].
+        k: int32.
+            The number of colours.
+
+    Returns:
+        report: list of tuples - [(name, milliseconds per frame)].
+    """
+    report = []
+    for name, quantize in [('color_quantization', lambda frame: color_quantization(frame, k)),
+                           ('ColorQuantizer', ColorQuantizer(k))]:
+        start_time = time.time()
+        for frame in frames:
+            quantize(frame)
+        report.append((name, 1000.0 * (time.time() - start_time) / max(1, len(frames))))
+
+    return report
+
+
+def print_report(report):
+    print('%-16s %10s' % ('Stage', 'ms/frame'))
+    for name, milliseconds in report:
+        print('%-16s %10.2f' % (name, milliseconds))
+    print('%-16s %10.2f' % ('Total', sum(ms for _, ms in report)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--resource', default=None,
+                        help='Video file, random frames are used if not set.')
+    parser.add_argument('--frames', type=int, default=100)
+    parser.add_argument('--scale', type=float, default=0.5)
+    parser.add_argument('--k', type=int, default=8,
+                        help='The number of quantized colours.')
+    args = parser.parse_args()
+
+    frames = read_frames(args.resource, args.frames, args.scale)
+    print('Frames: %d, size: %s' % (len(frames), frames[0].shape[:2] if frames else None))
+
+    pipeline = Pipeline([BlurStep(5), ClaheStep(), QuantizeStep(args.k),
+                         DistanceStep(), ThresholdStep()])
+    print_report(pipeline.profile(frames))
+
+    print('')
+    print('Colour quantization')
+    for name, milliseconds in compare_quantization(frames, args.k):
+        print('%-20s %10.2f' % (name, milliseconds))
+
+
+if __name__ == '__main__':
+    main()
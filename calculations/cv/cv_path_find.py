@@ -1,43 +1,68 @@
+"""Classical (OpenCV) path finding library.
+
+Every stage is available as a plain function and as a pipeline step which
+keeps its output buffers between frames:
+
+    pipeline = Pipeline([BlurStep(5), ClaheStep(), DistanceStep(), ThresholdStep()])
+    mask = pipeline(frame)
+
+Interactive tuning window (run from the calculations folder):
+
+    $ python -m cv.cv_path_find --resource ../resources/forest/video1.avi
+"""
+
+import argparse
+import time
+
 import cv2
 import numpy as np
-from sklearn.metrics.pairwise import euclidean_distances
+
+from cv.path_detector import CVPathDetector, DistanceStep, ThresholdStep, default_bumper
+from cv.quantization import ColorQuantizer
 
 resource = '../resources/forest/video1.avi'
 
 
 def normalize(arr):
-    sum = (arr[:, :, 0] + arr[:, :, 1] + arr[:, :, 2]) / 3 + 1
+    """Divide channels by the pixel brightness (mean of channels + 1).
 
-    norm = np.zeros(arr.shape)
-    for i in range(3):
-        norm[:, :, i] = arr[:, :, i] / sum
+    Args:
+        arr: numpy array - [height, width, 3].
 
-    return norm
+    Returns:
+        norm: numpy array, float32 - [height, width, 3].
+    """
+    arr = np.asarray(arr, np.float32)
+    brightness = arr.sum(axis=2, keepdims=True)
+    brightness *= 1.0 / 3
+    brightness += 1
+    return arr / brightness
 
 
-# cv2.mean(normalized)
 def find_mean_channel(norm):
-    channels_num = 1
-    if len(norm.shape) == 3:
-        channels_num = norm.shape[2]
+    """Mean of all values, repeated for every channel.
 
-    mean_channel = np.zeros(channels_num)
-    for i in range(channels_num):
-        mean_channel[i] = np.median(np.mean(norm))
+    Args:
+        norm: numpy array - [height, width] or [height, width, channels].
 
-    return mean_channel
+    Returns:
+        mean_channel: numpy array - [channels].
+    """
+    channels_num = norm.shape[2] if len(norm.shape) == 3 else 1
+    return np.full(channels_num, np.mean(norm))
 
 
 def find_std_channel(norm):
-    channels_num = 1
-    if len(norm.shape) == 3:
-        channels_num = norm.shape[2]
+    """Standard deviation of all values, repeated for every channel.
 
-    std_channel = np.zeros(channels_num)
-    for i in range(channels_num):
-        std_channel[i] = np.mean(np.std(norm))
+    Args:
+        norm: numpy array - [height, width] or [height, width, channels].
 
-    return std_channel
+    Returns:
+        std_channel: numpy array - [channels].
+    """
+    channels_num = norm.shape[2] if len(norm.shape) == 3 else 1
+    return np.full(channels_num, np.std(norm))
 
 
 def color_quantization(image, k=8):
@@ -71,245 +96,282 @@ def canny_threshold(image, low_threshold=100, ratio=3, kernel_size=3):
     return image
 
 
-def find_edge(road, bumper, mean_channel, a=0.5):
-    b = 1 - a
+def _distances(values, mean_channel):
+    """Euclidean distances of values to mean channel.
 
-    normalized = normalize(road)
-    height, width, channels_num = road.shape
+    Args:
+        values: numpy array - [..., channels].
+        mean_channel: numpy array - [channels].
 
-    bw = np.zeros([height * width, channels_num])
-    for_bumper = np.zeros([height * width, 1], np.uint8)
+    Returns:
+        distances: numpy array, float32 - values shape without channels.
+    """
+    difference = values - np.asarray(mean_channel, np.float32).reshape(-1)
+    np.square(difference, out=difference)
+    return np.sqrt(difference.sum(axis=-1))
 
-    for i in range(channels_num):
-        bw[:, i] = normalized[:, :, i].flatten()
 
-    rbw = euclidean_distances(bw, mean_channel)
-    rbw = np.reshape(rbw, (height, width))
+def _threshold(distances, std_factor=0.1):
+    return distances > distances.mean() + distances.std() * std_factor
 
-    ind = np.nonzero(rbw.flatten() > np.mean(rbw.flatten()) + np.std(rbw.flatten()) * 0.1)
+
+def find_edge(road, bumper, mean_channel, a=0.5):
+    """Find non-path pixels of a frame and adapt the road colour.
+
+    Args:
+        road: numpy array - [height, width, 3].
+        bumper: dictionary - {'x1', 'x2', 'y1', 'y2'}.
+            Road region of the frame.
+        mean_channel: numpy array - [3].
+            Road colour (normalized).
+        a: float32.
+            Weight of the previous road colour.
+
+    Returns:
+        for_bumper: numpy array, uint8 - [height, width].
+            255 for non-path pixels.
+        mean_channel: numpy array - [3].
+            Adapted road colour.
+    """
+    normalized = normalize(road)
+    is_edge = _threshold(_distances(normalized, mean_channel))
 
     # For updating road pixels
-    for_bumper[ind] = 255
-    for_bumper = np.reshape(for_bumper, (height, width))
-    bumper1_mask = for_bumper[bumper['y1']:bumper['y2'], bumper['x1']: bumper['x2']]
-    bumper_ind = np.nonzero(bumper1_mask)
-    bumper1_area = normalized[bumper['y1']:bumper['y2'], bumper['x1']: bumper['x2']]
+    bumper_slice = (slice(bumper['y1'], bumper['y2']),
+                    slice(bumper['x1'], bumper['x2']))
+    colormap = normalized[bumper_slice][~is_edge[bumper_slice]]
 
-    for i in range(channels_num):
-        colormap = bumper1_area[:, :, i]
-        colormap = colormap[:]
-        colormap = np.delete(colormap, bumper_ind)
-        mean_channel[i] = mean_channel[i] * a + np.median(colormap) * b
+    mean_channel = np.array(mean_channel, np.float32).reshape(-1)
+    if colormap.shape[0] > 0:
+        mean_channel = mean_channel * a + np.median(colormap, axis=0) * (1 - a)
 
-    return for_bumper, mean_channel
+    return is_edge.astype(np.uint8) * 255, mean_channel
 
 
 def find_edge_greyscale(road, bumper, mean_channel, a=0.5):
-    b = 1 - a
-    height, width = road.shape
-
-    bw = np.zeros([height * width, 1])
-    for_bumper = np.zeros([height * width, 1], np.uint8)
-
+    """Find non-path pixels of a greyscale frame.
+
+    Args:
+        road: numpy array, uint8 - [height, width].
+        bumper: dictionary - {'x1', 'x2', 'y1', 'y2'}.
+        mean_channel: numpy array - [1].
+            Road brightness.
+        a: float32.
+            Not used, road brightness is not adapted.
+
+    Returns:
+        for_bumper: numpy array, uint8 - [height, width].
+            255 for non-path pixels.
+        mean_channel: numpy array - [1].
+    """
     clahe = cv2.createCLAHE(clipLimit=2.0, tileGridSize=(8, 8))
-    normalized = clahe.apply(road)
+    normalized = clahe.apply(road).astype(np.float32)
 
-    normalized = np.array(normalized.flatten())
-    normalized = np.reshape(normalized, bw.shape)
+    is_edge = _threshold(_distances(normalized[:, :, np.newaxis], mean_channel))
 
-    bw = normalized
+    return is_edge.astype(np.uint8) * 255, mean_channel
 
-    rbw = euclidean_distances(bw, mean_channel)
-    rbw = np.reshape(rbw, (height, width))
 
-    ind = np.nonzero(rbw.flatten() > np.mean(rbw.flatten()) + np.std(rbw.flatten()) * 0.1)
+class BlurStep:
+    """Median, gaussian or box blur.
 
-    # For updating road pixels
-    for_bumper[ind] = 255
-    for_bumper = np.reshape(for_bumper, (height, width))
+    Args:
+        ksize: int32.
+            Kernel size.
+        kind: string.
+            'median', 'gaussian' or 'box'.
+    """
 
-    bumper1_area = road[bumper['y1']:bumper['y2'], bumper['x1']: bumper['x2']]
-    # mean_channel = mean_channel * a + np.median(bumper1_area) * b
+    def __init__(self, ksize=5, kind='median'):
+        self.ksize = ksize
+        self.kind = kind
+        self._out = None
+
+    def __call__(self, image):
+        if self._out is None or self._out.shape != image.shape:
+            self._out = np.empty_like(image)
 
-    return for_bumper, mean_channel
+        if self.kind == 'median':
+            return cv2.medianBlur(image, self.ksize, dst=self._out)
+        elif self.kind == 'gaussian':
+            return cv2.GaussianBlur(image, (self.ksize, self.ksize), 0, dst=self._out)
+        return cv2.blur(image, (self.ksize, self.ksize), dst=self._out)
 
 
-def nothing(x):
-    pass
+class ClaheStep:
+    """Contrast limited adaptive histogram equalization.
 
+    Colour images are equalized by the lightness channel of LAB.
 
-def main():
-    cap = cv2.VideoCapture(resource)
+    Args:
+        clip_limit: float32.
+        tile_grid_size: tuple, int32.
+    """
 
-    cv2.namedWindow('Colors Correction')
-    cv2.createTrackbar('Alpha:', 'Colors Correction', 15, 100, nothing)
-    cv2.createTrackbar('Beta:', 'Colors Correction', 5, 100, nothing)
-    cv2.namedWindow('With Applied Algorithms')
-    cv2.createTrackbar('a:', 'With Applied Algorithms', 5, 10, nothing)
+    def __init__(self, clip_limit=2.0, tile_grid_size=(8, 8)):
+        self.clahe = cv2.createCLAHE(clipLimit=clip_limit, tileGridSize=tile_grid_size)
+        self._lab = None
+        self._out = None
 
-    width = int(cap.get(3) / 2)
-    height = int(cap.get(4) / 2)
+    def __call__(self, image):
+        if image.ndim == 2:
+            if self._out is None or self._out.shape != image.shape:
+                self._out = np.empty_like(image)
+            return self.clahe.apply(image, dst=self._out)
 
-    horizontal_mid_point = round(width / 2)
-    vertical_mid_point = round(height / 2)
+        if self._lab is None or self._lab.shape != image.shape:
+            self._lab = np.empty_like(image)
+            self._lightness = np.empty(image.shape[:2], image.dtype)
+            self._equalized = np.empty(image.shape[:2], image.dtype)
+            self._out = np.empty_like(image)
 
-    horizontal_offset_low = round(horizontal_mid_point / 1.5)
-    horizontal_offset_mid = round(horizontal_offset_low / 1.5)
-    horizontal_offset_high = round(horizontal_offset_mid / 2)
+        cv2.cvtColor(image, cv2.COLOR_BGR2LAB, dst=self._lab)
+        cv2.extractChannel(self._lab, 0, dst=self._lightness)
+        self.clahe.apply(self._lightness, dst=self._equalized)
+        cv2.insertChannel(self._equalized, self._lab, 0)
+        return cv2.cvtColor(self._lab, cv2.COLOR_LAB2BGR, dst=self._out)
 
-    vertical_offset_low = height
-    vertical_offset_mid = vertical_offset_low - round(vertical_mid_point / 4)
-    vertical_offset_high = vertical_offset_mid - round(vertical_mid_point / 4)
 
-    bumper = {
-        'y1': int(vertical_offset_mid),
-        'y2': int(vertical_offset_mid + round(vertical_mid_point / 4)),
-        'x1': int(horizontal_mid_point - horizontal_offset_mid),
-        'x2': int(horizontal_mid_point - horizontal_offset_mid + horizontal_offset_mid * 2)
-    }
+class QuantizeStep:
+    """Colour quantization by k-means.
 
-    current_frame_num = 0
+    Args:
+        k: int32.
+            The number of colours.
+        cached: bool.
+            Whether to reuse cluster centres across frames (ColorQuantizer)
+            instead of running k-means on every frame.
+    """
 
-    # Capture first frame100
-    cap.set(1, 300)  # Where frame_no is the frame you want
-    ret, previous_frame = cap.read()
-    cv2.imwrite('image.jpg', previous_frame)
+    def __init__(self, k=8, cached=True):
+        self.k = k
+        self.quantizer = ColorQuantizer(k) if cached else None
 
-    # Resize first frame
-    previous_frame = cv2.resize(previous_frame, (0, 0), fx=0.5, fy=0.5)
+    def __call__(self, image):
+        if self.quantizer is not None:
+            return self.quantizer(image)
+        return color_quantization(image, self.k)
 
-    # For frames mean
-    frames = [previous_frame]
 
-    normalized = normalize(previous_frame)
+class Pipeline:
+    """Sequence of steps where every step gets the output of the previous.
 
-    mean_channel = find_mean_channel(normalized)
-    # std_channel = find_std_channel(normalized)
+    Distance step gets the bumper region of the frame and threshold step
+    feeds the path pixels back to the distance step, as in CVPathDetector.
 
-    # mean_channel = np.mean(frames)
+    Args:
+        steps: list of callables.
+        bumper: dictionary - {'x1', 'x2', 'y1', 'y2'}.
+            Road region, by default it is computed from the frame size.
+    """
 
-    while True:
-        frame = previous_frame
-        frame = cv2.medianBlur(frame, 5)
+    def __init__(self, steps, bumper=None):
+        self.steps = steps
+        self.bumper = bumper
+        # Accumulated seconds and calls of every step.
+        self.timings = [0.0] * len(steps)
+        self.calls = 0
 
-        colors_correction = frame
+    def __call__(self, frame, profile=False):
+        bumper = self.bumper or default_bumper(*frame.shape[:2])
+        bumper_slice = (slice(bumper['y1'], bumper['y2']),
+                        slice(bumper['x1'], bumper['x2']))
 
-        alpha_value = cv2.getTrackbarPos('Alpha:', 'Colors Correction')
-        beta_value = cv2.getTrackbarPos('Beta:', 'Colors Correction')
-        colors_correction = colors_correction * (alpha_value / 10) + beta_value
-        colors_correction = np.array(colors_correction)
+        distance_step = None
+        output = frame
+        for i, step in enumerate(self.steps):
+            start_time = time.time() if profile else None
 
-        a_value = cv2.getTrackbarPos('a:', 'With Applied Algorithms') / 10
-        processed, mean_channel = find_edge(colors_correction, bumper, mean_channel, a_value)
+            if isinstance(step, DistanceStep):
+                distance_step = step
+                output = step(output, bumper_slice)
+            else:
+                output = step(output)
 
-        colors_correction = np.uint8(colors_correction)
+            if isinstance(step, ThresholdStep) and distance_step is not None:
+                distance_step.update(bumper_slice, ~step.is_edge[bumper_slice])
 
-        cv2.imshow('Default View', frame)
-        cv2.imshow('Colors Correction', colors_correction)
-        cv2.imshow('With Applied Algorithms', processed)
+            if profile:
+                self.timings[i] += time.time() - start_time
 
-        k = cv2.waitKey(1) & 0xFF
-        if k == 27:
-            break
+        if profile:
+            self.calls += 1
 
-    cv2.destroyAllWindows()
+        return output
 
-    '''while cap.isOpened():
-        print('Current frame: ', current_frame_num)
-        frames.append(previous_frame)
-        # Capture current frame
-        ret, current_frame = cap.read()
+    def profile(self, frames):
+        """Run the pipeline over frames and measure every step.
 
-        # Resize current frame
-        current_frame = cv2.resize(current_frame, (0, 0), fx=0.5, fy=0.5)
+        Args:
+            frames: iterable of numpy arrays.
 
-        # Add current frame and make data array
-        frames.append(current_frame)
-        data = np.array(frames)
+        Returns:
+            report: list of tuples - [(step name, milliseconds per frame)].
+        """
+        self.timings = [0.0] * len(self.steps)
+        self.calls = 0
 
-        std_image = np.std(data, axis=0).astype(np.uint8)
-        mean_image = np.mean(data, axis=0).astype(np.uint8)
+        for frame in frames:
+            self(frame, profile=True)
 
-        print(mean_image.shape, std_image.shape)
+        calls = max(1, self.calls)
+        return [(type(step).__name__, 1000.0 * timing / calls)
+                for step, timing in zip(self.steps, self.timings)]
 
-        frame = mean_image
 
-        colors_correction = mean_image
-
-        # frame = cv2.medianBlur(frame, 5)
-        # frame = cv2.GaussianBlur(frame, (5, 5), 0)
-
-        ''''''processed = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-        processed = cv2.equalizeHist(processed)
-        processed = cv2.cvtColor(processed, cv2.COLOR_GRAY2BGR)
-
-        hsv = cv2.cvtColor(frame, cv2.COLOR_BGR2HSV)  # convert it to hsv
-        hsv[:, :, 2] += 125
-        processed = cv2.cvtColor(hsv, cv2.COLOR_HSV2BGR)''''''
-
-        alpha_value = cv2.getTrackbarPos('Alpha:', 'Colors Correction')
-        beta_value = cv2.getTrackbarPos('Beta:', 'Colors Correction')
-        colors_correction = colors_correction * (alpha_value / 10) + beta_value
-
-        # colors_correction = np.uint8(colors_correction)
-
-        # colors_correction = color_quantization(colors_correction, 5)
-
-        # canny_threshold_value = cv2.getTrackbarPos('Min Threshold:', 'With Applied Algorithms')
-        # processed = canny_threshold(frame, canny_threshold_value)
-
-        # processed, mean_channel = find_edge(frame, bumper, mean_channel)
-        # processed = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-        # processed = cv2.equalizeHist(processed)
+def nothing(x):
+    pass
 
-        # processed = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
 
-        # hsv = cv2.cvtColor(frame, cv2.COLOR_BGR2HSV)  # convert it to hsv
-        # hsv[:, :, 2] += 1
-        # processed = cv2.cvtColor(hsv, cv2.COLOR_HSV2BGR)
+def main():
+    parser = argparse.ArgumentParser(description='Interactive tuning of the classical path finding.')
+    parser.add_argument('--resource', default=resource, help='Video file.')
+    parser.add_argument('--start-frame', type=int, default=300,
+                        help='Captured frame number.')
+    parser.add_argument('--scale', type=float, default=0.5,
+                        help='Frame scale factor.')
+    args = parser.parse_args()
 
-        # processed = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+    cap = cv2.VideoCapture(args.resource)
 
-        # clahe = cv2.createCLAHE(clipLimit=2.0, tileGridSize=(8, 8))
-        # processed = clahe.apply(processed)
+    cv2.namedWindow('Colors Correction')
+    cv2.createTrackbar('Alpha:', 'Colors Correction', 15, 100, nothing)
+    cv2.createTrackbar('Beta:', 'Colors Correction', 5, 100, nothing)
+    cv2.namedWindow('With Applied Algorithms')
+    cv2.createTrackbar('a:', 'With Applied Algorithms', 5, 10, nothing)
 
-        processed, mean_channel = find_edge(colors_correction, bumper, mean_channel)
+    # Capture first frame
+    cap.set(1, args.start_frame)  # Where frame_no is the frame you want
+    ret, previous_frame = cap.read()
+    cap.release()
 
-        # processed, mean_channel = find_edge_greyscale(processed, bumper, mean_channel)
+    # Resize first frame
+    previous_frame = cv2.resize(previous_frame, (0, 0), fx=args.scale, fy=args.scale)
+    frame = cv2.medianBlur(previous_frame, 5)
 
-        # canny_threshold_value = cv2.getTrackbarPos('Min Threshold:', 'With Applied Algorithms')
-        # processed = canny_threshold(processed, canny_threshold_value)
+    detector = CVPathDetector()
 
-        # processed = cv2.Canny(processed, 10, 200)
+    while True:
+        alpha_value = cv2.getTrackbarPos('Alpha:', 'Colors Correction')
+        beta_value = cv2.getTrackbarPos('Beta:', 'Colors Correction')
+        # Not saturated, the detector sees the same values as before.
+        colors_correction = frame * np.float32(alpha_value / 10.0) + np.float32(beta_value)
 
-        colors_correction = np.uint8(colors_correction)
+        a_value = cv2.getTrackbarPos('a:', 'With Applied Algorithms') / 10.0
+        detector.distance.histogram.decay = a_value
+        detector.threshold.moments.decay = a_value
+        processed = detector(colors_correction)
 
-        # Display the resulting frame
         cv2.imshow('Default View', frame)
-        cv2.imshow('Colors Correction', colors_correction)
+        cv2.imshow('Colors Correction', np.uint8(colors_correction))
         cv2.imshow('With Applied Algorithms', processed)
 
-        # Quit the video
-        if cv2.waitKey(1) & 0xFF == ord('q'):
+        k = cv2.waitKey(1) & 0xFF
+        if k == 27:
             break
 
-        current_frame_num += 1
-
-        previous_frame = current_frame
-        frames = [previous_frame]
-        # cv2.waitKey(0)
-        # break
-
-    # When everything done, release the capture
-    cap.release()
-    cv2.destroyAllWindows()'''
+    cv2.destroyAllWindows()
 
 
 if __name__ == "__main__":
     main()
-
-
-'''
-Weight1 + bias1 + W2 + b2 = Y
-
-'''
\ No newline at end of file
@@ -0,0 +1,382 @@
+import cv2
+import numpy as np
+
+
+def default_bumper(height, width):
+    """Get the road region right in front of the camera.
+
+    The same region which is used by the interactive cv_path_find.main.
+
+    Args:
+        height: int32.
+            The height of the frame.
+        width: int32.
+            The width of the frame.
+
+    Returns:
+        bumper: dictionary - {'x1', 'x2', 'y1', 'y2'}.
+    """
+    horizontal_mid_point = round(width / 2)
+    vertical_mid_point = round(height / 2)
+
+    horizontal_offset_low = round(horizontal_mid_point / 1.5)
+    horizontal_offset_mid = round(horizontal_offset_low / 1.5)
+
+    vertical_offset_mid = height - round(vertical_mid_point / 4)
+
+    return {
+        'y1': int(vertical_offset_mid),
+        'y2': int(vertical_offset_mid + round(vertical_mid_point / 4)),
+        'x1': int(horizontal_mid_point - horizontal_offset_mid),
+        'x2': int(horizontal_mid_point + horizontal_offset_mid)
+    }
+
+
+class RunningHistogram:
+    """Exponentially decayed histograms of channels with median lookup.
+
+    Updating costs only a bincount of the new values and the median is
+    found over the bins, so both do not depend on the history length.
+
+    Args:
+        channels: int32.
+            The number of channels.
+        bins: int32.
+            The number of bins per channel.
+        value_range: tuple, float32 - (low, high).
+        decay: float32.
+            Weight of the history, new values are weighted by 1 - decay.
+    """
+
+    def __init__(self, channels=3, bins=64, value_range=(0.0, 3.0), decay=0.5):
+        self.channels = channels
+        self.bins = bins
+        self.low, self.high = value_range
+        self.decay = decay
+
+        self.scale = bins / (self.high - self.low)
+        self.counts = np.zeros((channels, bins), np.float32)
+        self._offsets = np.arange(channels, dtype=np.intp) * bins
+        self._empty = True
+
+    def update(self, values):
+        """Add values to the histograms.
+
+        Args:
+            values: numpy array - [n, channels].
+        """
+        if values.shape[0] == 0:
+            return
+
+        indices = ((values - self.low) * self.scale).astype(np.intp)
+        np.clip(indices, 0, self.bins - 1, out=indices)
+        indices += self._offsets
+
+        counts = np.bincount(indices.ravel(), minlength=self.channels * self.bins)
+        counts = counts.reshape((self.channels, self.bins)) / float(values.shape[0])
+
+        if self._empty:
+            self.counts[:] = counts
+            self._empty = False
+        else:
+            self.counts *= self.decay
+            self.counts += counts * (1 - self.decay)
+
+    def median(self):
+        """Approximate median of every channel (centre of the median bin).
+
+        Returns:
+            median: numpy array, float32 - [channels].
+        """
+        cumulative = np.cumsum(self.counts, axis=1)
+        half = cumulative[:, -1:] / 2
+        indices = np.argmax(cumulative >= half, axis=1)
+        return (self.low + (indices + 0.5) / self.scale).astype(np.float32)
+
+
+class RunningMoments:
+    """Exponentially weighted mean and variance in Welford (Chan) style.
+
+    Every update merges mean and variance of a new batch into running
+    moments, so no history is stored.
+
+    Args:
+        decay: float32.
+            Weight of the history, new batch is weighted by 1 - decay.
+    """
+
+    def __init__(self, decay=0.5):
+        self.decay = decay
+        self.mean = None
+        self.variance = None
+
+    def update(self, values):
+        """Merge moments of values into running moments.
+
+        Args:
+            values: numpy array.
+        """
+        batch_mean = float(values.mean())
+        batch_variance = float(values.var())
+
+        if self.mean is None:
+            self.mean = batch_mean
+            self.variance = batch_variance
+            return
+
+        mean = self.decay * self.mean + (1 - self.decay) * batch_mean
+        self.variance = (self.decay * (self.variance + (self.mean - mean) ** 2) +
+                         (1 - self.decay) * (batch_variance + (batch_mean - mean) ** 2))
+        self.mean = mean
+
+    @property
+    def std(self):
+        return self.variance ** 0.5
+
+
+class DistanceStep:
+    """Distance of brightness normalized pixels to the road colour.
+
+    Road colour is the median of running histograms of path pixels, which
+    are added by update after the frame is thresholded.
+
+    Args:
+        a: float32.
+            Weight of the previous road colour.
+        bins: int32.
+            The number of histogram bins per channel.
+        sample_step: int32.
+            Every sample_step row and column of the frame seeds the road
+            colour when the bumper region is empty.
+    """
+
+    def __init__(self, a=0.5, bins=64, sample_step=4):
+        self.a = a
+        self.bins = bins
+        self.sample_step = sample_step
+
+        self._shape = None
+        self.reset()
+
+    def reset(self):
+        """Forget the adapted road colour."""
+        self.mean_channel = None
+        self.histogram = RunningHistogram(channels=3, bins=self.bins,
+                                          decay=self.a)
+
+    def __call__(self, frame, bumper_slice=None):
+        """Compute distances of a frame.
+
+        Args:
+            frame: numpy array - [height, width, 3].
+            bumper_slice: tuple of slices.
+                Road region used for the initial road colour.
+
+        Returns:
+            distances: numpy array, float32 - [height, width].
+                The array is reused by the next call.
+        """
+        if frame.shape != self._shape:
+            self._allocate(frame.shape)
+
+        normalized = self.normalize(frame)
+
+        if self.mean_channel is None:
+            area = normalized.reshape((-1, 3))
+            if bumper_slice is not None:
+                area = normalized[bumper_slice].reshape((-1, 3))
+            if area.shape[0] == 0:
+                area = normalized[::self.sample_step, ::self.sample_step].reshape((-1, 3))
+            self.histogram.update(area)
+            self.mean_channel = self.histogram.median()
+
+        np.subtract(normalized, self.mean_channel, out=self._difference)
+        np.square(self._difference, out=self._difference)
+        np.sum(self._difference, axis=2, out=self._distances)
+        np.sqrt(self._distances, out=self._distances)
+        return self._distances
+
+    def normalize(self, frame):
+        """Divide channels by the pixel brightness (mean of channels + 1)."""
+        if frame.shape != self._shape:
+            self._allocate(frame.shape)
+
+        np.sum(frame, axis=2, dtype=np.float32, out=self._brightness[:, :, 0])
+        self._brightness *= 1.0 / 3
+        self._brightness += 1
+        np.divide(frame, self._brightness, out=self._normalized)
+        return self._normalized
+
+    def update(self, bumper_slice, is_path):
+        """Add path pixels of the last frame to the road colour histograms.
+
+        Args:
+            bumper_slice: tuple of slices.
+                Road region of the frame.
+            is_path: numpy array, bool - bumper region shape.
+        """
+        road = self._normalized[bumper_slice][is_path]
+
+        if road.shape[0] == 0:
+            return
+
+        self.histogram.update(road)
+        self.mean_channel = self.histogram.median()
+
+    def _allocate(self, shape):
+        height, width = shape[:2]
+
+        self._shape = shape
+        self._brightness = np.empty((height, width, 1), np.float32)
+        self._normalized = np.empty((height, width, 3), np.float32)
+        self._difference = np.empty((height, width, 3), np.float32)
+        self._distances = np.empty((height, width), np.float32)
+
+
+class ThresholdStep:
+    """Mark pixels which are far from the road colour.
+
+    Threshold is mean + std_factor * std of running moments of subsampled
+    distances.
+
+    Args:
+        a: float32.
+            Weight of the previous moments.
+        std_factor: float32.
+        sample_step: int32.
+            Every sample_step row and column is used for the moments.
+    """
+
+    def __init__(self, a=0.5, std_factor=0.1, sample_step=4):
+        self.a = a
+        self.std_factor = std_factor
+        self.sample_step = sample_step
+
+        self.is_edge = None
+        self._mask = None
+        self.reset()
+
+    def reset(self):
+        """Forget the running moments."""
+        self.moments = RunningMoments(decay=self.a)
+
+    def __call__(self, distances):
+        """Threshold distances.
+
+        Args:
+            distances: numpy array, float32 - [height, width].
+
+        Returns:
+            mask: numpy array, uint8 - [height, width].
+                255 for non-path pixels, 0 for path pixels. The array is
+                reused by the next call.
+        """
+        if self._mask is None or self._mask.shape != distances.shape:
+            self.is_edge = np.empty(distances.shape, np.bool_)
+            self._mask = np.empty(distances.shape, np.uint8)
+
+        self.moments.update(distances[::self.sample_step, ::self.sample_step])
+        threshold = self.moments.mean + self.moments.std * self.std_factor
+
+        np.greater(distances, threshold, out=self.is_edge)
+        np.multiply(self.is_edge, 255, out=self._mask, casting='unsafe')
+        return self._mask
+
+
+class CVPathDetector:
+    """Headless classical path detector.
+
+    Pixels are normalized by their brightness and compared with the road
+    colour which is adapted from the bumper region on every frame
+    (DistanceStep followed by ThresholdStep). All intermediate arrays are
+    float32 and preallocated once per frame size.
+
+    Road colour is the median of running histograms of path pixels in the
+    bumper and the threshold comes from running moments of subsampled
+    distances, so the colour model costs the same on every frame.
+
+    Args:
+        bumper: dictionary - {'x1', 'x2', 'y1', 'y2'}.
+            Road region, by default it is computed from the frame size.
+        a: float32.
+            Weight of the previous road colour.
+        std_factor: float32.
+            Threshold is mean + std_factor * std of the distances.
+        blur_ksize: int32.
+            Median blur kernel size, no blur if None.
+        bins: int32.
+            The number of histogram bins per channel.
+        sample_step: int32.
+            Every sample_step row and column is used for the threshold.
+    """
+
+    def __init__(self, bumper=None, a=0.5, std_factor=0.1, blur_ksize=None,
+                 bins=64, sample_step=4):
+        self.bumper = bumper
+        self._default_bumper = bumper is None
+        self.blur_ksize = blur_ksize
+
+        self.distance = DistanceStep(a=a, bins=bins, sample_step=sample_step)
+        self.threshold = ThresholdStep(a=a, std_factor=std_factor,
+                                       sample_step=sample_step)
+        self._shape = None
+
+    @property
+    def mean_channel(self):
+        return self.distance.mean_channel
+
+    def reset(self):
+        """Forget the adapted road colour."""
+        self.distance.reset()
+        self.threshold.reset()
+
+    def __call__(self, frame):
+        """Detect the path in a frame.
+
+        Args:
+            frame: numpy array, uint8 - [height, width, 3].
+
+        Returns:
+            mask: numpy array, uint8 - [height, width].
+                255 for non-path pixels, 0 for path pixels. The array is
+                reused by the next call.
+        """
+        if self.blur_ksize:
+            frame = cv2.medianBlur(frame, self.blur_ksize)
+
+        if frame.shape != self._shape:
+            self._shape = frame.shape
+            if self._default_bumper:
+                self.bumper = default_bumper(*frame.shape[:2])
+
+        bumper_slice = (slice(self.bumper['y1'], self.bumper['y2']),
+                        slice(self.bumper['x1'], self.bumper['x2']))
+
+        distances = self.distance(frame, bumper_slice)
+        mask = self.threshold(distances)
+
+        self.distance.update(bumper_slice, ~self.threshold.is_edge[bumper_slice])
+
+        return mask
+
+    def detect_video(self, capture, resize=None):
+        """Detect the path in every frame of a video.
+
+        Args:
+            capture: cv2.VideoCapture.
+            resize: float32.
+                Frame scale factor, frames are not resized if None.
+
+        Yields:
+            frame: numpy array, uint8 - [height, width, 3].
+            mask: numpy array, uint8 - [height, width].
+        """
+        while capture.isOpened():
+            ret, frame = capture.read()
+            if not ret:
+                break
+
+            if resize:
+                frame = cv2.resize(frame, (0, 0), fx=resize, fy=resize)
+
+            yield frame, self(frame)
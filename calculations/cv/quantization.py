@@ -0,0 +1,127 @@
+import cv2
+import numpy as np
+
+
+class ColorQuantizer:
+    """Colour quantization with cluster centres cached across frames.
+
+    Centres are fitted by k-means on a pixel subsample, afterwards only a
+    few Lloyd iterations warm-started from the previous centres are run
+    every refit_interval frames. Pixels are mapped to the nearest centre
+    by a lookup table over the downsampled colour cube, so applying the
+    quantizer costs one table lookup per pixel.
+
+    Args:
+        k: int32.
+            The number of colours.
+        levels: int32.
+            Lookup table levels per channel, power of two up to 256.
+        sample_size: int32.
+            The number of pixels used for fitting.
+        iterations: int32.
+            Lloyd iterations of a warm-started refit.
+        refit_interval: int32.
+            Centres are refitted every refit_interval frames, never if 0.
+    """
+
+    def __init__(self, k=8, levels=32, sample_size=4096, iterations=3,
+                 refit_interval=30):
+        assert levels & (levels - 1) == 0 and levels <= 256
+
+        self.k = k
+        self.levels = levels
+        self.sample_size = sample_size
+        self.iterations = iterations
+        self.refit_interval = refit_interval
+
+        self.shift = 8 - int(np.log2(levels))
+        self.centers = None
+        self.frames = 0
+
+        self._indices = None
+        self._out = None
+
+    def reset(self):
+        """Forget the fitted centres."""
+        self.centers = None
+        self.frames = 0
+
+    def fit(self, image):
+        """Fit centres on a subsample of image pixels.
+
+        Args:
+            image: numpy array, uint8 - [height, width, 3].
+        """
+        pixels = image.reshape((-1, 3))
+        if pixels.shape[0] > self.sample_size:
+            sample = np.random.randint(0, pixels.shape[0], self.sample_size)
+            pixels = pixels[sample]
+        pixels = pixels.astype(np.float32)
+
+        if self.centers is None:
+            criteria = (cv2.TERM_CRITERIA_EPS + cv2.TERM_CRITERIA_MAX_ITER, 10, 1.0)
+            _, _, centers = cv2.kmeans(pixels, self.k, None, criteria, 1,
+                                       cv2.KMEANS_PP_CENTERS)
+        else:
+            centers = self.centers.copy()
+            for _ in range(self.iterations):
+                labels = _nearest(pixels, centers)
+                for i in range(self.k):
+                    members = pixels[labels == i]
+                    if members.shape[0] > 0:
+                        centers[i] = members.mean(axis=0)
+
+        self.centers = centers.astype(np.float32)
+        self._build_lut()
+
+    def __call__(self, image):
+        """Quantize image colours.
+
+        Args:
+            image: numpy array, uint8 - [height, width, 3].
+
+        Returns:
+            result: numpy array, uint8 - [height, width, 3].
+                The array is reused by the next call.
+        """
+        if self.centers is None or (self.refit_interval and
+                                    self.frames % self.refit_interval == 0):
+            self.fit(image)
+        self.frames += 1
+
+        if self._out is None or self._out.shape != image.shape:
+            self._indices = np.empty(image.shape[:2], np.intp)
+            self._out = np.empty_like(image)
+
+        # Index of the colour cube cell: ((c0 * levels) + c1) * levels + c2.
+        np.right_shift(image[:, :, 0], self.shift, out=self._indices, casting='unsafe')
+        for channel in (1, 2):
+            self._indices *= self.levels
+            self._indices += image[:, :, channel] >> self.shift
+
+        np.take(self.lut, self._indices, axis=0, out=self._out)
+        return self._out
+
+    def _build_lut(self):
+        """Map centre of every colour cube cell to the nearest centre colour."""
+        cell = (np.arange(self.levels, dtype=np.float32) + 0.5) * (1 << self.shift)
+        grid = np.stack(np.meshgrid(cell, cell, cell, indexing='ij'), axis=-1)
+        labels = _nearest(grid.reshape((-1, 3)), self.centers)
+
+        colors = np.clip(np.round(self.centers), 0, 255).astype(np.uint8)
+        self.lut = colors[labels]
+
+
+def _nearest(pixels, centers):
+    """Index of the nearest centre of every pixel.
+
+    Args:
+        pixels: numpy array, float32 - [n, 3].
+        centers: numpy array, float32 - [k, 3].
+
+    Returns:
+        labels: numpy array, int64 - [n].
+    """
+    # |p - c|^2 = |p|^2 - 2 p.c + |c|^2, where |p|^2 does not change argmin.
+    distances = (centers * centers).sum(axis=1) - 2 * pixels.dot(centers.T)
+    return distances.argmin(axis=1)
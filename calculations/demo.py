@@ -27,7 +27,7 @@ logging.basicConfig(format='%(asctime)s %(levelname)s %(message)s',
                     level=logging.INFO,
                     stream=sys.stdout)
 
-dataset = utils.read_files(RESOURCE)
+dataset = utils.read_files(RESOURCE, sparse=True)
 random.shuffle(dataset)
 input_set, output_set = utils.split_dataset(dataset)
 
@@ -35,8 +35,7 @@ height = input_set.shape[1]
 width = input_set.shape[2]
 num_classes = 3
 
-input_placeholder = tf.placeholder(tf.float32, [None, height, width, num_classes])
-output_placeholder = tf.placeholder(tf.float32, [None, height, width, num_classes])
+input_placeholder = tf.placeholder(tf.uint8, [None, height, width, 3])
 
 vgg_fcn = fcn16_vgg.FCN16VGG('./vgg16.npy')
 
@@ -53,10 +52,7 @@ saver = tf.train.Saver()
 
 # With CPU mini-batch size can be bigger.
 with tf.device('/cpu:0'):
-    config = tf.ConfigProto(allow_soft_placement=True)
-    config.gpu_options.allow_growth = True
-
-    with tf.Session(config=config) as sess:
+    with tf.Session(config=utils.session_config('inference')) as sess:
         # Restore model weights from previously saved model.
         saver.restore(sess, MODEL_PATH)
 
@@ -0,0 +1,204 @@
+#!/usr/bin/env python
+
+"""Distill trained FCN16VGG into a compact StudentFCN.
+
+Teacher (FCN16VGG) upscore32 logits are computed only once and cached to
+disk as a float16 memory-mapped array, so every epoch of the student
+training just reads the soft targets instead of running VGG16 again.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import logging
+import os
+import sys
+
+import numpy as np
+import tensorflow as tf
+
+import fcn16_vgg
+import loss
+import student_fcn
+import utils
+
+RESOURCE = '../dataset'
+TEACHER_MODEL_PATH = './models/model.ckpt'
+STUDENT_MODEL_PATH = './models/student.ckpt'
+INPUT_SET_PATH = 'input_set.npy'
+OUTPUT_SET_PATH = 'output_set.npy'
+TEACHER_LOGITS_PATH = 'teacher_logits.npy'
+
+logging.basicConfig(format='%(asctime)s %(levelname)s %(message)s',
+                    level=logging.INFO,
+                    stream=sys.stdout)
+
+
+def load_dataset():
+    """Load compiled dataset or compile it from RESOURCE.
+
+    Returns:
+        input_set: numpy array.
+        output_set: numpy array.
+    """
+    if os.path.exists(INPUT_SET_PATH) and os.path.exists(OUTPUT_SET_PATH):
+        return np.load(INPUT_SET_PATH), utils.sparse_labels(np.load(OUTPUT_SET_PATH))
+
+    dataset = utils.read_files(RESOURCE, sparse=True)
+    input_set, output_set = utils.split_dataset(dataset)
+
+    np.save(INPUT_SET_PATH, input_set)
+    np.save(OUTPUT_SET_PATH, output_set)
+
+    return input_set, output_set
+
+
+def cache_teacher_logits(input_set, num_classes, cache_path=TEACHER_LOGITS_PATH,
+                         model_path=TEACHER_MODEL_PATH, batch_size=5):
+    """Run the teacher once over input set and cache its logits.
+
+    Logits are stored as float16 .npy file (half of float32 size) which is
+    opened memory-mapped, so only the requested batches are read.
+    The cache is rebuilt if it is older than the compiled input set or the
+    teacher checkpoint. It is written to a temporary file which replaces the
+    cache only when every batch is stored, so an interrupted run never
+    leaves a partial cache behind.
+
+    Args:
+        input_set: numpy array - [size, height, width, 3].
+        num_classes: int32.
+        cache_path: string.
+            Path of the logits cache.
+        model_path: string.
+            Teacher checkpoint path.
+        batch_size: int32.
+            Teacher inference batch size.
+
+    Returns:
+        teacher_logits: memory-mapped numpy array, float16
+            - [size, height, width, num_classes].
+    """
+    size, height, width = input_set.shape[:3]
+    shape = (size, height, width, num_classes)
+
+    if os.path.exists(cache_path):
+        teacher_logits = np.load(cache_path, mmap_mode='r')
+        is_fresh = all(os.path.getmtime(cache_path) >= os.path.getmtime(source)
+                       for source in (INPUT_SET_PATH, model_path + '.index')
+                       if os.path.exists(source))
+        if teacher_logits.shape == shape and is_fresh:
+            print("Teacher logits loaded from '%s'." % cache_path)
+            return teacher_logits
+        del teacher_logits
+
+    print("Caching teacher logits into '%s'." % cache_path)
+    temp_path = cache_path + '.tmp'
+    cache = np.lib.format.open_memmap(temp_path, mode='w+',
+                                      dtype=np.float16, shape=shape)
+
+    with tf.Graph().as_default():
+        input_placeholder = tf.placeholder(tf.uint8, [None, height, width, 3])
+
+        vgg_fcn = fcn16_vgg.FCN16VGG('./vgg16.npy')
+
+        with tf.name_scope('content_vgg'):
+            vgg_fcn.build(input_placeholder, train=False, num_classes=num_classes)
+
+        saver = tf.train.Saver()
+
+        with tf.Session(config=utils.session_config('inference')) as sess:
+            saver.restore(sess, model_path)
+
+            for offset in range(0, size, batch_size):
+                batch_input = input_set[offset:(offset + batch_size)]
+                logits = sess.run(vgg_fcn.upscore32,
+                                  feed_dict={input_placeholder: batch_input})
+                cache[offset:(offset + batch_size)] = logits
+
+    cache.flush()
+    del cache
+    os.replace(temp_path, cache_path)
+
+    return np.load(cache_path, mmap_mode='r')
+
+
+def train_student(input_set, output_set, teacher_logits, num_classes,
+                  epochs=10, batch_size=5, temperature=4.0, alpha=0.5):
+    """Train the student on hard labels and cached teacher logits.
+
+    Args:
+        input_set: numpy array - [size, height, width, 3].
+        output_set: numpy array, uint8 - [size, height, width].
+        teacher_logits: numpy array - [size, height, width, num_classes].
+        num_classes: int32.
+        epochs: int32.
+        batch_size: int32.
+        temperature: float32.
+            Softmax temperature of the soft targets.
+        alpha: float32.
+            Weight of the soft targets.
+    """
+    size, height, width = input_set.shape[:3]
+    num_steps = epochs * size // batch_size
+
+    with tf.Graph().as_default():
+        input_placeholder = tf.placeholder(tf.uint8, [None, height, width, 3])
+        output_placeholder = tf.placeholder(tf.uint8, [None, height, width])
+        teacher_placeholder = tf.placeholder(tf.float32, [None, height, width, num_classes])
+
+        student = student_fcn.StudentFCN()
+
+        with tf.name_scope('content_student'):
+            student.build(input_placeholder, train=True, num_classes=num_classes)
+
+        with tf.name_scope('loss'):
+            distillation_loss = loss.distillation_loss(student.upscore32,
+                                                       teacher_placeholder,
+                                                       output_placeholder,
+                                                       num_classes,
+                                                       temperature=temperature,
+                                                       alpha=alpha,
+                                                       sparse=True,
+                                                       regularization_losses=student.regularization_losses)
+            optimizer = tf.train.AdamOptimizer(0.0001).minimize(distillation_loss)
+
+        print('Finished building Network.')
+
+        saver = tf.train.Saver()
+
+        with tf.Session(config=utils.session_config('training')) as sess:
+            sess.run(tf.global_variables_initializer())
+
+            print('Training the Student')
+            order = np.random.permutation(size)
+            for step in range(num_steps):
+                offset = (step * batch_size) % size
+                if offset < batch_size and step > 0:
+                    order = np.random.permutation(size)
+
+                # Sorted indices keep memory-mapped reads sequential.
+                indices = np.sort(order[offset:(offset + batch_size)])
+
+                _, l = sess.run([optimizer, distillation_loss],
+                                feed_dict={input_placeholder: input_set[indices],
+                                           output_placeholder: output_set[indices],
+                                           teacher_placeholder: teacher_logits[indices]})
+
+                if (step + 1) % 25 == 0:
+                    print("Minibatch loss at step %d: %f" % (step + 1, l))
+
+            save_path = saver.save(sess, STUDENT_MODEL_PATH)
+            print("Model saved in file: %s" % save_path)
+
+
+def main():
+    num_classes = 3
+
+    input_set, output_set = load_dataset()
+    teacher_logits = cache_teacher_logits(input_set, num_classes)
+    train_student(input_set, output_set, teacher_logits, num_classes)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,121 @@
+"""Compact encodings of predicted label maps.
+
+Run-length encoding is lossless. Polygons use the dataset maker JSON
+schema ({"polygons": [{"type", "points": [{"x", "y"}]}]}), so predictions
+can be opened in the dataset maker and decoded by utils.polygons_to_regions:
+
+    data = regions_to_polygons(prediction)
+    regions = polygons_to_regions(data, height, width)
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import cv2
+import numpy as np
+
+import utils
+
+
+def rle_encode(regions):
+    """Run-length encode a label map in row-major order.
+
+    Args:
+        regions: numpy array - [height, width].
+
+    Returns:
+        rle: dictionary - {'height', 'width', 'values', 'lengths'}.
+    """
+    height, width = regions.shape
+    flat = regions.reshape(-1)
+
+    starts = np.concatenate([[0], np.flatnonzero(flat[1:] != flat[:-1]) + 1])
+    lengths = np.diff(np.append(starts, flat.size))
+
+    return {'height': height,
+            'width': width,
+            'values': flat[starts].tolist(),
+            'lengths': lengths.tolist()}
+
+
+def rle_decode(rle):
+    """Decode a run-length encoded label map.
+
+    Args:
+        rle: dictionary - {'height', 'width', 'values', 'lengths'}.
+
+    Returns:
+        regions: numpy array, uint8 - [height, width].
+    """
+    flat = np.repeat(np.asarray(rle['values'], np.uint8), rle['lengths'])
+    return flat.reshape((rle['height'], rle['width']))
+
+
+def regions_to_polygons(regions, classes=utils.CLASSES, epsilon=1.0, min_area=4.0,
+                        rounds=2):
+    """Make simplified polygons of a label map.
+
+    Polygons are filled in order by polygons_to_regions, so polygons of
+    every class (route before obstacles, the background class 0 last) cover
+    only the pixels which are still wrong after filling the previous
+    polygons. Background polygons cut holes, the next round fills islands
+    inside the holes.
+
+    Args:
+        regions: numpy array - [height, width].
+        classes: list, string.
+            Class labels, class 0 is the background.
+        epsilon: float32.
+            Maximal distance of the simplified contour from the original.
+        min_area: float32.
+            Smaller polygons are dropped.
+        rounds: int32.
+
+    Returns:
+        data: dictionary - {'polygons': [{'type': <string>, 'points': [{'x', 'y'}]}]}.
+    """
+    regions = np.asarray(regions, np.uint8)
+    reconstruction = np.zeros_like(regions)
+    order = list(range(1, len(classes))) + [0]
+
+    polygons = []
+    for _ in range(rounds):
+        if np.array_equal(regions, reconstruction):
+            break
+
+        for class_index in order:
+            mask = ((regions == class_index) & (reconstruction != class_index)).astype(np.uint8)
+            contours = cv2.findContours(mask, cv2.RETR_EXTERNAL,
+                                        cv2.CHAIN_APPROX_SIMPLE)[-2]
+
+            contours = [cv2.approxPolyDP(contour, epsilon, True) for contour in contours
+                        if cv2.contourArea(contour) >= min_area]
+            contours = [contour for contour in contours if contour.shape[0] >= 3]
+            if not contours:
+                continue
+
+            cv2.fillPoly(reconstruction, contours, int(class_index))
+            for contour in contours:
+                points = contour.reshape((-1, 2))
+                polygons.append({
+                    'type': classes[class_index],
+                    'points': [{'x': int(x), 'y': int(y)} for x, y in points]
+                })
+
+    return {'polygons': polygons}
+
+
+def polygons_to_regions(data, height, width, classes=utils.CLASSES):
+    """Decode polygons into a label map.
+
+    Args:
+        data: dictionary - {'polygons': [...]}.
+        height: int32.
+        width: int32.
+        classes: list, string.
+
+    Returns:
+        regions: numpy array, uint8 - [height, width].
+    """
+    return utils.polygons_to_regions(data['polygons'], height, width, classes)
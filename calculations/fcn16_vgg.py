@@ -2,6 +2,7 @@ from __future__ import absolute_import
 from __future__ import division
 from __future__ import print_function
 
+import copy
 import os
 import logging
 from math import ceil
@@ -15,9 +16,55 @@ import utils
 # VGG mean for standardisation (BGR).
 VGG_MEAN = [103.939, 116.779, 123.68]
 
+# Upsampling modes of upscore layers.
+UPSAMPLE_MODES = ['deconv', 'bilinear', 'depthwise']
+
+# Cache of bilinear kernels and deconvolutional weights by shape.
+_bilinear_cache = {}
+
+# Channel orders of input images.
+CHANNEL_ORDERS = ['rgb', 'bgr']
+
+# Variable scopes of the layers built by build_head.
+HEAD_LAYERS = ['score_fr', 'upscore2', 'score_pool4', 'upscore32']
+
+
+def preprocess(images, channel_order='rgb'):
+    """Make network input: BGR channels with VGG mean subtracted.
+
+    Args:
+        images: image batch tensor, uint8 or float32 - [batch_size, height, width, 3].
+            Scaled to Interval [0, 255].
+        channel_order: string.
+            'rgb' or 'bgr' (as read by OpenCV).
+
+    Returns:
+        bgr: tensor, float32 - [batch_size, height, width, 3].
+    """
+    assert channel_order in CHANNEL_ORDERS
+
+    if images.dtype != tf.float32:
+        images = tf.cast(images, tf.float32)
+    if channel_order == 'rgb':
+        images = tf.reverse(images, axis=[3])
+
+    return images - VGG_MEAN
+
 
 class FCN16VGG:
-    def __init__(self, vgg16_npy_path=None):
+    def __init__(self, vgg16_npy_path=None, data_dict=None):
+        self.weight_decay = 5e-4
+        self.upsample = 'deconv'
+
+        # Variables are created by this instance (not reused), so its
+        # weight decay terms are kept here instead of a global collection.
+        self.reuse = False
+        self.regularization_losses = []
+
+        if data_dict is not None:
+            self.data_dict = data_dict
+            return
+
         if vgg16_npy_path is None:
             path = sys.modules[self.__class__.__module__].__file__
             path = os.path.abspath(os.path.join(path, os.pardir))
@@ -29,16 +76,46 @@ class FCN16VGG:
             sys.exit(1)
 
         self.data_dict = np.load(vgg16_npy_path, encoding='latin1').item()
-
-        self.weight_decay = 5e-4
         print("npy file loaded")
 
+    def share(self):
+        """Get a model which reuses variables of this model.
+
+        The shared model is built in the same variable scope (e.g. another
+        tower, evaluation graph), does not create new variables and has no
+        regularization losses of its own, so building it does not
+        duplicate weight decay ops.
+
+        Returns:
+            model: FCN16VGG.
+        """
+        model = copy.copy(self)
+        model.reuse = True
+        model.regularization_losses = []
+        return model
+
+    def regularization_loss(self):
+        """Sum of weight decay terms of variables created by this model.
+
+        Returns:
+            tensor, float32.
+        """
+        if not self.regularization_losses:
+            return tf.constant(0.0)
+        return tf.add_n(self.regularization_losses, name='regularization_loss')
+
+    def _drop_stale_losses(self):
+        """Forget weight decay terms of another graph, the model is rebuilt."""
+        graph = tf.get_default_graph()
+        self.regularization_losses = [weight_loss for weight_loss in self.regularization_losses
+                                      if weight_loss.graph is graph]
+
     def build(self, rgb, train=False, num_classes=3, random_init_fc8=False,
-              debug=False):
+              debug=False, upsample='deconv', channel_order='rgb'):
         """Build the VGG model using loaded weights
 
         Args:
-            rgb: image batch tensor.
+            rgb: image batch tensor, uint8 or float32.
                 Image in rgb shape. Scaled to Interval [0, 255]
             train: bool.
                 Whether to build train or inference graph.
@@ -49,17 +126,38 @@ class FCN16VGG:
                 Fine-tuning is required in this case.
             debug: bool.
                 Whether to print additional debug information.
+            upsample: string.
+                How upscore layers upsample: 'deconv' - learned transposed
+                convolution, 'bilinear' - fixed resize, 'depthwise' - fixed
+                bilinear transposed convolution applied per class.
+            channel_order: string.
+                Channel order of the input, 'rgb' or 'bgr' (OpenCV frames).
         """
+        self.regularization_losses = []
+        self.build_backbone(rgb, train=train, debug=debug, channel_order=channel_order)
+        self.build_head(self.pool4, self.fc7, tf.shape(rgb), train=train,
+                        num_classes=num_classes, random_init_fc8=random_init_fc8,
+                        debug=debug, upsample=upsample)
+
+    def build_backbone(self, rgb, train=False, debug=False, channel_order='rgb'):
+        """Build VGG16 layers up to fc7.
+
+        Args:
+            rgb: image batch tensor, uint8 or float32.
+                Image in rgb shape. Scaled to Interval [0, 255]
+            train: bool.
+                Whether to build train or inference graph.
+            debug: bool.
+                Whether to print additional debug information.
+            channel_order: string.
+                Channel order of the input, 'rgb' or 'bgr' (OpenCV frames).
+        """
+        self._drop_stale_losses()
 
         # Convert RGB to BGR.
         with tf.name_scope('Processing'):
 
-            red, green, blue = tf.split(rgb, 3, 3)
-
-            bgr = tf.concat([
-                blue - VGG_MEAN[0],
-                green - VGG_MEAN[1],
-                red - VGG_MEAN[2]], axis=3)
+            bgr = preprocess(rgb, channel_order)
 
             if debug:
                 bgr = tf.Print(bgr, [tf.shape(bgr)],
@@ -94,33 +192,56 @@ class FCN16VGG:
         if train:
             self.fc6 = tf.nn.dropout(self.fc6, 0.5)
 
+        # Dropout of fc7 belongs to the head, so cached fc7 features can be
+        # used for training the head.
         self.fc7 = self._fc_layer(self.fc6, "fc7")
+
+    def build_head(self, pool4, fc7, image_shape, train=False, num_classes=3,
+                   random_init_fc8=False, debug=False, upsample='deconv'):
+        """Build the FCN head: score, upscore and fuse layers.
+
+        Args:
+            pool4: tensor, float32 - [batch_size, height / 16, width / 16, 512].
+            fc7: tensor, float32 - [batch_size, height / 32, width / 32, 4096].
+            image_shape: tensor, int32 - [batch_size, height, width, ...].
+                Shape of the input images.
+            train: bool.
+            num_classes: int32.
+            random_init_fc8: bool.
+            debug: bool.
+            upsample: string.
+                See build.
+        """
+        assert upsample in UPSAMPLE_MODES
+        self.upsample = upsample
+        self._drop_stale_losses()
+
         if train:
-            self.fc7 = tf.nn.dropout(self.fc7, 0.5)
+            fc7 = tf.nn.dropout(fc7, 0.5)
 
         if random_init_fc8:
-            self.score_fr = self._score_layer(self.fc7, "score_fr",
+            self.score_fr = self._score_layer(fc7, "score_fr",
                                               num_classes)
         else:
-            self.score_fr = self._fc_layer(self.fc7, "score_fr",
+            self.score_fr = self._fc_layer(fc7, "score_fr",
                                            num_classes=num_classes,
                                            relu=False)
 
         self.pred = tf.argmax(self.score_fr, dimension=3)
 
         self.upscore2 = self._upscore_layer(self.score_fr,
-                                            shape=tf.shape(self.pool4),
+                                            shape=tf.shape(pool4),
                                             num_classes=num_classes,
                                             debug=debug, name='upscore2',
                                             ksize=4, stride=2)
 
-        self.score_pool4 = self._score_layer(self.pool4, "score_pool4",
+        self.score_pool4 = self._score_layer(pool4, "score_pool4",
                                              num_classes=num_classes)
 
         self.fuse_pool4 = tf.add(self.upscore2, self.score_pool4)
 
         self.upscore32 = self._upscore_layer(self.fuse_pool4,
-                                             shape=tf.shape(bgr),
+                                             shape=image_shape,
                                              num_classes=num_classes,
                                              debug=debug, name='upscore32',
                                              ksize=32, stride=16)
@@ -162,7 +283,7 @@ class FCN16VGG:
         Returns:
             relu: tensor, float32.
         """
-        with tf.variable_scope(name):
+        with tf.variable_scope(name, reuse=self.reuse or None):
             filter = self._get_conv_filter(name)
             conv = tf.nn.conv2d(input, filter, [1, 1, 1, 1], padding='SAME')
 
@@ -199,7 +320,7 @@ class FCN16VGG:
         Returns:
             bias: tensor, float32.
         """
-        with tf.variable_scope(name):
+        with tf.variable_scope(name, reuse=self.reuse or None):
 
             if name == 'fc6':
                 filter = self._get_fc_weight_reshape(name, [7, 7, 512, 4096])
@@ -239,7 +360,7 @@ class FCN16VGG:
         Returns:
             tensor, float32.
         """
-        with tf.variable_scope(name):
+        with tf.variable_scope(name, reuse=self.reuse or None):
             # Get number of input channels.
             in_features = input.get_shape()[3].value
             shape = [1, 1, in_features, num_classes]
@@ -248,7 +369,7 @@ class FCN16VGG:
             if name == "score_fr":
                 num_input = in_features
                 stddev = (2 / num_input) ** 0.5
-            elif name == "score_pool4":
+            else:
                 stddev = 0.001
 
             # Apply convolution.
@@ -286,13 +407,13 @@ class FCN16VGG:
             debug: bool.
                 Whether to print additional debug information.
             ksize: int32.
-            stride: inhttps://www.w3schools.com/css/css_float.aspt32.
+            stride: int32.
         Returns:
             deconv: tensor, float32.
                 Upsampled layer.
         """
         strides = [1, stride, stride, 1]
-        with tf.variable_scope(name):
+        with tf.variable_scope(name, reuse=self.reuse or None):
             in_features = input.get_shape()[3].value
 
             # Compute shape out of input.
@@ -308,11 +429,18 @@ class FCN16VGG:
             output_shape = tf.stack(new_shape)
 
             logging.debug("Layer: %s, Fan-in: %d" % (name, in_features))
-            filter_shape = [ksize, ksize, num_classes, in_features]
 
-            weights = self._get_deconv_filter(filter_shape)
-            deconv = tf.nn.conv2d_transpose(input, weights, output_shape,
-                                            strides=strides, padding='SAME')
+            if self.upsample == 'bilinear':
+                deconv = tf.image.resize_bilinear(input, output_shape[1:3])
+            elif self.upsample == 'depthwise':
+                deconv = self._depthwise_upscore(input, output_shape,
+                                                 ksize, stride)
+            else:
+                filter_shape = [ksize, ksize, num_classes, in_features]
+
+                weights = self._get_deconv_filter(filter_shape)
+                deconv = tf.nn.conv2d_transpose(input, weights, output_shape,
+                                                strides=strides, padding='SAME')
 
             # Add summary to TensorBoard.
             utils.activation_summary(deconv)
@@ -324,6 +452,44 @@ class FCN16VGG:
 
         return deconv
 
+    @staticmethod
+    def _depthwise_upscore(input, output_shape, ksize, stride):
+        """Upsample every channel with fixed bilinear kernel.
+
+        Gives the same result as the initial (diagonal) deconvolutional
+        filter, but channels are moved to the batch axis, so a single
+        [ksize, ksize, 1, 1] kernel is used instead of dense
+        [ksize, ksize, C, C] one.
+
+        Args:
+            input: tensor, float32 - [batch_size, height, width, C].
+            output_shape: tensor, int32 - [batch_size, height, width, C].
+            ksize: int32.
+            stride: int32.
+        Returns:
+            upscore: tensor, float32.
+        """
+        in_shape = tf.shape(input)
+
+        kernel = bilinear_kernel(ksize)
+        kernel = tf.constant(kernel.reshape([ksize, ksize, 1, 1]),
+                             dtype=tf.float32, name='up_kernel')
+
+        # [N, h, w, C] => [N * C, h, w, 1].
+        channels = tf.transpose(input, [0, 3, 1, 2])
+        channels = tf.reshape(channels, [-1, in_shape[1], in_shape[2], 1])
+
+        channels_shape = tf.stack([output_shape[0] * output_shape[3],
+                                   output_shape[1], output_shape[2], 1])
+        upscore = tf.nn.conv2d_transpose(channels, kernel, channels_shape,
+                                         strides=[1, stride, stride, 1],
+                                         padding='SAME')
+
+        # [N * C, H, W, 1] => [N, H, W, C].
+        upscore = tf.reshape(upscore, [output_shape[0], output_shape[3],
+                                       output_shape[1], output_shape[2]])
+        return tf.transpose(upscore, [0, 2, 3, 1])
+
     def _get_deconv_filter(self, filter_shape):
         """Get doconvolutional filter.
 
@@ -333,22 +499,7 @@ class FCN16VGG:
             tensor variable.
                 Upsampled deconvolutional filter.
         """
-        width = filter_shape[0]
-        height = filter_shape[0]
-        f = ceil(width / 2.0)
-        c = (2 * f - 1 - f % 2) / (2.0 * f)
-
-        bilinear = np.zeros([filter_shape[0], filter_shape[1]])
-
-        for x in range(width):
-            for y in range(height):
-                value = (1 - abs(x / f - c)) * (1 - abs(y / f - c))
-                bilinear[x, y] = value
-
-        weights = np.zeros(filter_shape)
-
-        for i in range(filter_shape[2]):
-            weights[:, :, i, i] = bilinear
+        weights = deconv_weights(filter_shape)
 
         init = tf.constant_initializer(value=weights,
                                        dtype=tf.float32)
@@ -375,10 +526,7 @@ class FCN16VGG:
 
         filter = tf.get_variable(name="filter", initializer=init, shape=shape)
 
-        if not tf.get_variable_scope().reuse:
-            weight_decay = tf.multiply(tf.nn.l2_loss(filter), self.weight_decay,
-                                       name='weight_loss')
-            tf.add_to_collection('losses', weight_decay)
+        self._add_weight_decay(filter, self.weight_decay)
 
         return filter
 
@@ -423,10 +571,7 @@ class FCN16VGG:
         shape = self.data_dict[name][0].shape
         weights = tf.get_variable(name="weights", initializer=init, shape=shape)
 
-        if not tf.get_variable_scope().reuse:
-            weight_decay = tf.multiply(tf.nn.l2_loss(weights), self.weight_decay,
-                                       name='weight_loss')
-            tf.add_to_collection('losses', weight_decay)
+        self._add_weight_decay(weights, self.weight_decay)
 
         return weights
 
@@ -458,8 +603,7 @@ class FCN16VGG:
             averaged_bias_weights[averaged_idx] = np.mean(bias_weights[start_idx:end_idx])
         return averaged_bias_weights
 
-    @staticmethod
-    def _variable_with_weight_decay(shape, stddev, weight_decay):
+    def _variable_with_weight_decay(self, shape, stddev, weight_decay):
         """Helper to create an initialized Variable with weight decay.
 
         Note that the Variable is initialized with a truncated normal
@@ -483,13 +627,26 @@ class FCN16VGG:
                                   shape=shape,
                                   initializer=initializer)
 
-        if weight_decay and (not tf.get_variable_scope().reuse):
-            weight_decay = tf.multiply(
-                tf.nn.l2_loss(weights), weight_decay, name='weight_loss')
-            tf.add_to_collection('losses', weight_decay)
+        self._add_weight_decay(weights, weight_decay)
 
         return weights
 
+    def _add_weight_decay(self, weights, weight_decay):
+        """Add L2Loss weight decay of the weights to the model losses.
+
+        Weight decay is not added for reused variables, it belongs to the
+        model which created them.
+
+        Args:
+            weights: variable tensor.
+            weight_decay: float32.
+                If None, weight decay is not added.
+        """
+        if weight_decay and not tf.get_variable_scope().reuse:
+            weight_loss = tf.multiply(
+                tf.nn.l2_loss(weights), weight_decay, name='weight_loss')
+            self.regularization_losses.append(weight_loss)
+
     def _bias_variable(self, shape, constant=0.0):
         initializer = tf.constant_initializer(constant)
         return tf.get_variable(name='biases', shape=shape,
@@ -565,3 +722,40 @@ class FCN16VGG:
             averaged_fcn_weights[:, :, :, averaged_idx] = np.mean(
                 fcn_weights[:, :, :, start_idx:end_idx], axis=3)
         return averaged_fcn_weights
+
+
+def bilinear_kernel(ksize):
+    """Get bilinear upsampling kernel.
+
+    Args:
+        ksize: int32.
+            Kernel width and height.
+    Returns:
+        bilinear: numpy array, float32 - [ksize, ksize].
+    """
+    key = ('kernel', ksize)
+    if key not in _bilinear_cache:
+        f = ceil(ksize / 2.0)
+        c = (2 * f - 1 - f % 2) / (2.0 * f)
+
+        ramp = 1 - np.abs(np.arange(ksize) / f - c)
+        _bilinear_cache[key] = np.outer(ramp, ramp).astype(np.float32)
+
+    return _bilinear_cache[key]
+
+
+def deconv_weights(filter_shape):
+    """Get deconvolutional weights which upsample every class bilinearly.
+
+    Args:
+        filter_shape: list, int32 - [ksize, ksize, num_classes, in_features].
+    Returns:
+        weights: numpy array, float32 - filter_shape.
+    """
+    key = ('weights',) + tuple(filter_shape)
+    if key not in _bilinear_cache:
+        bilinear = bilinear_kernel(filter_shape[0])
+        diagonal = np.eye(filter_shape[2], filter_shape[3], dtype=np.float32)
+        _bilinear_cache[key] = bilinear[:, :, np.newaxis, np.newaxis] * diagonal
+
+    return _bilinear_cache[key]
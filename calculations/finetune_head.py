@@ -0,0 +1,256 @@
+#!/usr/bin/env python
+
+"""Fine-tune only the FCN16VGG head on cached backbone features.
+
+The frozen backbone (VGG16 up to fc7) runs once over the dataset and its
+pool4 and fc7 activations are stored as float16 memory-mapped .npy files.
+Head epochs (score_fr, score_pool4, upscore2, upscore32) read the stored
+features instead of running the VGG16 convolutions again:
+
+    $ python finetune_head.py --config train.json --model ./models/model.ckpt \
+        --output-model ./models/head.ckpt --epochs 30
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import argparse
+import os
+import time
+
+import numpy as np
+import tensorflow as tf
+
+import accuracy
+import fcn16_vgg
+import loss
+import train
+import utils
+
+FEATURES = ['pool4', 'fc7']
+
+
+def _is_fresh(path, size, sources):
+    if not os.path.exists(path):
+        return False
+    if np.load(path, mmap_mode='r').shape[0] != size:
+        return False
+    return all(os.path.getmtime(path) >= os.path.getmtime(source)
+               for source in sources if os.path.exists(source))
+
+
+def cache_features(input_set, model_path, cache_dir, vgg16_npy_path='./vgg16.npy',
+                   batch_size=5, input_path=None):
+    """Run the backbone once over input set and store its features.
+
+    The store is rebuilt if it is older than the compiled input set or the
+    backbone checkpoint. Features are written to temporary files which are
+    renamed only after every batch is stored, so an interrupted run never
+    leaves a partial store behind.
+
+    Args:
+        input_set: numpy array, uint8 - [size, height, width, 3].
+        model_path: string.
+            Checkpoint of the backbone.
+        cache_dir: string.
+        vgg16_npy_path: string.
+        batch_size: int32.
+        input_path: string.
+            Compiled input set file.
+
+    Returns:
+        features: dictionary - {'pool4', 'fc7'}.
+            Memory-mapped numpy arrays, float16.
+    """
+    size, height, width = input_set.shape[:3]
+    paths = dict((name, os.path.join(cache_dir, name + '.npy')) for name in FEATURES)
+    sources = [model_path + '.index'] + ([input_path] if input_path else [])
+
+    if all(_is_fresh(path, size, sources) for path in paths.values()):
+        print("Backbone features loaded from '%s'." % cache_dir)
+        return dict((name, np.load(path, mmap_mode='r')) for name, path in paths.items())
+
+    if not os.path.exists(cache_dir):
+        os.makedirs(cache_dir)
+    print("Caching backbone features into '%s'." % cache_dir)
+
+    with tf.Graph().as_default():
+        input_placeholder = tf.placeholder(tf.uint8, [None, height, width, 3])
+
+        vgg_fcn = fcn16_vgg.FCN16VGG(vgg16_npy_path)
+        with tf.name_scope('content_vgg'):
+            vgg_fcn.build_backbone(input_placeholder, train=False)
+
+        tensors = [getattr(vgg_fcn, name) for name in FEATURES]
+        stores = [np.lib.format.open_memmap(
+            paths[name] + '.tmp', mode='w+', dtype=np.float16,
+            shape=(size,) + tuple(tensor.get_shape().as_list()[1:]))
+            for name, tensor in zip(FEATURES, tensors)]
+
+        # Only backbone variables are in the graph.
+        saver = tf.train.Saver()
+
+        with tf.Session(config=utils.session_config('inference')) as sess:
+            saver.restore(sess, model_path)
+
+            for offset in range(0, size, batch_size):
+                values = sess.run(tensors, feed_dict={
+                    input_placeholder: input_set[offset:(offset + batch_size)]})
+                for store, value in zip(stores, values):
+                    store[offset:(offset + batch_size)] = value
+
+    for store in stores:
+        store.flush()
+    del stores
+    for path in paths.values():
+        os.replace(path + '.tmp', path)
+
+    return dict((name, np.load(path, mmap_mode='r')) for name, path in paths.items())
+
+
+def train_head(features, output_set, model_path, config):
+    """Train the head on stored features.
+
+    Args:
+        features: dictionary - {'pool4', 'fc7'}.
+        output_set: numpy array, uint8 - [size, height, width].
+        model_path: string.
+            Checkpoint the head starts from.
+        config: dictionary.
+            See train.DEFAULT_CONFIG.
+
+    Returns:
+        head_values: dictionary - {variable name: numpy array}.
+    """
+    size, height, width = output_set.shape
+    num_classes = config['num_classes']
+    batch_size = config['batch_size']
+    train_size = size - int(size * config['test_size'])
+
+    with tf.Graph().as_default():
+        placeholders = [tf.placeholder(tf.float16, (None,) + features[name].shape[1:])
+                        for name in FEATURES]
+        output_placeholder = tf.placeholder(tf.uint8, [None, height, width])
+
+        vgg_fcn = fcn16_vgg.FCN16VGG(config['vgg16_npy_path'])
+        with tf.name_scope('content_vgg'):
+            pool4, fc7 = [tf.cast(placeholder, tf.float32) for placeholder in placeholders]
+            vgg_fcn.build_head(pool4, fc7, tf.shape(output_placeholder), train=True,
+                               num_classes=num_classes)
+
+        with tf.name_scope('loss'):
+            head_loss = loss.sparse_loss(vgg_fcn.upscore32, output_placeholder, num_classes,
+                                         regularization_losses=vgg_fcn.regularization_losses)
+            optimizer = tf.train.AdamOptimizer(config['learning_rate']).minimize(head_loss)
+
+        # Evaluation head shares the variables and runs without fc7 dropout.
+        eval_fcn = vgg_fcn.share()
+        with tf.name_scope('content_vgg_eval'):
+            eval_fcn.build_head(pool4, fc7, tf.shape(output_placeholder), train=False,
+                                num_classes=num_classes)
+
+        head_variables = [variable for variable in tf.trainable_variables()
+                          if variable.op.name.split('/')[0] in fcn16_vgg.HEAD_LAYERS]
+        saver = tf.train.Saver(head_variables)
+
+        with tf.Session(config=utils.session_config('training')) as sess:
+            sess.run(tf.global_variables_initializer())
+            saver.restore(sess, model_path)
+
+            print('Training the head')
+            for epoch in range(config['epochs']):
+                start_time = time.time()
+                order = np.random.permutation(train_size)
+                losses = []
+
+                for offset in range(0, train_size, batch_size):
+                    # Sorted indices keep memory-mapped reads sequential.
+                    indices = np.sort(order[offset:(offset + batch_size)])
+                    feed_dict = dict((placeholder, features[name][indices])
+                                     for placeholder, name in zip(placeholders, FEATURES))
+                    feed_dict[output_placeholder] = output_set[indices]
+
+                    _, l = sess.run([optimizer, head_loss], feed_dict=feed_dict)
+                    losses.append(l)
+
+                print("Epoch %d, loss: %f, %.1f s" % (epoch + 1, np.mean(losses),
+                                                      time.time() - start_time))
+
+            if train_size < size:
+                predictions = []
+                for offset in range(train_size, size, batch_size):
+                    feed_dict = dict((placeholder, features[name][offset:(offset + batch_size)])
+                                     for placeholder, name in zip(placeholders, FEATURES))
+                    feed_dict[output_placeholder] = output_set[offset:(offset + batch_size)]
+                    predictions.append(sess.run(eval_fcn.pred_up, feed_dict=feed_dict))
+                predictions = np.concatenate(predictions)
+
+                print("Test accuracy: %.1f%%, mIoU: %.1f%%"
+                      % (100.0 * np.mean(predictions == output_set[train_size:]),
+                         accuracy.mean_iou(predictions, output_set[train_size:], num_classes)))
+
+            return dict((variable.op.name, value) for variable, value in
+                        zip(head_variables, sess.run(head_variables)))
+
+
+def save_model(model_path, output_model_path, head_values, config):
+    """Save the full model with the backbone of model_path and the new head.
+
+    Args:
+        model_path: string.
+        output_model_path: string.
+        head_values: dictionary - {variable name: numpy array}.
+        config: dictionary.
+    """
+    with tf.Graph().as_default():
+        input_placeholder = tf.placeholder(tf.uint8, [None, None, None, 3])
+
+        vgg_fcn = fcn16_vgg.FCN16VGG(config['vgg16_npy_path'])
+        with tf.name_scope('content_vgg'):
+            vgg_fcn.build(input_placeholder, train=False, num_classes=config['num_classes'])
+
+        saver = tf.train.Saver()
+        with tf.Session(config=utils.session_config('inference')) as sess:
+            saver.restore(sess, model_path)
+            for variable in tf.global_variables():
+                if variable.op.name in head_values:
+                    variable.load(head_values[variable.op.name], sess)
+
+            save_path = saver.save(sess, output_model_path)
+            print("Model saved in file: %s" % save_path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--config', default=None, help='JSON config file, see train.py.')
+    parser.add_argument('--model', default=None,
+                        help='Trained model, model_path of the config by default.')
+    parser.add_argument('--output-model', default='./models/head.ckpt')
+    parser.add_argument('--cache-dir', default='./features',
+                        help='Backbone feature store.')
+    parser.add_argument('--recompile', action='store_true',
+                        help='Read the resource again instead of the compiled dataset.')
+    parser.add_argument('--epochs', type=int, default=None)
+    parser.add_argument('--batch-size', type=int, default=None)
+    parser.add_argument('--learning-rate', type=float, default=None)
+    args = parser.parse_args()
+
+    overrides = dict((key, value) for key, value in vars(args).items()
+                     if key in train.DEFAULT_CONFIG)
+    config = train.load_config(args.config, overrides)
+    model_path = args.model or config['model_path']
+
+    input_set, output_set = train.compile_dataset(config, recompile=args.recompile)
+    features = cache_features(input_set, model_path, args.cache_dir,
+                              config['vgg16_npy_path'], config['batch_size'],
+                              input_path=config['input_set'])
+    del input_set
+
+    head_values = train_head(features, output_set, model_path, config)
+    save_model(model_path, args.output_model, head_values, config)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,254 @@
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import time
+
+import numpy as np
+import tensorflow as tf
+
+import fcn16_vgg
+import utils
+
+# Inference scales which are tried by adaptive resolution (biggest first).
+SCALES = [1.0, 0.75, 0.5, 0.25]
+
+
+class Segmenter:
+    """Trained FCN16VGG with one graph for every input resolution.
+
+    Input images are resized in-graph to inference size, so the same
+    session is reused for any scale and logits are upsampled back to the
+    input size before the argmax.
+
+    Raw uint8 frames of any size are fed, resizing to model_size, channel
+    reordering and mean subtraction run in-graph, so OpenCV frames are fed
+    as they are read with channel_order='bgr'.
+
+    Args:
+        model_size: tuple, int32 - (height, width).
+            Inference size which input is resized to in-graph (e.g. the
+            training size 180x320), the input size is kept if None.
+    """
+
+    def __init__(self, model_path, vgg16_npy_path='./vgg16.npy',
+                 num_classes=3, config=None, upsample='deconv', data_dict=None,
+                 channel_order='rgb', model_size=None):
+        self.num_classes = num_classes
+        self.channel_order = channel_order
+        self.upsample = upsample
+        self.model_size = tuple(model_size) if model_size is not None else None
+        # Moving average of measured latency (seconds) for every scale.
+        self.latencies = {}
+
+        self.graph = tf.Graph()
+        with self.graph.as_default():
+            self.input_placeholder = tf.placeholder(tf.uint8, [None, None, None, 3])
+            input_size = tf.shape(self.input_placeholder)[1:3]
+            inference_size = input_size
+            if self.model_size is not None:
+                inference_size = tf.constant(self.model_size, tf.int32)
+            self.size_placeholder = tf.placeholder_with_default(inference_size, [2])
+
+            scaled_input = tf.image.resize_bilinear(self.input_placeholder,
+                                                    self.size_placeholder)
+
+            self.vgg_fcn = fcn16_vgg.FCN16VGG(vgg16_npy_path, data_dict=data_dict)
+
+            with tf.name_scope('content_vgg'):
+                self.vgg_fcn.build(scaled_input, train=False,
+                                   num_classes=num_classes,
+                                   upsample=upsample,
+                                   channel_order=channel_order)
+
+            self.logits = tf.image.resize_bilinear(self.vgg_fcn.upscore32,
+                                                   input_size)
+            self.pred_up = tf.argmax(self.logits, dimension=3)
+
+            saver = tf.train.Saver()
+
+        if config is None:
+            config = utils.session_config('inference')
+
+        self.sess = tf.Session(graph=self.graph, config=config)
+        saver.restore(self.sess, model_path)
+
+    def close(self):
+        self.sess.close()
+
+    def predict(self, images, scale=1.0):
+        """Predict label maps running the network at reduced resolution.
+
+        Args:
+            images: numpy array, uint8 - [batch_size, height, width, 3].
+                Images in the channel order of the segmenter.
+            scale: float32.
+                Inference resolution relatively to model_size (or to the
+                input size if there is no model_size).
+
+        Returns:
+            prediction: numpy array, int64 - [batch_size, height, width].
+        """
+        images = np.asarray(images, np.uint8)
+        height, width = self.model_size or images.shape[1:3]
+
+        feed_dict = {self.input_placeholder: images}
+        if scale != 1.0:
+            feed_dict[self.size_placeholder] = [max(1, int(round(height * scale))),
+                                                max(1, int(round(width * scale)))]
+
+        start_time = time.time()
+        prediction = self.sess.run(self.pred_up, feed_dict=feed_dict)
+        self._update_latency(scale, time.time() - start_time)
+
+        return prediction
+
+    def calibrate(self, images, scales=SCALES, runs=3):
+        """Measure latency of every scale.
+
+        Args:
+            images: numpy array - [batch_size, height, width, 3].
+                Representative input batch.
+            scales: list, float32.
+            runs: int32.
+                The number of measured runs per scale.
+        """
+        for scale in scales:
+            # Warm up run is not measured.
+            self.predict(images, scale)
+            self.latencies.pop(scale, None)
+            for _ in range(runs):
+                self.predict(images, scale)
+
+    def choose_scale(self, latency_budget, scales=SCALES):
+        """Choose the biggest scale which fits the latency budget.
+
+        Args:
+            latency_budget: float32.
+                Allowed latency in seconds.
+            scales: list, float32.
+
+        Returns:
+            scale: float32.
+                The smallest scale if none of them fits.
+        """
+        scales = sorted(scales, reverse=True)
+        for scale in scales:
+            if scale in self.latencies and self.latencies[scale] <= latency_budget:
+                return scale
+        return scales[-1]
+
+    def predict_adaptive(self, images, latency_budget, scales=SCALES):
+        """Predict label maps at the resolution which fits the latency budget.
+
+        Args:
+            images: numpy array - [batch_size, height, width, 3].
+            latency_budget: float32.
+                Allowed latency in seconds.
+            scales: list, float32.
+
+        Returns:
+            prediction: numpy array, int64 - [batch_size, height, width].
+            scale: float32.
+                Used scale.
+        """
+        if any(scale not in self.latencies for scale in scales):
+            self.calibrate(images, scales)
+
+        scale = self.choose_scale(latency_budget, scales)
+        return self.predict(images, scale), scale
+
+    def predict_tiled(self, image, tile_size=(180, 320), overlap=32,
+                      batch_size=4):
+        """Predict label map of a big image by overlapping tiles.
+
+        Tiles are run through the network in batches and their logits are
+        blended in the overlaps before the argmax, so peak memory of the
+        network depends on the tile batch, not on the image size.
+
+        Args:
+            image: numpy array, uint8 - [height, width, 3].
+            tile_size: tuple, int32 - (height, width).
+            overlap: int32.
+                The number of pixels shared by neighbour tiles.
+            batch_size: int32.
+                The number of tiles in one network run.
+
+        Returns:
+            prediction: numpy array, int64 - [height, width].
+        """
+        image = np.asarray(image, np.uint8)
+        height, width = image.shape[:2]
+        tile_height = min(tile_size[0], height)
+        tile_width = min(tile_size[1], width)
+
+        window = np.outer(_blend_ramp(tile_height, overlap),
+                          _blend_ramp(tile_width, overlap)).astype(np.float32)
+
+        # Weights are positive everywhere, so normalizing by their sum does
+        # not change the argmax and is skipped.
+        logits_sum = np.zeros((height, width, self.num_classes), np.float32)
+
+        positions = [(y, x)
+                     for y in _tile_starts(height, tile_height, overlap)
+                     for x in _tile_starts(width, tile_width, overlap)]
+
+        for offset in range(0, len(positions), batch_size):
+            batch_positions = positions[offset:(offset + batch_size)]
+            batch = np.stack([image[y:y + tile_height, x:x + tile_width]
+                              for y, x in batch_positions])
+
+            logits = self.sess.run(self.logits,
+                                   feed_dict={self.input_placeholder: batch})
+
+            for (y, x), tile_logits in zip(batch_positions, logits):
+                logits_sum[y:y + tile_height, x:x + tile_width] += \
+                    tile_logits * window[:, :, np.newaxis]
+
+        return logits_sum.argmax(axis=2)
+
+    def _update_latency(self, scale, latency, momentum=0.9):
+        if scale in self.latencies:
+            latency = momentum * self.latencies[scale] + (1 - momentum) * latency
+        self.latencies[scale] = latency
+
+
+def _tile_starts(size, tile, overlap):
+    """Start coordinates of tiles which cover the whole size.
+
+    Args:
+        size: int32.
+            Image size along one axis.
+        tile: int32.
+            Tile size along the same axis.
+        overlap: int32.
+
+    Returns:
+        starts: list, int32.
+    """
+    if tile >= size:
+        return [0]
+
+    stride = max(1, tile - overlap)
+    starts = list(range(0, size - tile, stride))
+    starts.append(size - tile)
+    return starts
+
+
+def _blend_ramp(size, overlap):
+    """Blending weights of tile pixels along one axis.
+
+    Weights rise linearly over the overlap at both tile edges, so tile
+    borders (where the network lacks context) weigh less than centres.
+
+    Args:
+        size: int32.
+            Tile size along the axis.
+        overlap: int32.
+
+    Returns:
+        ramp: numpy array, float32 - [size].
+    """
+    index = np.arange(size, dtype=np.float32)
+    ramp = np.minimum(index + 1, size - index) / (overlap + 1)
+    return np.minimum(ramp, 1.0)
@@ -0,0 +1,358 @@
+#!/usr/bin/env python
+
+"""Live camera segmentation which always runs on the newest frame.
+
+Reading frames serially with cap.read() makes latency grow when inference
+is slower than the camera, as frames wait in the capture buffer. Here a
+background thread grabs frames as fast as the camera delivers them and
+keeps only the newest one, so the network never runs on a stale frame.
+Frames older than the deadline are dropped instead of shown late.
+
+Glass-to-glass latency is the time from frame capture to display of its
+segmentation. A video file is played as a fake camera at its native frame
+rate, so the mode can be measured without a camera:
+
+    $ python live_camera.py --video video16.avi --deadline 200
+    $ python live_camera.py --camera 0 --deadline 100 --adaptive
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import argparse
+import collections
+import threading
+import time
+
+import cv2
+import numpy as np
+
+import inference
+import utils
+
+# Boundary, route, obstacle in BGR.
+COLORS = [[120, 193, 243], [120, 168, 0], [65, 94, 254]]
+
+
+class FileCamera:
+    """Fake camera which plays a video file at its native frame rate.
+
+    Frames are exposed by a background thread on the video clock and wait
+    in a small buffer, as in a camera driver; when the buffer is full the
+    oldest frame is lost. Reading is the same as cv2.VideoCapture.
+
+    Args:
+        path: string.
+        fps: float32.
+            Frame rate, the one of the video by default.
+        buffer_size: int32.
+            Frames the driver buffer holds.
+        loop: bool.
+            Whether to start again at the end of the video.
+    """
+
+    def __init__(self, path, fps=None, buffer_size=4, loop=False):
+        self._cap = cv2.VideoCapture(path)
+        if not self._cap.isOpened():
+            raise IOError("Video '%s' cannot be opened." % path)
+
+        self.fps = fps or self._cap.get(cv2.CAP_PROP_FPS) or 30.0
+        self.loop = loop
+        # Capture time of the frame returned by the last read.
+        self.timestamp = None
+
+        self._buffer = collections.deque(maxlen=buffer_size)
+        self._condition = threading.Condition()
+        self._running = True
+        self._thread = threading.Thread(target=self._play)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def isOpened(self):
+        with self._condition:
+            return self._running or bool(self._buffer)
+
+    def read(self):
+        """Wait for the oldest buffered frame.
+
+        Returns:
+            ret: bool.
+                False at the end of the video.
+            frame: numpy array, uint8 - [height, width, 3].
+        """
+        with self._condition:
+            while self._running and not self._buffer:
+                self._condition.wait()
+            if not self._buffer:
+                return False, None
+            self.timestamp, frame = self._buffer.popleft()
+            return True, frame
+
+    def release(self):
+        with self._condition:
+            self._running = False
+            self._condition.notify_all()
+        self._thread.join()
+        self._cap.release()
+
+    def _play(self):
+        interval = 1.0 / self.fps
+        next_time = time.time()
+
+        while True:
+            with self._condition:
+                if not self._running:
+                    break
+
+            ret, frame = self._cap.read()
+            if not ret and self.loop:
+                self._cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+                ret, frame = self._cap.read()
+            if not ret:
+                break
+
+            # Exposure happens on the video clock, not when the reader asks.
+            delay = next_time - time.time()
+            if delay > 0:
+                time.sleep(delay)
+            next_time += interval
+
+            with self._condition:
+                self._buffer.append((time.time(), frame))
+                self._condition.notify_all()
+
+        with self._condition:
+            self._running = False
+            self._condition.notify_all()
+
+
+class LatestFrameCapture:
+    """Background grabbing which keeps only the newest frame.
+
+    Args:
+        capture: cv2.VideoCapture or FileCamera.
+            The capture timestamp is taken from capture.timestamp if it has
+            one, otherwise it is the time the frame was grabbed.
+    """
+
+    def __init__(self, capture):
+        self.capture = capture
+        self.grabbed = 0
+
+        self._frame = None
+        self._index = 0
+        self._last_index = 0
+        self._running = True
+        self._condition = threading.Condition()
+        self._thread = threading.Thread(target=self._grab)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def read(self, timeout=None):
+        """Wait for a frame newer than the last returned one.
+
+        Args:
+            timeout: float32.
+                Seconds, forever by default.
+
+        Returns:
+            frame: numpy array, uint8 - [height, width, 3].
+                None when the capture ended or the timeout expired.
+            timestamp: float32.
+                Capture time of the frame.
+            skipped: int32.
+                Frames grabbed since the last read which are never returned.
+        """
+        with self._condition:
+            self._condition.wait_for(
+                lambda: self._index > self._last_index or not self._running, timeout)
+            if self._index == self._last_index:
+                return None, None, 0
+
+            skipped = self._index - self._last_index - 1
+            self._last_index = self._index
+            frame, timestamp = self._frame
+            return frame, timestamp, skipped
+
+    def stop(self):
+        with self._condition:
+            self._running = False
+            self._condition.notify_all()
+        # The grabbing thread exits after the frame it is waiting for.
+        self._thread.join()
+
+    def _grab(self):
+        while True:
+            with self._condition:
+                if not self._running:
+                    break
+
+            ret, frame = self.capture.read()
+            if not ret:
+                break
+            timestamp = getattr(self.capture, 'timestamp', None) or time.time()
+
+            with self._condition:
+                self._frame = (frame, timestamp)
+                self._index += 1
+                self.grabbed += 1
+                self._condition.notify_all()
+
+        with self._condition:
+            self._running = False
+            self._condition.notify_all()
+
+
+class LiveStats:
+    """Frame counters and glass-to-glass latencies of a live run."""
+
+    def __init__(self):
+        self.grabbed = 0
+        self.skipped = 0
+        self.deadline_missed = 0
+        self.latencies = []
+
+    @property
+    def shown(self):
+        return len(self.latencies)
+
+    @property
+    def drop_rate(self):
+        return 1.0 - self.shown / max(1, self.grabbed)
+
+    def report(self, elapsed):
+        print('Frames grabbed: %d, shown: %d (%.1f frames/s)'
+              % (self.grabbed, self.shown, self.shown / max(elapsed, 1e-6)))
+        print('Dropped: %.1f%% (%d replaced by newer frames, %d past the deadline)'
+              % (100.0 * self.drop_rate, self.skipped, self.deadline_missed))
+        if self.latencies:
+            latencies = 1000.0 * np.array(self.latencies)
+            print('Glass-to-glass latency: mean %.1f ms, p50 %.1f ms, p90 %.1f ms, '
+                  'p99 %.1f ms, max %.1f ms'
+                  % ((np.mean(latencies),) + tuple(np.percentile(latencies, [50, 90, 99]))
+                     + (np.max(latencies),)))
+
+
+def run_live(segmenter, capture, deadline, size=(320, 180), adaptive=False,
+             show=True, output=None):
+    """Segment the newest frames of capture until it ends or Esc is pressed.
+
+    Args:
+        segmenter: inference.Segmenter.
+            Segmenter of BGR frames (channel_order='bgr').
+        capture: cv2.VideoCapture or FileCamera.
+        deadline: float32.
+            Seconds, frames older than this are not shown.
+        size: tuple, int32 - (width, height).
+            Inference size.
+        adaptive: bool.
+            Whether to lower the inference resolution to fit the time left
+            to the deadline (see inference.Segmenter.predict_adaptive).
+        show: bool.
+            Whether to show frames in a window.
+        output: cv2.VideoWriter.
+            Shown frames are written into it.
+
+    Returns:
+        stats: LiveStats.
+    """
+    stats = LiveStats()
+    latest = LatestFrameCapture(capture)
+
+    while True:
+        frame, timestamp, skipped = latest.read()
+        if frame is None:
+            break
+        stats.skipped += skipped
+
+        # The frame waited for the previous inference.
+        budget = deadline - (time.time() - timestamp)
+        if budget <= 0:
+            stats.deadline_missed += 1
+            continue
+
+        frame = cv2.resize(frame, size)
+        if adaptive:
+            prediction, _ = segmenter.predict_adaptive(frame[np.newaxis], budget)
+        else:
+            prediction = segmenter.predict(frame[np.newaxis])
+
+        if time.time() - timestamp > deadline:
+            stats.deadline_missed += 1
+            continue
+
+        regions_image = utils.regions_to_colored_image(prediction[0], COLORS).astype(np.uint8)
+        view = utils.merge_images(frame, regions_image, 0.4).astype(np.uint8)
+
+        if output is not None:
+            output.write(view)
+        if show:
+            cv2.imshow('Live View', view)
+            if cv2.waitKey(1) & 0xFF == 27:
+                break
+
+        stats.latencies.append(time.time() - timestamp)
+
+    latest.stop()
+    stats.grabbed = latest.grabbed
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument('--video', help='Video played as a fake camera.')
+    source.add_argument('--camera', type=int, help='Camera index.')
+    parser.add_argument('--fps', type=float, default=None,
+                        help='Frame rate of the fake camera, native by default.')
+    parser.add_argument('--model', default='./models/model.ckpt')
+    parser.add_argument('--deadline', type=float, default=200,
+                        help='Milliseconds from capture to display.')
+    parser.add_argument('--adaptive', action='store_true',
+                        help='Lower resolution to fit the deadline.')
+    parser.add_argument('--width', type=int, default=320)
+    parser.add_argument('--height', type=int, default=180)
+    parser.add_argument('--no-window', action='store_true')
+    parser.add_argument('--output', default=None, help='Output video.')
+    args = parser.parse_args()
+
+    segmenter = inference.Segmenter(args.model, channel_order='bgr')
+    # Warm up run, so the first frames do not pay for graph initialization.
+    images = np.zeros((1, args.height, args.width, 3), np.uint8)
+    if args.adaptive:
+        segmenter.calibrate(images)
+    else:
+        segmenter.predict(images)
+
+    if args.video:
+        capture = FileCamera(args.video, fps=args.fps)
+        fps = capture.fps
+    else:
+        capture = cv2.VideoCapture(args.camera)
+        fps = capture.get(cv2.CAP_PROP_FPS) or 30.0
+
+    output = None
+    if args.output:
+        output = cv2.VideoWriter(args.output, cv2.VideoWriter_fourcc(*'XVID'), fps,
+                                 (args.width, args.height))
+
+    start_time = time.time()
+    stats = run_live(segmenter, capture, args.deadline / 1000.0,
+                     size=(args.width, args.height), adaptive=args.adaptive,
+                     show=not args.no_window, output=output)
+    elapsed = time.time() - start_time
+
+    capture.release()
+    if output is not None:
+        output.release()
+    segmenter.close()
+    cv2.destroyAllWindows()
+
+    print('Camera: %.1f frames/s, deadline: %.0f ms' % (fps, args.deadline))
+    stats.report(elapsed)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,103 @@
+#!/usr/bin/env python
+
+"""Load generator for the segmentation server.
+
+Concurrent clients send the same image for a fixed time and throughput and
+latency percentiles are reported:
+
+    $ python load_client.py image.jpg --concurrency 8 --duration 30
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import argparse
+import json
+import threading
+import time
+from http.client import HTTPConnection
+
+import cv2
+import numpy as np
+
+
+def run_client(host, port, path, body, headers, deadline, latencies, errors):
+    """Send requests over one keep-alive connection until the deadline."""
+    connection = HTTPConnection(host, port)
+    while time.time() < deadline:
+        start_time = time.time()
+        try:
+            connection.request('POST', path, body, headers)
+            response = connection.getresponse()
+            response.read()
+        except (OSError, IOError):
+            errors.append(1)
+            connection.close()
+            connection = HTTPConnection(host, port)
+            continue
+
+        if response.status == 200:
+            latencies.append(time.time() - start_time)
+        else:
+            errors.append(response.status)
+    connection.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('image', help='JPEG / PNG image.')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--duration', type=float, default=30.0, help='Seconds.')
+    parser.add_argument('--raw', action='store_true',
+                        help='Send decoded raw RGB frames instead of the file.')
+    parser.add_argument('--output', default='labels', choices=['labels', 'overlay'])
+    args = parser.parse_args()
+
+    if args.raw:
+        image = cv2.cvtColor(cv2.imread(args.image), cv2.COLOR_BGR2RGB)
+        body = image.tobytes()
+        headers = {'Content-Type': 'application/octet-stream',
+                   'X-Height': str(image.shape[0]),
+                   'X-Width': str(image.shape[1])}
+    else:
+        with open(args.image, 'rb') as image_file:
+            body = image_file.read()
+        headers = {'Content-Type': 'image/jpeg'}
+
+    path = '/segment?output=%s' % args.output
+    latencies = []
+    errors = []
+    deadline = time.time() + args.duration
+
+    start_time = time.time()
+    clients = [threading.Thread(target=run_client,
+                                args=(args.host, args.port, path, body, headers,
+                                      deadline, latencies, errors))
+               for _ in range(args.concurrency)]
+    for client in clients:
+        client.start()
+    for client in clients:
+        client.join()
+    elapsed = time.time() - start_time
+
+    print('Requests: %d, errors: %d' % (len(latencies), len(errors)))
+    print('Throughput: %.1f requests/s' % (len(latencies) / elapsed))
+    if latencies:
+        latencies = 1000.0 * np.array(latencies)
+        print('Latency mean: %.1f ms' % latencies.mean())
+        for percentile in (50, 90, 95, 99):
+            print('Latency p%d: %.1f ms' % (percentile, np.percentile(latencies, percentile)))
+        print('Latency max: %.1f ms' % latencies.max())
+
+    connection = HTTPConnection(args.host, args.port)
+    connection.request('GET', '/stats')
+    print('Server: %s' % json.loads(connection.getresponse().read().decode('utf-8')))
+    connection.close()
+
+
+if __name__ == '__main__':
+    main()
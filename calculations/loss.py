@@ -1,8 +1,13 @@
 """This module provides the a softmax cross entropy loss for training FCN.
 
 In order to train VGG first build the model and then feed apply vgg_fcn.up
-to the loss. The loss function can be used in combination with any optimizer
-(e.g. Adam) to finetune the whole model.
+to the loss (one hot labels) or to the sparse_loss (class index labels).
+The loss function can be used in combination with any optimizer (e.g. Adam)
+to finetune the whole model.
+
+Regularization (weight decay) terms belong to the model instance, so
+vgg_fcn.regularization_losses is a required argument of every loss (pass
+an empty list to train without weight decay).
 """
 
 from __future__ import absolute_import
@@ -12,7 +17,7 @@ from __future__ import print_function
 import tensorflow as tf
 
 
-def loss(logits, labels, num_classes, head=None):
+def loss(logits, labels, num_classes, regularization_losses, head=None):
     """Calculate the loss from the logits and the labels.
 
     Args:
@@ -21,6 +26,38 @@ def loss(logits, labels, num_classes, head=None):
         labels: tensor, int32 - [batch_size, width, height, num_classes].
             The ground truth of the data.
         num_classes:
+        regularization_losses: list of tensors.
+            Use vgg_fcn.regularization_losses (weight decay of the model),
+            [] for no weight decay.
+        head: numpy array - [num_classes]
+            Weighting the loss of each class
+            Optional: Prioritize some classes
+    Returns:
+        loss: tensor, float32.
+            Loss result.
+    """
+    with tf.name_scope('loss'):
+        cross_entropy_mean = _cross_entropy_mean(logits, labels, num_classes,
+                                                 head)
+
+        loss = _total_loss([cross_entropy_mean], regularization_losses)
+    return loss
+
+
+def sparse_loss(logits, labels, num_classes, regularization_losses, head=None):
+    """Calculate the loss from the logits and class index labels.
+
+    The same as loss, but labels are not one hot encoded.
+
+    Args:
+        logits: tensor, float32 - [batch_size, width, height, num_classes].
+            Use vgg_fcn.upscore32 as logits.
+        labels: tensor, uint8 / int32 - [batch_size, width, height].
+            Class index of every pixel.
+        num_classes: int32.
+        regularization_losses: list of tensors.
+            Use vgg_fcn.regularization_losses (weight decay of the model),
+            [] for no weight decay.
         head: numpy array - [num_classes]
             Weighting the loss of each class
             Optional: Prioritize some classes
@@ -29,22 +66,142 @@ def loss(logits, labels, num_classes, head=None):
             Loss result.
     """
     with tf.name_scope('loss'):
-        logits = tf.reshape(logits, (-1, num_classes))
-        epsilon = tf.constant(value=1e-4)
-        labels = tf.to_float(tf.reshape(labels, (-1, num_classes)))
+        cross_entropy_mean = _sparse_cross_entropy_mean(logits, labels,
+                                                        num_classes, head)
+
+        loss = _total_loss([cross_entropy_mean], regularization_losses)
+    return loss
+
+
+def distillation_loss(logits, teacher_logits, labels, num_classes,
+                      regularization_losses, temperature=4.0, alpha=0.5,
+                      head=None, sparse=False):
+    """Calculate the knowledge distillation loss of the student.
+
+    The student is supervised by the softened teacher distribution and
+    by the hard labels at the same time.
+
+    Args:
+        logits: tensor, float32 - [batch_size, width, height, num_classes].
+            Use student.upscore32 as logits.
+        teacher_logits: tensor - [batch_size, width, height, num_classes].
+            Teacher (vgg_fcn.upscore32) logits of the same batch.
+        labels: tensor, int32 - [batch_size, width, height, num_classes].
+            The ground truth of the data.
+        num_classes: int32.
+        regularization_losses: list of tensors.
+            Use student.regularization_losses (weight decay of the model),
+            [] for no weight decay.
+        temperature: float32.
+            Softmax temperature of the soft targets.
+        alpha: float32.
+            Weight of the soft targets, hard labels are weighted by
+            1 - alpha.
+        head: numpy array - [num_classes]
+            Weighting the loss of each class
+            Optional: Prioritize some classes
+        sparse: bool.
+            Whether labels are class indices - [batch_size, width, height].
+    Returns:
+        loss: tensor, float32.
+            Loss result.
+    """
+    with tf.name_scope('distillation_loss'):
+        student = tf.reshape(logits, (-1, num_classes)) / temperature
+        teacher = tf.reshape(tf.to_float(teacher_logits), (-1, num_classes))
+        soft_labels = tf.nn.softmax(teacher / temperature)
+
+        soft_cross_entropy = tf.nn.softmax_cross_entropy_with_logits(
+            labels=soft_labels, logits=student)
 
-        softmax = tf.nn.softmax(logits) + epsilon
+        # Gradients of soft targets scale as 1 / temperature ^ 2.
+        soft_mean = tf.multiply(tf.reduce_mean(soft_cross_entropy),
+                                alpha * temperature ** 2,
+                                name='soft_xentropy_mean')
 
-        if head is not None:
-            cross_entropy = -tf.reduce_sum(tf.mul(labels * tf.log(softmax),
-                                                  head), reduction_indices=[1])
+        if sparse:
+            hard_mean = _sparse_cross_entropy_mean(logits, labels, num_classes, head)
         else:
-            cross_entropy = -tf.reduce_sum(
-                labels * tf.log(softmax), reduction_indices=[1])
+            hard_mean = _cross_entropy_mean(logits, labels, num_classes, head)
 
-        cross_entropy_mean = tf.reduce_mean(cross_entropy,
-                                            name='xentropy_mean')
-        tf.add_to_collection('losses', cross_entropy_mean)
+        hard_mean = tf.multiply(hard_mean, 1 - alpha, name='hard_xentropy_mean')
 
-        loss = tf.add_n(tf.get_collection('losses'), name='total_loss')
+        loss = _total_loss([soft_mean, hard_mean], regularization_losses)
     return loss
+
+
+def _total_loss(losses, regularization_losses):
+    """Sum data losses with the model regularization losses.
+
+    Only the given losses are summed (no global collection), so building
+    the loss several times in one graph does not sum them up again.
+
+    Args:
+        losses: list of tensors.
+        regularization_losses: list of tensors.
+
+    Returns:
+        loss: tensor, float32.
+    """
+    graph = tf.get_default_graph()
+    if any(weight_loss.graph is not graph for weight_loss in regularization_losses):
+        raise ValueError('Regularization losses are from another graph, '
+                         'build the model in the current graph first.')
+
+    return tf.add_n(list(losses) + list(regularization_losses), name='total_loss')
+
+
+def _cross_entropy_mean(logits, labels, num_classes, head=None):
+    """Calculate the mean softmax cross entropy over all pixels.
+
+    Softmax and log are fused into one numerically stable op, so no
+    softmax or log intermediates are materialised.
+
+    Args:
+        logits: tensor, float32 - [batch_size, width, height, num_classes].
+        labels: tensor, int32 - [batch_size, width, height, num_classes].
+        num_classes: int32.
+        head: numpy array - [num_classes]
+            Weighting the loss of each class
+    Returns:
+        cross_entropy_mean: tensor, float32.
+    """
+    logits = tf.reshape(logits, (-1, num_classes))
+    labels = tf.to_float(tf.reshape(labels, (-1, num_classes)))
+
+    cross_entropy = tf.nn.softmax_cross_entropy_with_logits(labels=labels,
+                                                            logits=logits)
+
+    if head is not None:
+        # Weight of every pixel is the weight of its (one hot) class.
+        head = tf.constant(head, dtype=tf.float32, shape=[num_classes])
+        cross_entropy = tf.multiply(cross_entropy,
+                                    tf.reduce_sum(labels * head, axis=1))
+
+    return tf.reduce_mean(cross_entropy, name='xentropy_mean')
+
+
+def _sparse_cross_entropy_mean(logits, labels, num_classes, head=None):
+    """Calculate the mean softmax cross entropy for class index labels.
+
+    Args:
+        logits: tensor, float32 - [batch_size, width, height, num_classes].
+        labels: tensor, uint8 / int32 - [batch_size, width, height].
+            Class index of every pixel.
+        num_classes: int32.
+        head: numpy array - [num_classes]
+            Weighting the loss of each class
+    Returns:
+        cross_entropy_mean: tensor, float32.
+    """
+    logits = tf.reshape(logits, (-1, num_classes))
+    labels = tf.reshape(tf.to_int32(labels), [-1])
+
+    cross_entropy = tf.nn.sparse_softmax_cross_entropy_with_logits(
+        labels=labels, logits=logits)
+
+    if head is not None:
+        head = tf.constant(head, dtype=tf.float32, shape=[num_classes])
+        cross_entropy = tf.multiply(cross_entropy, tf.gather(head, labels))
+
+    return tf.reduce_mean(cross_entropy, name='xentropy_mean')
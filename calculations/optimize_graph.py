@@ -0,0 +1,370 @@
+#!/usr/bin/env python
+
+"""Export FCN16VGG as a frozen and optimized inference graph.
+
+The optimization pass works on frozen GraphDefs:
+    - channel reordering and VGG mean subtraction are folded into conv1_1:
+      input channels of the filter are permuted and the mean is absorbed
+      by the bias. With a known input size the bias becomes a per-pixel
+      map, so the zero padded borders give exactly the same result;
+    - upscore layers whose trained up_filter is still diagonal (every
+      class is upsampled only from itself, as the bilinear initialization)
+      become depthwise transposed convolutions;
+    - remaining constant subgraphs are folded by the graph transform tool
+      when it is available.
+
+The exported graph is checked against the original one on random frames:
+
+    $ python optimize_graph.py --model ./models/model.ckpt --output fcn16vgg.pb \
+        --height 180 --width 320
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import argparse
+import logging
+import sys
+import time
+
+import numpy as np
+import tensorflow as tf
+
+import fcn16_vgg
+import utils
+
+INPUT_NAME = 'input'
+LOGITS_NAME = 'logits'
+PREDICTION_NAME = 'prediction'
+
+logging.basicConfig(format='%(asctime)s %(levelname)s %(message)s',
+                    level=logging.INFO,
+                    stream=sys.stdout)
+
+
+def freeze_graph(model_path, height, width, num_classes=3, channel_order='rgb',
+                 upsample='deconv', vgg16_npy_path='./vgg16.npy'):
+    """Build the inference graph, restore weights and make them constants.
+
+    Args:
+        model_path: string.
+        height: int32.
+        width: int32.
+        num_classes: int32.
+        channel_order: string.
+            Channel order of the uint8 input, 'rgb' or 'bgr'.
+        upsample: string.
+        vgg16_npy_path: string.
+
+    Returns:
+        graph_def: tf.GraphDef.
+            Input INPUT_NAME, outputs LOGITS_NAME and PREDICTION_NAME.
+    """
+    with tf.Graph().as_default() as graph:
+        input_placeholder = tf.placeholder(tf.uint8, [None, height, width, 3],
+                                           name=INPUT_NAME)
+
+        vgg_fcn = fcn16_vgg.FCN16VGG(vgg16_npy_path)
+        with tf.name_scope('content_vgg'):
+            vgg_fcn.build(input_placeholder, train=False, num_classes=num_classes,
+                          upsample=upsample, channel_order=channel_order)
+
+        logits = tf.identity(vgg_fcn.upscore32, name=LOGITS_NAME)
+        tf.argmax(logits, 3, name=PREDICTION_NAME)
+
+        saver = tf.train.Saver()
+        with tf.Session(config=utils.session_config('inference')) as sess:
+            saver.restore(sess, model_path)
+            return tf.graph_util.convert_variables_to_constants(
+                sess, graph.as_graph_def(), [LOGITS_NAME, PREDICTION_NAME])
+
+
+def _node_name(input_name):
+    return input_name.lstrip('^').split(':')[0]
+
+
+def _resolve(nodes, name):
+    """Follow Identity nodes up to the producing node."""
+    node = nodes[_node_name(name)]
+    while node.op == 'Identity':
+        node = nodes[_node_name(node.input[0])]
+    return node
+
+
+def _const_value(nodes, name):
+    node = _resolve(nodes, name)
+    if node.op != 'Const':
+        return None
+    return tf.make_ndarray(node.attr['value'].tensor)
+
+
+def _const_node(name, value):
+    node = tf.NodeDef()
+    node.op = 'Const'
+    node.name = name
+    node.attr['dtype'].type = tf.float32.as_datatype_enum
+    node.attr['value'].tensor.CopyFrom(tf.make_tensor_proto(value, tf.float32))
+    return node
+
+
+def fold_preprocessing(graph_def, height=None, width=None, layer='conv1_1'):
+    """Fold channel reordering and mean subtraction into the first conv layer.
+
+    conv(x - mean, W) + b == conv(x, W) + b - D, where D sums W * mean over
+    the filter taps inside the image. D is the same for all inner pixels,
+    so without the input size it is absorbed into the bias vector and only
+    border pixels (zero padded taps) differ from the original graph.
+
+    Args:
+        graph_def: tf.GraphDef.
+            Frozen graph made by freeze_graph.
+        height: int32.
+        width: int32.
+            Input size, the bias becomes an exact [1, height, width, C] map.
+        layer: string.
+
+    Returns:
+        graph_def: tf.GraphDef.
+    """
+    nodes = dict((node.name, node) for node in graph_def.node)
+
+    conv = [node for node in graph_def.node
+            if node.op == 'Conv2D' and node.name.endswith(layer + '/Conv2D')]
+    if len(conv) != 1:
+        raise ValueError("Can not find '%s' convolution." % layer)
+    conv = conv[0]
+
+    sub = _resolve(nodes, conv.input[0])
+    mean = _const_value(nodes, sub.input[1]) if sub.op == 'Sub' else None
+    if mean is None:
+        raise ValueError("Input of '%s' is not the mean subtraction." % layer)
+
+    raw = _resolve(nodes, sub.input[0])
+    reverse = False
+    if raw.op == 'ReverseV2':
+        axis = _const_value(nodes, raw.input[1])
+        reverse = axis is not None and axis.reshape(-1).tolist() in ([3], [-1])
+    raw_input = raw.input[0] if reverse else sub.input[0]
+
+    filter = _const_value(nodes, conv.input[1])
+    bias_add = [node for node in graph_def.node
+                if node.op == 'BiasAdd' and _node_name(node.input[0]) == conv.name][0]
+    bias = _const_value(nodes, bias_add.input[1])
+
+    mean = np.broadcast_to(mean, [3]).astype(np.float32)
+    if reverse:
+        # Network input was reversed, so the filter takes the raw order.
+        filter = filter[:, :, ::-1, :]
+        mean = mean[::-1]
+
+    # Contribution of the mean through every filter tap - [kh, kw, C].
+    taps = np.einsum('hwio,i->hwo', filter, mean)
+
+    if height is None or width is None:
+        folded_bias = bias - taps.sum(axis=(0, 1))
+    else:
+        kh, kw = filter.shape[:2]
+        rows = _inside(height, kh).astype(np.float32)
+        cols = _inside(width, kw).astype(np.float32)
+        folded_bias = bias - np.einsum('yi,xj,yxo->ijo', rows, cols, taps)
+        folded_bias = folded_bias[np.newaxis]
+
+    optimized = tf.GraphDef()
+    optimized.versions.CopyFrom(graph_def.versions)
+    for node in graph_def.node:
+        new_node = optimized.node.add()
+        new_node.CopyFrom(node)
+
+        if node.name == conv.name:
+            new_node.input[0] = raw_input
+            new_node.input[1] = conv.name + '/folded_filter'
+        elif node.name == bias_add.name:
+            new_node.op = 'Add'
+            del new_node.input[:]
+            new_node.input.extend([conv.name, conv.name + '/folded_bias'])
+            for key in list(new_node.attr):
+                if key != 'T':
+                    del new_node.attr[key]
+
+    optimized.node.extend([_const_node(conv.name + '/folded_filter', np.ascontiguousarray(filter)),
+                           _const_node(conv.name + '/folded_bias', folded_bias)])
+
+    return tf.graph_util.extract_sub_graph(optimized, [LOGITS_NAME, PREDICTION_NAME])
+
+
+def _inside(size, ksize):
+    """Whether every tap of SAME convolution is inside the image.
+
+    Returns:
+        inside: numpy array, bool - [ksize, size].
+    """
+    positions = np.arange(size)[np.newaxis] + np.arange(ksize)[:, np.newaxis] - (ksize - 1) // 2
+    return (positions >= 0) & (positions < size)
+
+
+def fold_upscore_filters(graph_def, tolerance=1e-6):
+    """Replace transposed convolutions with diagonal filters by depthwise ones.
+
+    Args:
+        graph_def: tf.GraphDef.
+        tolerance: float32.
+            Off-diagonal weights relatively to the biggest weight which are
+            considered zero.
+
+    Returns:
+        graph_def: tf.GraphDef.
+        folded: int32.
+            The number of replaced layers.
+    """
+    nodes = dict((node.name, node) for node in graph_def.node)
+
+    optimized = tf.GraphDef()
+    optimized.versions.CopyFrom(graph_def.versions)
+    folded = 0
+
+    for node in graph_def.node:
+        new_node = optimized.node.add()
+        new_node.CopyFrom(node)
+        if node.op != 'Conv2DBackpropInput':
+            continue
+
+        # Single channel filters (upsample='depthwise') are already depthwise.
+        filter = _const_value(nodes, node.input[1])
+        if filter is None or filter.shape[2] != filter.shape[3] or filter.shape[2] == 1:
+            continue
+
+        off_diagonal = filter[:, :, ~np.eye(filter.shape[2], dtype=bool)]
+        if np.abs(off_diagonal).max() > tolerance * np.abs(filter).max():
+            continue
+
+        depthwise_filter = np.einsum('hwcc->hwc', filter)[:, :, :, np.newaxis]
+        new_node.op = 'DepthwiseConv2dNativeBackpropInput'
+        new_node.input[1] = node.name + '/depthwise_filter'
+        for key in list(new_node.attr):
+            if key not in ('T', 'strides', 'padding', 'data_format', 'dilations'):
+                del new_node.attr[key]
+        optimized.node.extend([_const_node(node.name + '/depthwise_filter',
+                                           np.ascontiguousarray(depthwise_filter))])
+        folded += 1
+
+    graph_def = tf.graph_util.extract_sub_graph(optimized, [LOGITS_NAME, PREDICTION_NAME])
+    return graph_def, folded
+
+
+def fold_constants(graph_def):
+    """Fold constant subgraphs with the graph transform tool if it is built."""
+    try:
+        from tensorflow.tools.graph_transforms import TransformGraph
+    except ImportError:
+        print('Graph transform tool is not available, constant folding is skipped.')
+        return graph_def
+
+    return TransformGraph(graph_def, [INPUT_NAME], [LOGITS_NAME, PREDICTION_NAME],
+                          ['fold_constants(ignore_errors=true)',
+                           'strip_unused_nodes',
+                           'sort_by_execution_order'])
+
+
+def optimize_graph_def(graph_def, height=None, width=None):
+    """Run every folding pass.
+
+    Args:
+        graph_def: tf.GraphDef.
+            Frozen graph made by freeze_graph.
+        height: int32.
+        width: int32.
+
+    Returns:
+        graph_def: tf.GraphDef.
+    """
+    graph_def = fold_preprocessing(graph_def, height, width)
+    graph_def, folded = fold_upscore_filters(graph_def)
+    print('Folded upscore layers: %d' % folded)
+    return fold_constants(graph_def)
+
+
+def run_graph(graph_def, images, runs=1):
+    """Run a frozen graph.
+
+    Returns:
+        logits: numpy array, float32 - [batch_size, height, width, num_classes].
+        latency: float32.
+            Mean seconds per run after a warm up run.
+    """
+    with tf.Graph().as_default() as graph:
+        tf.import_graph_def(graph_def, name='')
+        input_tensor = graph.get_tensor_by_name(INPUT_NAME + ':0')
+        logits_tensor = graph.get_tensor_by_name(LOGITS_NAME + ':0')
+
+        with tf.Session(config=utils.session_config('inference')) as sess:
+            logits = sess.run(logits_tensor, feed_dict={input_tensor: images})
+            start_time = time.time()
+            for _ in range(runs):
+                sess.run(logits_tensor, feed_dict={input_tensor: images})
+            latency = (time.time() - start_time) / max(1, runs)
+
+    return logits, latency
+
+
+def check_equivalence(original, optimized, images, tolerance=1e-3, runs=5):
+    """Compare outputs of the original and the optimized graph.
+
+    Args:
+        original: tf.GraphDef.
+        optimized: tf.GraphDef.
+        images: numpy array, uint8 - [batch_size, height, width, 3].
+        tolerance: float32.
+            Allowed logits difference relatively to the logits range.
+        runs: int32.
+
+    Returns:
+        equivalent: bool.
+    """
+    original_logits, original_latency = run_graph(original, images, runs)
+    optimized_logits, optimized_latency = run_graph(optimized, images, runs)
+
+    difference = np.abs(original_logits - optimized_logits).max()
+    scale = max(1.0, np.abs(original_logits).max())
+    agreement = 100.0 * np.mean(original_logits.argmax(axis=3) ==
+                                optimized_logits.argmax(axis=3))
+
+    print('Max logits difference: %g (%g relative)' % (difference, difference / scale))
+    print('Prediction agreement: %.3f%%' % agreement)
+    print('Latency: %.1f ms original, %.1f ms optimized'
+          % (1000.0 * original_latency, 1000.0 * optimized_latency))
+
+    return difference / scale <= tolerance
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--model', default='./models/model.ckpt')
+    parser.add_argument('--output', default='fcn16vgg.pb')
+    parser.add_argument('--vgg16-npy-path', default='./vgg16.npy')
+    parser.add_argument('--height', type=int, default=180)
+    parser.add_argument('--width', type=int, default=320)
+    parser.add_argument('--channel-order', default='rgb', choices=fcn16_vgg.CHANNEL_ORDERS)
+    parser.add_argument('--upsample', default='deconv', choices=fcn16_vgg.UPSAMPLE_MODES)
+    parser.add_argument('--batch-size', type=int, default=2,
+                        help='Random frames of the equivalence check.')
+    args = parser.parse_args()
+
+    original = freeze_graph(args.model, args.height, args.width,
+                            channel_order=args.channel_order, upsample=args.upsample,
+                            vgg16_npy_path=args.vgg16_npy_path)
+    optimized = optimize_graph_def(original, args.height, args.width)
+
+    images = np.random.randint(0, 256, (args.batch_size, args.height, args.width, 3)).astype(np.uint8)
+    if not check_equivalence(original, optimized, images):
+        print('Optimized graph is not equivalent, it is not saved.')
+        sys.exit(1)
+
+    with tf.gfile.GFile(args.output, 'wb') as graph_file:
+        graph_file.write(optimized.SerializeToString())
+    print("Optimized graph saved in file: %s" % args.output)
+
+
+if __name__ == '__main__':
+    main()
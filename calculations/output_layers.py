@@ -25,7 +25,7 @@ logging.basicConfig(format='%(asctime)s %(levelname)s %(message)s',
                     stream=sys.stdout)
 
 input_set = np.load('input_set.npy')
-output_set = np.load('output_set.npy')
+output_set = utils.sparse_labels(np.load('output_set.npy'))
 
 input_set = input_set[:1]
 output_set = output_set[:1]
@@ -82,13 +82,10 @@ def save(filters, scale_times=1, name='layer', directory='out'):
 
 
 with tf.device('/cpu:0'):
-    config = tf.ConfigProto(allow_soft_placement=True)
-    config.gpu_options.allow_growth = True
+    with tf.Session(config=utils.session_config('training')) as sess:
 
-    with tf.Session(config=config) as sess:
-
-        input_placeholder = tf.placeholder(tf.float32, [None, height, width, num_classes])
-        output_placeholder = tf.placeholder(tf.float32, [None, height, width, num_classes])
+        input_placeholder = tf.placeholder(tf.uint8, [None, height, width, 3])
+        output_placeholder = tf.placeholder(tf.uint8, [None, height, width])
 
         vgg_fcn = fcn16_vgg.FCN16VGG('./vgg16.npy')
 
@@ -96,7 +93,8 @@ with tf.device('/cpu:0'):
             vgg_fcn.build(input_placeholder, train=True, num_classes=num_classes, debug=True)
 
         with tf.name_scope('loss'):
-            loss = loss.loss(vgg_fcn.upscore32, output_placeholder, num_classes)
+            loss = loss.sparse_loss(vgg_fcn.upscore32, output_placeholder, num_classes,
+                                    regularization_losses=vgg_fcn.regularization_losses)
             optimizer = tf.train.AdamOptimizer(0.0001).minimize(loss)
 
         print('Finished building Network.')
@@ -0,0 +1,160 @@
+#!/usr/bin/env python
+
+"""Pre-annotate new images for the dataset maker.
+
+FCN16VGG segments a folder of images in batches and every prediction is
+written as <name>.json with simplified polygons, which the dataset maker
+loads by "Open JSON" for correction:
+
+    $ python preannotate.py ../new_images --model ./models/model.ckpt --batch-size 8
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import argparse
+import glob
+import json
+import os
+import time
+from multiprocessing.pool import ThreadPool
+
+import cv2
+
+import encoding
+import inference
+
+IMAGE_PATTERNS = ['*.jpg', '*.jpeg', '*.png']
+
+
+def find_images(input_dir, output_dir, overwrite=False):
+    """Images of a folder which do not have annotations yet.
+
+    Args:
+        input_dir: string.
+        output_dir: string.
+        overwrite: bool.
+            Whether to include images which already have <name>.json.
+
+    Returns:
+        paths: list, string.
+    """
+    paths = []
+    for pattern in IMAGE_PATTERNS:
+        paths.extend(glob.glob(os.path.join(input_dir, pattern)))
+
+    if not overwrite:
+        paths = [path for path in paths
+                 if not os.path.exists(annotation_path(path, output_dir))]
+    return sorted(paths)
+
+
+def annotation_path(path, output_dir):
+    name = os.path.splitext(os.path.basename(path))[0]
+    return os.path.join(output_dir, name + '.json')
+
+
+def read_image(path):
+    image = cv2.imread(path)
+    if image is None:
+        return path, None
+    return path, cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+
+
+def preannotate(segmenter, paths, output_dir, batch_size=8, epsilon=2.0, min_area=50.0):
+    """Segment images and write their polygons.
+
+    Images are decoded by a thread pool while the network runs, and only
+    images of the same size are batched together.
+
+    Args:
+        segmenter: inference.Segmenter.
+        paths: list, string.
+        output_dir: string.
+        batch_size: int32.
+        epsilon: float32.
+            Polygon simplification, see encoding.regions_to_polygons.
+        min_area: float32.
+            Smaller polygons are dropped.
+
+    Returns:
+        written: int32.
+            The number of written annotations.
+    """
+    # Pending images by size.
+    batches = {}
+    written = 0
+
+    def flush(shape):
+        batch_paths, images = zip(*batches.pop(shape))
+        predictions = segmenter.predict(images)
+        for path, prediction in zip(batch_paths, predictions):
+            data = encoding.regions_to_polygons(prediction, epsilon=epsilon,
+                                                min_area=min_area)
+            with open(annotation_path(path, output_dir), 'w') as annotation_file:
+                json.dump(data, annotation_file)
+        return len(batch_paths)
+
+    pool = ThreadPool(4)
+    for path, image in pool.imap(read_image, paths):
+        if image is None:
+            print("Can not read '%s'." % path)
+            continue
+
+        batch = batches.setdefault(image.shape, [])
+        batch.append((path, image))
+        if len(batch) == batch_size:
+            written += flush(image.shape)
+    pool.close()
+
+    for shape in list(batches):
+        written += flush(shape)
+
+    return written
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('input_dir', help='Folder of new images.')
+    parser.add_argument('--output-dir', default=None,
+                        help='Folder of annotations, the input folder by default.')
+    parser.add_argument('--model', default='./models/model.ckpt')
+    parser.add_argument('--batch-size', type=int, default=8)
+    parser.add_argument('--epsilon', type=float, default=2.0,
+                        help='Polygon simplification in pixels.')
+    parser.add_argument('--min-area', type=float, default=50.0,
+                        help='Smaller polygons are dropped.')
+    parser.add_argument('--overwrite', action='store_true',
+                        help='Annotate images which already have JSON files.')
+    parser.add_argument('--model-height', type=int, default=180,
+                        help='Inference height, images are resized in-graph.')
+    parser.add_argument('--model-width', type=int, default=320)
+    args = parser.parse_args()
+
+    output_dir = args.output_dir or args.input_dir
+    if not os.path.exists(output_dir):
+        os.makedirs(output_dir)
+
+    paths = find_images(args.input_dir, output_dir, args.overwrite)
+    print('Found %d images to annotate.' % len(paths))
+    if not paths:
+        return
+
+    # Images of any size run at the training resolution, label maps are
+    # upsampled back to the image size.
+    segmenter = inference.Segmenter(args.model, model_size=(args.model_height,
+                                                            args.model_width))
+    start_time = time.time()
+    written = preannotate(segmenter, paths, output_dir, args.batch_size,
+                          args.epsilon, args.min_area)
+    elapsed = time.time() - start_time
+    segmenter.close()
+
+    print('Written %d annotations into %s, %.1f images/s.'
+          % (written, output_dir, written / max(elapsed, 1e-6)))
+
+
+if __name__ == '__main__':
+    main()
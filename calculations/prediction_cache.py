@@ -0,0 +1,226 @@
+"""Content-addressed cache of predicted label maps.
+
+Label maps are keyed by a hash of the input image bytes and of the model
+checkpoint identity, so the cache stays valid across processes and is
+never hit by a retrained model:
+
+    segmenter = inference.Segmenter(model_path, channel_order='bgr')
+    identity = checkpoint_identity(model_path, segmenter.channel_order,
+                                   segmenter.upsample, segmenter.model_size)
+    segmenter = CachedSegmenter(segmenter, PredictionCache(
+        identity, cache_dir='./prediction_cache'))
+    prediction = segmenter.predict(images)
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import glob
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+
+def checkpoint_identity(model_path, channel_order='rgb', upsample='deconv', model_size=None):
+    """Identity of a checkpoint from names, sizes and times of its files.
+
+    Segmenter settings which change predictions of the same pixels are a
+    part of the identity, so segmenters with different settings sharing a
+    cache directory do not return each other's label maps.
+
+    Args:
+        model_path: string.
+            Checkpoint prefix, e.g. './models/model.ckpt'.
+        channel_order: string.
+            Channel order of the segmenter input, 'rgb' or 'bgr'.
+        upsample: string.
+            Upsampling mode of the segmenter, see FCN16VGG.build.
+        model_size: tuple, int32 - (height, width).
+            In-graph inference size of the segmenter.
+
+    Returns:
+        identity: string.
+    """
+    digest = hashlib.sha1(os.path.abspath(model_path).encode('utf-8'))
+    digest.update(('%s:%s:%s' % (channel_order, upsample, model_size)).encode('utf-8'))
+    for path in sorted(glob.glob(model_path + '.*')):
+        stat = os.stat(path)
+        digest.update(('%s:%d:%d' % (os.path.basename(path), stat.st_size,
+                                     int(stat.st_mtime))).encode('utf-8'))
+    return digest.hexdigest()
+
+
+class PredictionCache:
+    """Two tier cache: in-memory LRU and compressed label maps on disk.
+
+    Args:
+        identity: string.
+            Model identity, see checkpoint_identity.
+        max_entries: int32.
+            Capacity of the in-memory tier.
+        cache_dir: string.
+            Directory of the disk tier, no disk tier if None.
+    """
+
+    def __init__(self, identity, max_entries=1024, cache_dir=None):
+        self.identity = identity
+        self.max_entries = max_entries
+        self.cache_dir = cache_dir
+
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        # Label map bytes which were not recomputed and disk bytes saved by
+        # compression of the stored label maps.
+        self.bytes_served = 0
+        self.bytes_saved = 0
+
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+        if cache_dir is not None and not os.path.exists(cache_dir):
+            os.makedirs(cache_dir)
+
+    @property
+    def hit_rate(self):
+        hits = self.memory_hits + self.disk_hits
+        return hits / max(1, hits + self.misses)
+
+    def stats(self):
+        with self._lock:
+            return {'memory_hits': self.memory_hits,
+                    'disk_hits': self.disk_hits,
+                    'misses': self.misses,
+                    'hit_rate': self.hit_rate,
+                    'bytes_served': self.bytes_served,
+                    'bytes_saved': self.bytes_saved,
+                    'entries': len(self._entries)}
+
+    def key(self, image, scale=1.0):
+        """Hash of the image content, model identity and inference scale.
+
+        Args:
+            image: numpy array - [height, width, 3].
+            scale: float32.
+
+        Returns:
+            key: string.
+        """
+        image = np.ascontiguousarray(image)
+        digest = hashlib.sha1(self.identity.encode('utf-8'))
+        digest.update(('%s:%s:%r' % (image.shape, image.dtype, scale)).encode('utf-8'))
+        digest.update(memoryview(image).cast('B'))
+        return digest.hexdigest()
+
+    def get(self, key):
+        """Cached label map or None.
+
+        Args:
+            key: string.
+
+        Returns:
+            prediction: numpy array, uint8 - [height, width].
+        """
+        with self._lock:
+            prediction = self._entries.get(key)
+            if prediction is not None:
+                self._entries.move_to_end(key)
+                self.memory_hits += 1
+                self.bytes_served += prediction.nbytes
+                return prediction
+
+        path = self._path(key)
+        if path is None or not os.path.exists(path):
+            with self._lock:
+                self.misses += 1
+            return None
+
+        with np.load(path) as stored:
+            prediction = stored['prediction']
+
+        with self._lock:
+            self._remember(key, prediction)
+            self.disk_hits += 1
+            self.bytes_served += prediction.nbytes
+        return prediction
+
+    def put(self, key, prediction):
+        """Store a label map in both tiers.
+
+        Args:
+            key: string.
+            prediction: numpy array - [height, width].
+        """
+        prediction = prediction.astype(np.uint8)
+        prediction.flags.writeable = False
+
+        with self._lock:
+            self._remember(key, prediction)
+
+        path = self._path(key)
+        if path is None or os.path.exists(path):
+            return
+
+        directory = os.path.dirname(path)
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+
+        # Written under a temporary name, so readers never see a partial file.
+        temporary_path = '%s.%d.%d.tmp' % (path, os.getpid(),
+                                           threading.current_thread().ident)
+        with open(temporary_path, 'wb') as cache_file:
+            np.savez_compressed(cache_file, prediction=prediction)
+        os.rename(temporary_path, path)
+
+        with self._lock:
+            self.bytes_saved += prediction.nbytes - os.path.getsize(path)
+
+    def _remember(self, key, prediction):
+        self._entries[key] = prediction
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def _path(self, key):
+        if self.cache_dir is None:
+            return None
+        return os.path.join(self.cache_dir, key[:2], key + '.npz')
+
+
+class CachedSegmenter:
+    """inference.Segmenter which runs the network only for cache misses.
+
+    Args:
+        segmenter: inference.Segmenter.
+        cache: PredictionCache.
+    """
+
+    def __init__(self, segmenter, cache):
+        self.segmenter = segmenter
+        self.cache = cache
+
+    def predict(self, images, scale=1.0):
+        """Predict label maps, see inference.Segmenter.predict.
+
+        Returns:
+            prediction: numpy array, uint8 - [batch_size, height, width].
+        """
+        images = np.asarray(images)
+        keys = [self.cache.key(image, scale) for image in images]
+        predictions = [self.cache.get(key) for key in keys]
+
+        missing = [i for i, prediction in enumerate(predictions) if prediction is None]
+        if missing:
+            computed = self.segmenter.predict(images[missing], scale)
+            for i, prediction in zip(missing, computed):
+                self.cache.put(keys[i], prediction)
+                predictions[i] = prediction.astype(np.uint8)
+
+        return np.stack(predictions)
+
+    def close(self):
+        self.segmenter.close()
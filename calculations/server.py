@@ -0,0 +1,363 @@
+#!/usr/bin/env python
+
+"""Local HTTP segmentation server.
+
+FCN16VGG sessions are created once and kept warm. Concurrent requests of
+the same frame size are coalesced into one batch, so a busy server runs
+fewer and bigger session calls.
+
+    $ python server.py --model ./models/model.ckpt --sessions 2 --port 8000
+
+Endpoints:
+    POST /segment?output=labels|overlay|rle|polygons&format=png|raw
+        Body is a JPEG / PNG image or a raw RGB frame (Content-Type
+        application/octet-stream with X-Width and X-Height headers).
+        Label maps are returned as a greyscale PNG with class indices as
+        pixel values or as raw uint8 bytes, overlays as a PNG, run-length
+        encoding and polygons (dataset maker schema) as JSON.
+    GET /stats
+        JSON with request, batch and prediction cache counters.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import argparse
+import json
+import multiprocessing
+import queue
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+from urllib.parse import parse_qs, urlparse
+
+import cv2
+import numpy as np
+import tensorflow as tf
+
+import encoding
+import inference
+import prediction_cache
+import utils
+
+COLORS = [[243, 193, 120], [0, 168, 120], [254, 94, 65]]
+
+
+class _Request:
+    def __init__(self, image):
+        self.image = image
+        self.prediction = None
+        self.error = None
+        self.done = threading.Event()
+
+
+class BatchingPool:
+    """Warm segmenters which serve requests in coalesced batches.
+
+    Every segmenter has a worker thread. A worker takes the oldest request
+    and waits up to max_delay for more requests of the same frame size,
+    then runs them as one batch.
+
+    Args:
+        segmenters: list of inference.Segmenter.
+        max_batch_size: int32.
+        max_delay: float32.
+            Seconds the first request of a batch waits for others.
+        scale: float32.
+            Inference resolution relatively to the input size.
+        cache: prediction_cache.PredictionCache.
+            Requests which hit the cache are not queued.
+    """
+
+    def __init__(self, segmenters, max_batch_size=8, max_delay=0.005, scale=1.0,
+                 cache=None):
+        self.segmenters = segmenters
+        self.scale = scale
+        self.cache = cache
+        self.max_batch_size = max_batch_size
+        self.max_delay = max_delay
+
+        self.requests = 0
+        self.batches = 0
+        self._lock = threading.Lock()
+        self._queue = queue.Queue()
+
+        self._workers = [threading.Thread(target=self._work, args=(segmenter,))
+                         for segmenter in segmenters]
+        for worker in self._workers:
+            worker.daemon = True
+            worker.start()
+
+    def stats(self):
+        with self._lock:
+            stats = {'sessions': len(self.segmenters),
+                     'requests': self.requests,
+                     'batches': self.batches,
+                     'mean_batch_size': self.requests / max(1, self.batches),
+                     'queued': self._queue.qsize()}
+        if self.cache is not None:
+            stats['cache'] = self.cache.stats()
+        return stats
+
+    def predict(self, image):
+        """Segment one image.
+
+        Args:
+            image: numpy array, uint8 - [height, width, 3].
+                RGB image.
+
+        Returns:
+            prediction: numpy array, uint8 - [height, width].
+        """
+        if self.cache is not None:
+            key = self.cache.key(image, self.scale)
+            prediction = self.cache.get(key)
+            if prediction is not None:
+                return prediction
+
+        request = _Request(image)
+        self._queue.put(request)
+        request.done.wait()
+
+        if request.error is not None:
+            raise request.error
+
+        if self.cache is not None:
+            self.cache.put(key, request.prediction)
+        return request.prediction
+
+    def close(self):
+        for _ in self._workers:
+            self._queue.put(None)
+        for worker in self._workers:
+            worker.join()
+        for segmenter in self.segmenters:
+            segmenter.close()
+
+    def _collect(self, first):
+        """Collect requests of the first request frame size into a batch."""
+        batch = [first]
+        others = []
+        deadline = time.time() + self.max_delay
+
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                break
+            try:
+                request = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+
+            if request is None or request.image.shape != first.image.shape:
+                others.append(request)
+                if request is None:
+                    break
+            else:
+                batch.append(request)
+
+        # Requests of other sizes (and the stop signal) go to the next batch.
+        for request in others:
+            self._queue.put(request)
+
+        return batch
+
+    def _work(self, segmenter):
+        while True:
+            first = self._queue.get()
+            if first is None:
+                return
+
+            batch = self._collect(first)
+            try:
+                images = np.stack([request.image for request in batch])
+                predictions = segmenter.predict(images, self.scale)
+                for request, prediction in zip(batch, predictions):
+                    request.prediction = prediction.astype(np.uint8)
+            except Exception as error:
+                for request in batch:
+                    request.error = error
+
+            with self._lock:
+                self.requests += len(batch)
+                self.batches += 1
+
+            for request in batch:
+                request.done.set()
+
+
+def decode_image(body, headers):
+    """Decode a request body into RGB image.
+
+    Args:
+        body: bytes.
+        headers: email.message.Message.
+
+    Returns:
+        image: numpy array, uint8 - [height, width, 3].
+    """
+    if headers.get('Content-Type', '') == 'application/octet-stream':
+        height = int(headers['X-Height'])
+        width = int(headers['X-Width'])
+        image = np.frombuffer(body, np.uint8)
+        if image.size != height * width * 3:
+            raise ValueError('Raw frame must have X-Height * X-Width * 3 bytes.')
+        return image.reshape((height, width, 3))
+
+    image = cv2.imdecode(np.frombuffer(body, np.uint8), cv2.IMREAD_COLOR)
+    if image is None:
+        raise ValueError('Body is not a JPEG / PNG image.')
+    return cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+
+
+def overlay(image, prediction, percentage=0.5):
+    """Blend image with coloured regions.
+
+    Args:
+        image: numpy array, uint8 - [height, width, 3].
+            RGB image.
+        prediction: numpy array, uint8 - [height, width].
+        percentage: float32.
+            Weight of the image.
+
+    Returns:
+        overlay: numpy array, uint8 - [height, width, 3].
+            RGB image.
+    """
+    regions_image = utils.regions_to_colored_image(prediction, COLORS)
+    return cv2.addWeighted(image, percentage, regions_image.astype(np.uint8),
+                           1 - percentage, 0)
+
+
+class SegmentationHandler(BaseHTTPRequestHandler):
+    pool = None
+
+    def do_GET(self):
+        if urlparse(self.path).path != '/stats':
+            self.send_error(404)
+            return
+        self._send(json.dumps(self.pool.stats()).encode('utf-8'), 'application/json')
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        if url.path != '/segment':
+            self.send_error(404)
+            return
+
+        query = parse_qs(url.query)
+        output = query.get('output', ['labels'])[0]
+        output_format = query.get('format', ['png'])[0]
+
+        try:
+            body = self.rfile.read(int(self.headers['Content-Length']))
+            image = decode_image(body, self.headers)
+        except (TypeError, KeyError, ValueError) as error:
+            self.send_error(400, str(error))
+            return
+
+        try:
+            prediction = self.pool.predict(image)
+        except Exception as error:
+            self.send_error(500, str(error))
+            return
+
+        if output in ('rle', 'polygons'):
+            if output == 'rle':
+                data = encoding.rle_encode(prediction)
+            else:
+                data = encoding.regions_to_polygons(prediction)
+            self._send(json.dumps(data).encode('utf-8'), 'application/json')
+            return
+
+        if output == 'overlay':
+            result = cv2.cvtColor(overlay(image, prediction), cv2.COLOR_RGB2BGR)
+        else:
+            result = prediction
+
+        if output_format == 'raw':
+            self._send(result.tobytes(), 'application/octet-stream',
+                       {'X-Height': result.shape[0], 'X-Width': result.shape[1]})
+        else:
+            _, png = cv2.imencode('.png', result)
+            self._send(png.tobytes(), 'image/png')
+
+    def _send(self, body, content_type, headers=None):
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, str(value))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--model', default='./models/model.ckpt')
+    parser.add_argument('--vgg16-npy-path', default='./vgg16.npy')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--sessions', type=int, default=1,
+                        help='The number of warm sessions.')
+    parser.add_argument('--max-batch-size', type=int, default=8)
+    parser.add_argument('--max-delay', type=float, default=5.0,
+                        help='Milliseconds a request waits for a batch.')
+    parser.add_argument('--scale', type=float, default=1.0,
+                        help='Inference resolution relatively to the input size.')
+    parser.add_argument('--cache-entries', type=int, default=0,
+                        help='In-memory prediction cache size, 0 - no cache.')
+    parser.add_argument('--cache-dir', default=None,
+                        help='On-disk prediction cache directory.')
+    args = parser.parse_args()
+
+    num_classes = 3
+
+    # VGG16 weights are loaded once, the checkpoint overrides them anyway.
+    data_dict = np.load(args.vgg16_npy_path, encoding='latin1').item()
+
+    # Sessions share CPU cores instead of oversubscribing them.
+    threads = max(1, multiprocessing.cpu_count() // args.sessions)
+    segmenters = []
+    for _ in range(args.sessions):
+        config = tf.ConfigProto(allow_soft_placement=True,
+                                intra_op_parallelism_threads=threads,
+                                inter_op_parallelism_threads=1)
+        config.gpu_options.allow_growth = True
+        segmenters.append(inference.Segmenter(args.model, num_classes=num_classes,
+                                              config=config, data_dict=data_dict))
+
+    cache = None
+    if args.cache_entries or args.cache_dir:
+        cache = prediction_cache.PredictionCache(
+            prediction_cache.checkpoint_identity(args.model, segmenters[0].channel_order,
+                                                 segmenters[0].upsample,
+                                                 segmenters[0].model_size),
+            max_entries=args.cache_entries, cache_dir=args.cache_dir)
+
+    SegmentationHandler.pool = BatchingPool(segmenters, args.max_batch_size,
+                                            args.max_delay / 1000.0, args.scale,
+                                            cache=cache)
+
+    server = ThreadingHTTPServer((args.host, args.port), SegmentationHandler)
+    print('Serving on http://%s:%d' % (args.host, args.port))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        SegmentationHandler.pool.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,118 @@
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import tensorflow as tf
+
+import fcn16_vgg
+import utils
+
+
+class StudentFCN(fcn16_vgg.FCN16VGG):
+    """Compact FCN which is trained by distilling FCN16VGG.
+
+    The student keeps FCN16VGG topology (score at 1/16, fuse with 1/8 skip
+    and upsample back to the input size), but uses a small randomly
+    initialized encoder instead of VGG16, so no npy file is loaded.
+    """
+
+    # Encoder layers - (conv name, pool name, number of output channels).
+    LAYERS = [('conv1', 'pool1', 16), ('conv2', 'pool2', 32),
+              ('conv3', 'pool3', 64), ('conv4', 'pool4', 128)]
+
+    def __init__(self, weight_decay=5e-4):
+        fcn16_vgg.FCN16VGG.__init__(self, data_dict={})
+        self.weight_decay = weight_decay
+
+    def build(self, rgb, train=False, num_classes=3, debug=False,
+              upsample='deconv', channel_order='rgb'):
+        """Build the student model.
+
+        Args:
+            rgb: image batch tensor, uint8 or float32.
+                Image in rgb shape. Scaled to Interval [0, 255]
+            train: bool.
+                Whether to build train or inference graph.
+            num_classes: int32.
+                How many classes should be predicted.
+            debug: bool.
+                Whether to print additional debug information.
+            upsample: string.
+                Upsampling mode of upscore layers, see FCN16VGG.build.
+            channel_order: string.
+                Channel order of the input, 'rgb' or 'bgr' (OpenCV frames).
+        """
+        assert upsample in fcn16_vgg.UPSAMPLE_MODES
+        self.upsample = upsample
+        self.regularization_losses = []
+        # Convert RGB to BGR.
+        with tf.name_scope('Processing'):
+            bgr = fcn16_vgg.preprocess(rgb, channel_order)
+
+        # Every encoder layer halves the resolution: 1/2, 1/4, 1/8, 1/16.
+        layer = bgr
+        for conv_name, pool_name, out_features in self.LAYERS:
+            layer = self._student_conv_layer(layer, conv_name, out_features)
+            layer = self._max_pool(layer, pool_name, debug)
+            setattr(self, pool_name, layer)
+
+        self.conv5 = self._student_conv_layer(self.pool4, 'conv5', 128)
+
+        if train:
+            self.conv5 = tf.nn.dropout(self.conv5, 0.5)
+
+        self.score_fr = self._score_layer(self.conv5, 'score_fr',
+                                          num_classes=num_classes)
+
+        self.pred = tf.argmax(self.score_fr, dimension=3)
+
+        self.upscore2 = self._upscore_layer(self.score_fr,
+                                            shape=tf.shape(self.pool3),
+                                            num_classes=num_classes,
+                                            debug=debug, name='upscore2',
+                                            ksize=4, stride=2)
+
+        self.score_pool3 = self._score_layer(self.pool3, 'score_pool3',
+                                             num_classes=num_classes)
+
+        self.fuse_pool3 = tf.add(self.upscore2, self.score_pool3)
+
+        self.upscore32 = self._upscore_layer(self.fuse_pool3,
+                                             shape=tf.shape(bgr),
+                                             num_classes=num_classes,
+                                             debug=debug, name='upscore32',
+                                             ksize=16, stride=8)
+
+        self.pred_up = tf.argmax(self.upscore32, dimension=3)
+
+    def _student_conv_layer(self, input, name, out_features):
+        """Compute 3x3 convolution with randomly initialized filter.
+
+        Args:
+            input: tensor, float32.
+            name: string.
+                Name of the layer.
+            out_features: int32.
+                The number of output channels.
+
+        Returns:
+            relu: tensor, float32.
+        """
+        with tf.variable_scope(name, reuse=self.reuse or None):
+            in_features = input.get_shape()[3].value
+            shape = [3, 3, in_features, out_features]
+
+            # He initialization.
+            stddev = (2 / (9 * in_features)) ** 0.5
+
+            filter = self._variable_with_weight_decay(shape, stddev,
+                                                      self.weight_decay)
+            conv = tf.nn.conv2d(input, filter, [1, 1, 1, 1], padding='SAME')
+
+            conv_biases = self._bias_variable([out_features], constant=0.0)
+            relu = tf.nn.relu(tf.nn.bias_add(conv, conv_biases))
+
+            # Add summary to TensorBoard.
+            utils.activation_summary(relu)
+
+            return relu
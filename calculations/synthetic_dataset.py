@@ -0,0 +1,230 @@
+#!/usr/bin/env python
+
+"""Generate a synthetic dataset in the dataset maker format.
+
+Every sample is a JPEG image with a JSON file of polygon annotations, as
+saved by the dataset maker, so the dataset is read by utils.read_files:
+
+    $ python synthetic_dataset.py ../synthetic --count 10000 --polygons 1-4 \
+        --complexity 12 --class-mix route=0.7,obstacle=0.3
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import argparse
+import json
+import multiprocessing
+import os
+import time
+
+import numpy as np
+from PIL import Image, ImageDraw
+
+# Mean colors (RGB) of the background and of polygon classes.
+CLASS_COLORS = {
+    'boundary': (86, 112, 64),
+    'route': (150, 122, 92),
+    'obstacle': (110, 110, 116),
+}
+
+DEFAULT_CLASS_MIX = {'route': 0.7, 'obstacle': 0.3}
+
+
+def route_polygon(rng, height, width, complexity):
+    """Trail from the bottom edge narrowing towards the horizon.
+
+    Args:
+        rng: numpy RandomState.
+        height: int32.
+        width: int32.
+        complexity: int32.
+            The number of vertices.
+
+    Returns:
+        points: list of tuples, float32 - [(x, y)].
+    """
+    side = max(1, (complexity - 2) // 2)
+    left = rng.uniform(0, width / 3)
+    right = rng.uniform(2 * width / 3, width)
+    apex_x = rng.uniform(width / 4, 3 * width / 4)
+    apex_y = rng.uniform(0.1 * height, 0.6 * height)
+
+    points = [(left, height)]
+    for t in np.linspace(0, 1, side + 2)[1:-1]:
+        points.append((left + t * (apex_x - left) + rng.normal(0, width * 0.02),
+                       height + t * (apex_y - height)))
+    points.append((apex_x, apex_y))
+    for t in np.linspace(1, 0, side + 2)[1:-1]:
+        points.append((right + t * (apex_x - right) + rng.normal(0, width * 0.02),
+                       height + t * (apex_y - height)))
+    points.append((right, height))
+
+    return points
+
+
+def obstacle_polygon(rng, height, width, complexity):
+    """Star-shaped blob, so the polygon never intersects itself.
+
+    Args:
+        rng: numpy RandomState.
+        height: int32.
+        width: int32.
+        complexity: int32.
+            The number of vertices.
+
+    Returns:
+        points: list of tuples, float32 - [(x, y)].
+    """
+    center_x = rng.uniform(0, width)
+    center_y = rng.uniform(height / 4, height)
+    radius = rng.uniform(0.03, 0.15) * width
+
+    angles = np.sort(rng.uniform(0, 2 * np.pi, complexity))
+    radii = radius * rng.uniform(0.6, 1.0, complexity)
+
+    return list(zip(center_x + radii * np.cos(angles),
+                    center_y + radii * np.sin(angles)))
+
+
+POLYGON_MAKERS = {
+    'route': route_polygon,
+    'obstacle': obstacle_polygon,
+}
+
+
+def make_sample(seed, height=180, width=320, polygons=(1, 3), complexity=12,
+                class_mix=None, noise=12.0):
+    """Make one synthetic image and its annotation.
+
+    Args:
+        seed: int32.
+        height: int32.
+        width: int32.
+        polygons: tuple, int32 - (min, max).
+            The number of polygons.
+        complexity: int32.
+            The number of polygon vertices.
+        class_mix: dictionary - {class name: probability}.
+        noise: float32.
+            Standard deviation of pixel noise.
+
+    Returns:
+        image: numpy array, uint8 - [height, width, 3].
+        data: dictionary - {'polygons': [{'type': <string>, 'points': []}]}.
+    """
+    rng = np.random.RandomState(seed)
+    class_mix = class_mix or DEFAULT_CLASS_MIX
+    names = sorted(class_mix)
+    probabilities = np.array([class_mix[name] for name in names], np.float64)
+    probabilities /= probabilities.sum()
+
+    image = Image.new('RGB', (width, height), CLASS_COLORS['boundary'])
+    draw = ImageDraw.Draw(image)
+
+    data = {'polygons': []}
+    for _ in range(rng.randint(polygons[0], polygons[1] + 1)):
+        name = names[rng.choice(len(names), p=probabilities)]
+        points = POLYGON_MAKERS[name](rng, height, width, max(3, complexity))
+
+        color = tuple(int(np.clip(channel + rng.normal(0, 10), 0, 255))
+                      for channel in CLASS_COLORS[name])
+        draw.polygon(points, fill=color)
+
+        data['polygons'].append({
+            'type': name,
+            'points': [{'x': float(x), 'y': float(y)} for x, y in points]
+        })
+
+    image = np.asarray(image, np.float32) + rng.normal(0, noise, (height, width, 3))
+    return np.clip(image, 0, 255).astype(np.uint8), data
+
+
+def _write_sample(args):
+    output_dir, index, seed, options = args
+    image_path = os.path.join(output_dir, '%d.jpg' % index)
+    json_path = os.path.join(output_dir, '%d.json' % index)
+    if os.path.exists(image_path) and os.path.exists(json_path):
+        return
+
+    image, data = make_sample(seed, **options)
+    Image.fromarray(image).save(image_path, quality=90)
+    with open(json_path, 'w') as json_file:
+        json.dump(data, json_file, separators=(',', ':'))
+
+
+def generate(output_dir, count, seed=0, processes=None, **options):
+    """Write count samples, named 1.jpg, 1.json, ... like the sample dataset.
+
+    Existing samples are kept, so a dataset grows without regenerating it.
+    Sample i is the same for the same seed and options.
+
+    Args:
+        output_dir: string.
+        count: int32.
+        seed: int32.
+        processes: int32.
+            Writer processes, CPU count by default.
+        options: see make_sample.
+    """
+    for name in (options.get('class_mix') or {}):
+        if name not in POLYGON_MAKERS:
+            raise ValueError("Unknown class '%s', known: %s"
+                             % (name, ', '.join(sorted(POLYGON_MAKERS))))
+
+    if not os.path.exists(output_dir):
+        os.makedirs(output_dir)
+
+    tasks = [(output_dir, index, seed * 1000003 + index, options)
+             for index in range(1, count + 1)]
+
+    pool = multiprocessing.Pool(processes)
+    try:
+        for _ in pool.imap_unordered(_write_sample, tasks, chunksize=64):
+            pass
+    finally:
+        pool.close()
+        pool.join()
+
+
+def parse_class_mix(text):
+    """Parse 'route=0.7,obstacle=0.3' into a dictionary."""
+    class_mix = {}
+    for item in text.split(','):
+        name, probability = item.split('=')
+        class_mix[name] = float(probability)
+    return class_mix
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('output_dir')
+    parser.add_argument('--count', type=int, default=1000)
+    parser.add_argument('--width', type=int, default=320)
+    parser.add_argument('--height', type=int, default=180)
+    parser.add_argument('--polygons', default='1-3',
+                        help='Range of polygons per image, e.g. 1-3.')
+    parser.add_argument('--complexity', type=int, default=12,
+                        help='Vertices per polygon.')
+    parser.add_argument('--class-mix', default='route=0.7,obstacle=0.3',
+                        help='Probabilities of polygon classes.')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--processes', type=int, default=None)
+    args = parser.parse_args()
+
+    polygons = tuple(int(value) for value in args.polygons.split('-'))
+    if len(polygons) == 1:
+        polygons = polygons * 2
+
+    start_time = time.time()
+    generate(args.output_dir, args.count, seed=args.seed, processes=args.processes,
+             height=args.height, width=args.width, polygons=polygons,
+             complexity=args.complexity, class_mix=parse_class_mix(args.class_mix))
+    print("Generated %d samples in '%s' in %.1f s."
+          % (args.count, args.output_dir, time.time() - start_time))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,124 @@
+#!/usr/bin/env python
+
+"""Numerical equivalence of the optimize_graph folding passes.
+
+A small frozen graph with random weights has the same structure as the
+FCN16VGG input and upscore layers (Cast, ReverseV2, Sub, conv1_1 Conv2D,
+BiasAdd, Conv2DBackpropInput), so no checkpoint or vgg16.npy is needed:
+
+    $ python -m unittest test_optimize_graph
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import unittest
+
+import numpy as np
+import tensorflow as tf
+
+import fcn16_vgg
+import optimize_graph
+
+HEIGHT = 7
+WIDTH = 9
+NUM_CLASSES = 3
+KSIZE = 4
+
+
+def freeze_small_graph(channel_order, diagonal=True, seed=0):
+    """Freeze a random-weight graph of conv1_1 and one upscore layer.
+
+    Args:
+        channel_order: string.
+        diagonal: bool.
+            Whether the up-filter upsamples every class only from itself.
+        seed: int32.
+
+    Returns:
+        graph_def: tf.GraphDef.
+    """
+    rng = np.random.RandomState(seed)
+    filter = rng.normal(0, 0.1, (3, 3, 3, NUM_CLASSES)).astype(np.float32)
+    bias = rng.normal(0, 0.1, NUM_CLASSES).astype(np.float32)
+
+    if diagonal:
+        up_filter = np.zeros((KSIZE, KSIZE, NUM_CLASSES, NUM_CLASSES), np.float32)
+        for i in range(NUM_CLASSES):
+            up_filter[:, :, i, i] = fcn16_vgg.bilinear_kernel(KSIZE) * rng.uniform(0.5, 1.5)
+    else:
+        up_filter = rng.normal(0, 0.1, (KSIZE, KSIZE, NUM_CLASSES, NUM_CLASSES))
+        up_filter = up_filter.astype(np.float32)
+
+    with tf.Graph().as_default() as graph:
+        input_placeholder = tf.placeholder(tf.uint8, [None, HEIGHT, WIDTH, 3],
+                                           name=optimize_graph.INPUT_NAME)
+        images = fcn16_vgg.preprocess(input_placeholder, channel_order)
+
+        with tf.variable_scope('conv1_1'):
+            conv = tf.nn.conv2d(images, tf.Variable(filter), [1, 1, 1, 1], padding='SAME')
+            score = tf.nn.relu(tf.nn.bias_add(conv, tf.Variable(bias)))
+
+        with tf.variable_scope('upscore2'):
+            output_shape = tf.stack([tf.shape(score)[0], 2 * HEIGHT, 2 * WIDTH, NUM_CLASSES])
+            upscore = tf.nn.conv2d_transpose(score, tf.Variable(up_filter), output_shape,
+                                             strides=[1, 2, 2, 1], padding='SAME')
+
+        logits = tf.identity(upscore, name=optimize_graph.LOGITS_NAME)
+        tf.argmax(logits, 3, name=optimize_graph.PREDICTION_NAME)
+
+        with tf.Session() as sess:
+            sess.run(tf.global_variables_initializer())
+            return tf.graph_util.convert_variables_to_constants(
+                sess, graph.as_graph_def(),
+                [optimize_graph.LOGITS_NAME, optimize_graph.PREDICTION_NAME])
+
+
+class FoldingTest(unittest.TestCase):
+
+    def setUp(self):
+        self.images = np.random.RandomState(1).randint(
+            0, 256, (2, HEIGHT, WIDTH, 3)).astype(np.uint8)
+
+    def assert_equivalent(self, original, optimized):
+        original_logits, _ = optimize_graph.run_graph(original, self.images)
+        optimized_logits, _ = optimize_graph.run_graph(optimized, self.images)
+
+        # Border pixels see the zero padded taps, so they are checked apart.
+        for region in [np.s_[:, 0], np.s_[:, -1], np.s_[:, :, 0], np.s_[:, :, -1]]:
+            self.assertTrue(np.allclose(original_logits[region], optimized_logits[region],
+                                        atol=1e-3))
+        self.assertTrue(np.allclose(original_logits, optimized_logits, atol=1e-3))
+
+    def test_fold_preprocessing(self):
+        for channel_order in fcn16_vgg.CHANNEL_ORDERS:
+            original = freeze_small_graph(channel_order)
+            optimized = optimize_graph.fold_preprocessing(original, HEIGHT, WIDTH)
+
+            ops = [node.op for node in optimized.node]
+            self.assertNotIn('Sub', ops)
+            self.assertNotIn('ReverseV2', ops)
+            self.assert_equivalent(original, optimized)
+
+    def test_fold_upscore_filters(self):
+        for channel_order in fcn16_vgg.CHANNEL_ORDERS:
+            original = freeze_small_graph(channel_order)
+            optimized = optimize_graph.fold_preprocessing(original, HEIGHT, WIDTH)
+            optimized, folded = optimize_graph.fold_upscore_filters(optimized)
+
+            self.assertEqual(folded, 1)
+            self.assertNotIn('Conv2DBackpropInput', [node.op for node in optimized.node])
+            self.assert_equivalent(original, optimized)
+
+    def test_non_diagonal_filter_is_not_folded(self):
+        original = freeze_small_graph('rgb', diagonal=False)
+        optimized, folded = optimize_graph.fold_upscore_filters(original)
+
+        self.assertEqual(folded, 0)
+        self.assertIn('Conv2DBackpropInput', [node.op for node in optimized.node])
+        self.assert_equivalent(original, optimized)
+
+
+if __name__ == '__main__':
+    unittest.main()
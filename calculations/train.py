@@ -1,165 +1,386 @@
 #!/usr/bin/env python
 
+"""Train FCN16VGG.
+
+Settings come from DEFAULT_CONFIG, a JSON config file (--config) and
+command line options, in this order:
+
+    $ python train.py --config train.json --epochs 20 --accumulation-steps 4
+"""
+
 from __future__ import absolute_import
 from __future__ import division
 from __future__ import print_function
 
+import argparse
+import json
 import logging
+import os
 import sys
 import random
 
 import numpy as np
-import scipy as scp
-import scipy.misc
 import tensorflow as tf
 
+import accuracy
 import fcn16_vgg
 import loss
 import utils
 
-RESOURCE = '../dataset'
-MODEL_PATH = "./models/model.ckpt"
+DEFAULT_CONFIG = {
+    'resource': '../dataset',
+    'vgg16_npy_path': './vgg16.npy',
+    'model_path': './models/model.ckpt',
+    'log_dir': './log_dir/work',
+    # Compiled dataset, it is created from resource only if it is missing.
+    'input_set': 'input_set.npy',
+    'output_set': 'output_set.npy',
+    'num_classes': 3,
+    'test_size': 0.1,
+    'valid_size': 0.1,
+    'epochs': 10,
+    'batch_size': 5,
+    # Gradients of accumulation_steps batches are applied at once, so the
+    # effective batch size is batch_size * accumulation_steps. Batches left
+    # at the end of an epoch are applied as a smaller step.
+    'accumulation_steps': 1,
+    'learning_rate': 0.0001,
+    # 'constant', 'step', 'exponential' or 'cosine'.
+    'lr_schedule': 'constant',
+    'lr_decay_steps': 100,
+    'lr_decay_rate': 0.5,
+    # Validation every eval_every optimizer steps (and after every epoch).
+    'eval_every': 25,
+    # Stop after that many validations without mIoU improvement, 0 - never.
+    'early_stopping_patience': 5,
+}
 
 logging.basicConfig(format='%(asctime)s %(levelname)s %(message)s',
                     level=logging.INFO,
                     stream=sys.stdout)
 
-dataset = utils.read_files(RESOURCE)
-random.shuffle(dataset)
-input_set, output_set = utils.split_dataset(dataset)
-
-np.save("input_set.npy", input_set)
-np.save("output_set.npy", output_set)
-# input_set = np.load("input_set.npy")
-# output_set = np.load("output_set.npy")
-
-train_input_set, train_output_set, test_input_set, test_output_set \
-    = utils.train_test_split(input_set, output_set, 0.1)
-
-train_input_set, train_output_set, valid_input_set, valid_output_set \
-    = utils.train_test_split(train_input_set, train_output_set, 0.1)
-
-height = input_set.shape[1]
-width = input_set.shape[2]
-num_classes = 3
 
-epochs = 10
-batch_size = 5
-size = train_input_set.shape[0]
-num_steps = epochs * size // batch_size
-
-
-def compare(predicted_data, real_data):
-    """Compare predicted image with real image.
+def load_config(path=None, overrides=None):
+    """Make training config.
 
     Args:
-        predicted_data: numpy array, int32 - [height, width].
-            Array of the prediction.
-        real_data: numpy array, int32 - [height, width].
-            Array of the real.
+        path: string.
+            JSON config file, its keys override DEFAULT_CONFIG.
+        overrides: dictionary.
+            Values which override the config file, None values are skipped.
 
     Returns:
-        result: float32.
-            Similarity of the images.
+        config: dictionary.
     """
-    num_equals = 0
-    height, width = predicted_data.shape[:2]
+    config = dict(DEFAULT_CONFIG)
+
+    if path is not None:
+        with open(path) as config_file:
+            file_config = json.load(config_file)
 
-    for i in range(height):
-        for j in range(width):
-            if predicted_data[i, j] == real_data[i, j]:
-                num_equals += 1
+        unknown = set(file_config) - set(DEFAULT_CONFIG)
+        if unknown:
+            raise ValueError('Unknown config keys: ' + ', '.join(sorted(unknown)))
+        config.update(file_config)
 
-    result = 100.0 * num_equals / (height * width)
-    return result
+    for key, value in (overrides or {}).items():
+        if value is not None:
+            config[key] = value
 
+    return config
 
-def accuracy(predicted_batch_set, real_batch_set):
-    """Get accuracy of predicted data.
+
+def compile_dataset(config, recompile=False):
+    """Load the compiled dataset, compile it only if it is missing.
+
+    The dataset is shuffled once when it is compiled, so train, validation
+    and test sets stay the same between runs.
 
     Args:
-        predicted_batch_set: numpy array, int32 - [batch_size, width, height].
-            The predicted data.
-        real_batch_set: numpy array, int32 - [batch_size, width, height].
-            The ground truth of the data.
+        config: dictionary.
+        recompile: bool.
+            Whether to read the resource again.
 
     Returns:
-        Accuracy of predicted data.
+        input_set: numpy array, uint8 - [size, height, width, 3].
+        output_set: numpy array, uint8 - [size, height, width].
     """
-    predicted_batch_size = predicted_batch_set.shape[0]
-    real_batch_size = real_batch_set.shape[0]
-
-    assert (predicted_batch_size == real_batch_size)
+    input_path = config['input_set']
+    output_path = config['output_set']
 
-    sum = 0.0
-    for i in range(predicted_batch_size):
-        sum += compare(predicted_batch_set[i], real_batch_set[i])
+    if not recompile and os.path.exists(input_path) and os.path.exists(output_path):
+        print("Loading compiled dataset '%s'." % input_path)
+        return np.load(input_path), utils.sparse_labels(np.load(output_path))
 
-    return sum / predicted_batch_size
+    dataset = utils.read_files(config['resource'], sparse=True)
+    random.shuffle(dataset)
+    input_set, output_set = utils.split_dataset(dataset)
 
+    np.save(input_path, input_set)
+    np.save(output_path, output_set)
 
-# With CPU mini-batch size can be bigger.
-with tf.device('/cpu:0'):
-    config = tf.ConfigProto(allow_soft_placement=True)
-    config.gpu_options.allow_growth = True
+    return input_set, output_set
 
-    with tf.Session(config=config) as sess:
-        input_placeholder = tf.placeholder(tf.float32, [None, height, width, num_classes])
-        output_placeholder = tf.placeholder(tf.float32, [None, height, width, num_classes])
 
-        vgg_fcn = fcn16_vgg.FCN16VGG('./vgg16.npy')
+class Trainer:
+    """FCN16VGG training with gradient accumulation, learning rate schedule
+    and early stopping on validation mIoU.
 
-        with tf.name_scope("content_vgg"):
-            vgg_fcn.build(input_placeholder, train=True, num_classes=num_classes)
+    Args:
+        config: dictionary.
+            See DEFAULT_CONFIG.
+    """
 
-        with tf.name_scope("loss"):
-            loss = loss.loss(vgg_fcn.upscore32, output_placeholder, num_classes)
-            optimizer = tf.train.AdamOptimizer(0.0001).minimize(loss)
-            tf.summary.scalar("loss", loss)
+    def __init__(self, config):
+        self.config = config
+        self.num_classes = config['num_classes']
+
+    def build(self, height, width):
+        """Build the training graph.
+
+        Args:
+            height: int32.
+            width: int32.
+        """
+        config = self.config
+
+        self.input_placeholder = tf.placeholder(tf.uint8, [None, height, width, 3])
+        self.output_placeholder = tf.placeholder(tf.uint8, [None, height, width])
+
+        self.vgg_fcn = fcn16_vgg.FCN16VGG(config['vgg16_npy_path'])
+
+        with tf.name_scope('content_vgg'):
+            self.vgg_fcn.build(self.input_placeholder, train=True,
+                               num_classes=self.num_classes)
+
+        with tf.name_scope('loss'):
+            self.loss = loss.sparse_loss(self.vgg_fcn.upscore32, self.output_placeholder,
+                                         self.num_classes,
+                                         regularization_losses=self.vgg_fcn.regularization_losses)
+            tf.summary.scalar('loss', self.loss)
+
+        self.global_step = tf.Variable(0, trainable=False, name='global_step')
+        self.learning_rate = self._learning_rate()
+        tf.summary.scalar('learning_rate', self.learning_rate)
+
+        optimizer = tf.train.AdamOptimizer(self.learning_rate)
+        grads_and_vars = [(grad, var) for grad, var in optimizer.compute_gradients(self.loss)
+                          if grad is not None]
+
+        steps = config['accumulation_steps']
+        if steps == 1:
+            self.accumulate_op = None
+            self.train_op = optimizer.apply_gradients(grads_and_vars,
+                                                      global_step=self.global_step)
+        else:
+            with tf.name_scope('accumulation'):
+                accumulators = [tf.Variable(tf.zeros_like(var.initialized_value()),
+                                            trainable=False)
+                                for _, var in grads_and_vars]
+                self.accumulate_op = tf.group(*[accumulator.assign_add(grad)
+                                                for accumulator, (grad, _) in
+                                                zip(accumulators, grads_and_vars)])
+                # Fewer batches are accumulated at the end of an epoch.
+                self.accumulated_batches = tf.placeholder_with_default(float(steps), [])
+
+            # The last batch adds its gradients to the accumulated ones and the
+            # accumulators are zeroed after the update, in the same run.
+            apply_op = optimizer.apply_gradients(
+                [((accumulator + grad) / self.accumulated_batches, var)
+                 for accumulator, (grad, var) in zip(accumulators, grads_and_vars)],
+                global_step=self.global_step)
+            with tf.control_dependencies([apply_op]):
+                self.train_op = tf.group(*[accumulator.assign(tf.zeros_like(accumulator))
+                                           for accumulator in accumulators])
+
+        self.saver = tf.train.Saver()
+        self.merged_summary_op = tf.summary.merge_all()
+
+        # Evaluation tower shares the variables and runs without dropout,
+        # it is built after merging summaries, so training steps do not run it.
+        self.eval_fcn = self.vgg_fcn.share()
+        with tf.name_scope('content_vgg_eval'):
+            self.eval_fcn.build(self.input_placeholder, train=False,
+                                num_classes=self.num_classes)
 
         print('Finished building Network.')
 
-        # Initializing the variables.
-        init = tf.global_variables_initializer()
-
-        # Saver op to save and restore all the variables.
-        saver = tf.train.Saver()
-
-        # Merge all the summaries and write them out.
-        merged_summary_op = tf.summary.merge_all()
-
-        # Initializing summary writer for TensorBoard.
-        summary_writer = tf.summary.FileWriter('./log_dir/work', tf.get_default_graph())
-
-        # Run initialized variables.
-        sess.run(init)
-
-        print('Running the Network')
-        print('Training the Network')
-        for step in range(num_steps):
-            offset = (step * batch_size) % size
-            batch_input = train_input_set[offset:(offset + batch_size), :]
-            batch_output = train_output_set[offset:(offset + batch_size), :]
-
-            _, l, predictions, summary = sess.run([optimizer, loss, vgg_fcn.pred_up, merged_summary_op],
-                                                  feed_dict={input_placeholder: batch_input,
-                                                             output_placeholder: batch_output})
-
-            # Write logs at every iteration.
-            summary_writer.add_summary(summary, epochs * offset + step)
-
-            # Output intermediate step information.
-            if (step + 1) % 25 == 0:
-                print("Minibatch loss at step %d: %f" % (step + 1, l))
-                print("Minibatch accuracy: %.1f%%" % accuracy(predictions, batch_output.argmax(axis=3)))
-
-                valid_prediction = sess.run(vgg_fcn.pred_up, feed_dict={input_placeholder: valid_input_set})
-                print("Validation accuracy: %.1f%%" % accuracy(valid_prediction, valid_output_set.argmax(axis=3)))
-
-        # Get accuracy of the test set.
-        test_prediction = sess.run(vgg_fcn.pred_up, feed_dict={input_placeholder: test_input_set})
-        print("Test accuracy: %.1f%%" % accuracy(test_prediction, test_output_set.argmax(axis=3)))
-
-        # Save model weights to disk.
-        save_path = saver.save(sess, MODEL_PATH)
-        print("Model saved in file: %s" % save_path)
+    def _learning_rate(self):
+        config = self.config
+        schedule = config['lr_schedule']
+        learning_rate = config['learning_rate']
+
+        if schedule == 'constant':
+            return tf.constant(learning_rate)
+        elif schedule == 'step':
+            return tf.train.exponential_decay(learning_rate, self.global_step,
+                                              config['lr_decay_steps'],
+                                              config['lr_decay_rate'], staircase=True)
+        elif schedule == 'exponential':
+            return tf.train.exponential_decay(learning_rate, self.global_step,
+                                              config['lr_decay_steps'],
+                                              config['lr_decay_rate'])
+        elif schedule == 'cosine':
+            return tf.train.cosine_decay(learning_rate, self.global_step,
+                                         config['lr_decay_steps'])
+
+        raise ValueError("Unknown learning rate schedule '%s'." % schedule)
+
+    def evaluate(self, sess, input_set, output_set):
+        """Get pixel accuracy and mIoU.
+
+        Args:
+            sess: tf.Session.
+            input_set: numpy array - [size, height, width, 3].
+            output_set: numpy array - [size, height, width].
+
+        Returns:
+            pixel_accuracy: float32.
+            miou: float32.
+                Both are None if the set is empty.
+        """
+        if input_set.shape[0] == 0:
+            return None, None
+
+        batch_size = self.config['batch_size']
+        predictions = []
+        for offset in range(0, input_set.shape[0], batch_size):
+            predictions.append(sess.run(self.eval_fcn.pred_up, feed_dict={
+                self.input_placeholder: input_set[offset:(offset + batch_size)]}))
+        predictions = np.concatenate(predictions)
+
+        pixel_accuracy = 100.0 * np.mean(predictions == output_set)
+        miou = accuracy.mean_iou(predictions, output_set, self.num_classes)
+        return pixel_accuracy, miou
+
+    def train(self, input_set, output_set):
+        """Train the model and save the best checkpoint by validation mIoU.
+
+        Args:
+            input_set: numpy array - [size, height, width, 3].
+            output_set: numpy array - [size, height, width].
+        """
+        config = self.config
+
+        train_input_set, train_output_set, test_input_set, test_output_set \
+            = utils.train_test_split(input_set, output_set, config['test_size'])
+
+        train_input_set, train_output_set, valid_input_set, valid_output_set \
+            = utils.train_test_split(train_input_set, train_output_set, config['valid_size'])
+
+        height, width = input_set.shape[1:3]
+        size = train_input_set.shape[0]
+        batch_size = config['batch_size']
+        accumulation_steps = config['accumulation_steps']
+        patience = config['early_stopping_patience']
+
+        # With CPU mini-batch size can be bigger.
+        with tf.device('/cpu:0'):
+            self.build(height, width)
+
+            with tf.Session(config=utils.session_config('training')) as sess:
+                summary_writer = tf.summary.FileWriter(config['log_dir'], sess.graph)
+                sess.run(tf.global_variables_initializer())
+
+                best_miou = -1.0
+                saved = False
+                evaluations_without_improvement = 0
+                step = 0
+                stop = False
+
+                print('Training the Network')
+                for epoch in range(config['epochs']):
+                    order = np.random.permutation(size)
+                    accumulated = 0
+
+                    for offset in range(0, size, batch_size):
+                        indices = np.sort(order[offset:(offset + batch_size)])
+                        feed_dict = {self.input_placeholder: train_input_set[indices],
+                                     self.output_placeholder: train_output_set[indices]}
+
+                        # The last batch of an epoch applies a partial accumulation,
+                        # so every epoch ends with an optimizer step and validation.
+                        accumulated += 1
+                        is_last_batch = offset + batch_size >= size
+                        if accumulated < accumulation_steps and not is_last_batch:
+                            sess.run(self.accumulate_op, feed_dict=feed_dict)
+                            continue
+
+                        if self.accumulate_op is not None:
+                            feed_dict[self.accumulated_batches] = accumulated
+                        accumulated = 0
+
+                        # Summaries are written only once per optimizer step.
+                        _, l, summary = sess.run([self.train_op, self.loss,
+                                                  self.merged_summary_op], feed_dict=feed_dict)
+                        step += 1
+                        summary_writer.add_summary(summary, step)
+
+                        if step % config['eval_every'] != 0 and not is_last_batch:
+                            continue
+                        # Nothing to select the best model by.
+                        if valid_input_set.shape[0] == 0:
+                            continue
+
+                        pixel_accuracy, miou = self.evaluate(sess, valid_input_set,
+                                                             valid_output_set)
+                        print("Epoch %d, step %d, minibatch loss: %f" % (epoch + 1, step, l))
+                        print("Validation accuracy: %.1f%%, mIoU: %.1f%%" % (pixel_accuracy, miou))
+
+                        if miou > best_miou:
+                            best_miou = miou
+                            evaluations_without_improvement = 0
+                            saved = True
+                            save_path = self.saver.save(sess, config['model_path'])
+                            print("Model saved in file: %s" % save_path)
+                        else:
+                            evaluations_without_improvement += 1
+                            if patience and evaluations_without_improvement >= patience:
+                                print('Early stopping, best validation mIoU: %.1f%%' % best_miou)
+                                stop = True
+                                break
+
+                    if stop:
+                        break
+
+                if saved:
+                    # Get accuracy of the test set with the best model.
+                    self.saver.restore(sess, config['model_path'])
+                else:
+                    save_path = self.saver.save(sess, config['model_path'])
+                    print("No validated model, final model saved in file: %s" % save_path)
+
+                if test_input_set.shape[0] > 0:
+                    pixel_accuracy, miou = self.evaluate(sess, test_input_set, test_output_set)
+                    print("Test accuracy: %.1f%%, mIoU: %.1f%%" % (pixel_accuracy, miou))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--config', default=None, help='JSON config file.')
+    parser.add_argument('--recompile', action='store_true',
+                        help='Read the resource again instead of the compiled dataset.')
+    parser.add_argument('--resource', default=None)
+    parser.add_argument('--model-path', default=None)
+    parser.add_argument('--epochs', type=int, default=None)
+    parser.add_argument('--batch-size', type=int, default=None)
+    parser.add_argument('--accumulation-steps', type=int, default=None)
+    parser.add_argument('--learning-rate', type=float, default=None)
+    parser.add_argument('--lr-schedule', default=None,
+                        choices=['constant', 'step', 'exponential', 'cosine'])
+    parser.add_argument('--early-stopping-patience', type=int, default=None)
+    args = parser.parse_args()
+
+    overrides = dict((key, value) for key, value in vars(args).items()
+                     if key in DEFAULT_CONFIG)
+    config = load_config(args.config, overrides)
+
+    input_set, output_set = compile_dataset(config, recompile=args.recompile)
+
+    trainer = Trainer(config)
+    trainer.train(input_set, output_set)
+
+
+if __name__ == '__main__':
+    main()
@@ -2,6 +2,8 @@ import numpy as np
 import os.path
 import glob
 import json
+import multiprocessing
+import socket
 import scipy.misc
 from PIL import Image, ImageDraw
 import tensorflow as tf
@@ -11,6 +13,11 @@ OUTPUT = 'output'
 
 CLASSES = ['boundary', 'route', 'obstacle']
 
+# Thread-pool profile written by autotune.py, FCN_SESSION_PROFILE overrides it.
+SESSION_PROFILE_PATH = os.environ.get(
+    'FCN_SESSION_PROFILE',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'session_profile.json'))
+
 
 def train_test_split(input_set, output_set, test_size):
     """Split arrays or matrices into train and test subsets.
@@ -51,12 +58,67 @@ def activation_summary(x):
     tf.summary.scalar(tensor_name + '/sparsity', tf.nn.zero_fraction(x))
 
 
-def read_files(dir):
+def load_session_profile(mode, path=None):
+    """Load autotuned settings of the current host.
+
+    Args:
+        mode: string.
+            'inference' or 'training'.
+        path: string.
+            Profile path, SESSION_PROFILE_PATH by default.
+
+    Returns:
+        settings: dictionary - {'intra_op_parallelism_threads',
+            'inter_op_parallelism_threads', 'batch_size', 'images_per_second'}.
+            None if there is no profile for this host and mode.
+    """
+    path = path or SESSION_PROFILE_PATH
+    if not os.path.exists(path):
+        return None
+
+    with open(path) as profile_file:
+        profile = json.load(profile_file)
+
+    # Profile of another machine does not fit this one.
+    if (profile.get('host') != socket.gethostname() or
+            profile.get('cpu_count') != multiprocessing.cpu_count()):
+        return None
+
+    return profile.get(mode)
+
+
+def session_config(mode='inference', path=None):
+    """Make session config with autotuned thread pools if there is a profile.
+
+    Args:
+        mode: string.
+            'inference' or 'training'.
+        path: string.
+            Profile path, SESSION_PROFILE_PATH by default.
+
+    Returns:
+        config: tf.ConfigProto.
+    """
+    config = tf.ConfigProto(allow_soft_placement=True)
+    config.gpu_options.allow_growth = True
+
+    settings = load_session_profile(mode, path)
+    if settings is not None:
+        config.intra_op_parallelism_threads = settings['intra_op_parallelism_threads']
+        config.inter_op_parallelism_threads = settings['inter_op_parallelism_threads']
+
+    return config
+
+
+def read_files(dir, sparse=False):
     """Read files and create a dataset.
 
     Args:
         dir: string.
             Image directory.
+        sparse: bool.
+            Whether OUTPUT is a class index map, uint8 - [height, width],
+            instead of One Hot encoding - [height, width, num_classes].
 
     Returns:
         dataset: list of dictionaries - [{INPUT: [], OUTPUT: []}].
@@ -95,7 +157,8 @@ def read_files(dir):
         height, width = input_image.shape[:2]
 
         output_image = polygons_to_regions(data['polygons'], height, width, CLASSES)
-        output_image = regions_to_one_hot_encoding(output_image, len(CLASSES))
+        if not sparse:
+            output_image = regions_to_one_hot_encoding(output_image, len(CLASSES))
 
         item = {
             INPUT: input_image,
@@ -150,11 +213,11 @@ def polygons_to_regions(polygons, height, width, classes):
             List of class labels.
 
     Returns:
-        regions: numpy array, int32 - [height, width].
+        regions: numpy array, uint8 - [height, width].
             Every cell in array is a number of the class.
     """
     # Create a zero array. Zero indicates background or boundaries.
-    regions = np.zeros([height, width])
+    regions = np.zeros([height, width], np.uint8)
 
     for polygon in polygons:
         # Make points from JSON to list.
@@ -174,7 +237,7 @@ def polygons_to_regions(polygons, height, width, classes):
         ImageDraw.Draw(image).polygon(points_list, outline=1, fill=1)
 
         # Set class index value to result.
-        regions[np.nonzero(image)] = class_index
+        regions[np.asarray(image, np.bool_)] = class_index
 
     return regions
 
@@ -191,16 +254,7 @@ def regions_to_one_hot_encoding(array, num_classes):
     Returns:
         one_hot: numpy array, int32 - [height, width, num_classes].
     """
-    height, width = array.shape[:2]
-
-    one_hot = np.zeros([height, width, num_classes])
-
-    for i in range(height):
-        for j in range(width):
-            class_index = int(array[i, j])
-            one_hot[i, j, class_index] = 1
-
-    return one_hot
+    return np.eye(num_classes)[array.astype(np.intp)]
 
 
 def one_hot_encoding_to_regions(one_hot):
@@ -211,19 +265,24 @@ def one_hot_encoding_to_regions(one_hot):
             Array of the regions.
 
     Returns:
-        regions: numpy array, int32 - [height, width].
+        regions: numpy array, uint8 - [height, width].
     """
-    height, width, num_classes = one_hot.shape
+    return one_hot.argmax(axis=-1).astype(np.uint8)
 
-    regions = np.zeros([height, width])
 
-    for i in range(height):
-        for j in range(width):
-            for k in range(num_classes):
-                if one_hot[i, j, k] != 0:
-                    regions[i, j] = int(one_hot[i, j, k])
+def sparse_labels(output_set):
+    """Make output set to be class index maps.
 
-    return regions
+    Args:
+        output_set: numpy array - [size, height, width] class indices or
+            [size, height, width, num_classes] One Hot encoding.
+
+    Returns:
+        output_set: numpy array, uint8 - [size, height, width].
+    """
+    if output_set.ndim == 4:
+        return one_hot_encoding_to_regions(output_set)
+    return output_set.astype(np.uint8, copy=False)
 
 
 def points_to_list(points):
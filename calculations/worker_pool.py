@@ -0,0 +1,315 @@
+#!/usr/bin/env python
+
+"""Multi-process FCN16VGG inference over a shared-memory ring buffer.
+
+Every worker process has its own session with a fixed thread budget and
+is pinned to its own CPUs. Frames and label maps are exchanged through
+one shared-memory block of slots, only slot indices go through the
+queues, so frame data is never pickled:
+
+    pool = InferencePool('./models/model.ckpt', 180, 320, workers=4)
+    for prediction in pool.map(frames):
+        ...
+    pool.close()
+
+Throughput over a video:
+
+    $ python worker_pool.py video16.avi --workers 4 --threads 2
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import argparse
+import collections
+import multiprocessing
+import os
+import queue
+import time
+from multiprocessing import shared_memory
+
+import cv2
+import numpy as np
+import tensorflow as tf
+
+import inference
+
+
+def _ring_views(memory, slots, height, width):
+    """Frames and label maps arrays over the shared memory block."""
+    frames = np.ndarray((slots, height, width, 3), np.uint8, buffer=memory.buf)
+    labels = np.ndarray((slots, height, width), np.uint8, buffer=memory.buf,
+                        offset=frames.nbytes)
+    return frames, labels
+
+
+def _work(memory_name, slots, height, width, model_path, num_classes, bgr,
+          threads, cpus, batch_size, tasks, results):
+    """Worker process: segment the frames of slots read from tasks."""
+    if cpus and hasattr(os, 'sched_setaffinity'):
+        os.sched_setaffinity(0, cpus)
+    cv2.setNumThreads(1)
+
+    config = tf.ConfigProto(allow_soft_placement=True,
+                            intra_op_parallelism_threads=threads,
+                            inter_op_parallelism_threads=1)
+    segmenter = inference.Segmenter(model_path, num_classes=num_classes, config=config,
+                                    channel_order='bgr' if bgr else 'rgb')
+
+    memory = shared_memory.SharedMemory(name=memory_name)
+    frames, labels = _ring_views(memory, slots, height, width)
+
+    # Warm up run, so the first frames do not pay for graph initialization.
+    segmenter.predict(frames[:1])
+    results.put((None, None))
+
+    while True:
+        slot = tasks.get()
+        if slot is None:
+            break
+
+        batch = [slot]
+        while len(batch) < batch_size:
+            try:
+                slot = tasks.get_nowait()
+            except queue.Empty:
+                break
+            if slot is None:
+                # The stop signal is for the next get of some worker.
+                tasks.put(None)
+                break
+            batch.append(slot)
+
+        try:
+            labels[batch] = segmenter.predict(frames[batch])
+            error = None
+        except Exception as exception:
+            error = str(exception)
+
+        for slot in batch:
+            results.put((slot, error))
+
+    del frames, labels
+    memory.close()
+    segmenter.close()
+
+
+class InferencePool:
+    """Inference worker processes sharing a ring buffer of frame slots.
+
+    Args:
+        model_path: string.
+        height: int32.
+        width: int32.
+            Inference size, frames of other sizes are resized into slots.
+        workers: int32.
+            The number of processes.
+        threads: int32.
+            Session threads of every worker, CPUs are split evenly by default.
+        batch_size: int32.
+            Maximal number of slots a worker runs at once.
+        slots: int32.
+            Ring buffer size, frames in flight.
+        num_classes: int32.
+        bgr: bool.
+            Whether frames are BGR (as read by OpenCV), they are reordered
+            in-graph.
+        start_timeout: float32.
+            Seconds a worker may take to restore the model and warm up.
+    """
+
+    def __init__(self, model_path, height, width, workers=2, threads=None,
+                 batch_size=4, slots=None, num_classes=3, bgr=False, start_timeout=300.0):
+        self.height = height
+        self.width = width
+        self.slots = slots or 2 * workers * batch_size
+
+        cpus = sorted(os.sched_getaffinity(0)) if hasattr(os, 'sched_getaffinity') \
+            else list(range(multiprocessing.cpu_count()))
+        threads = threads or max(1, len(cpus) // workers)
+
+        frame_size = height * width * 3
+        self.memory = shared_memory.SharedMemory(
+            create=True, size=self.slots * (frame_size + height * width))
+        self.frames, self.labels = _ring_views(self.memory, self.slots, height, width)
+
+        self._free = collections.deque(range(self.slots))
+        # Submitted slots whose result has not been received yet.
+        self._pending = set()
+        context = multiprocessing.get_context('spawn')
+        self._tasks = context.Queue()
+        self._results = context.Queue()
+
+        self._processes = []
+        for i in range(workers):
+            # Consecutive CPUs for every worker, wrapped if there are not enough.
+            worker_cpus = [cpus[(i * threads + j) % len(cpus)] for j in range(threads)]
+            process = context.Process(target=_work, args=(
+                self.memory.name, self.slots, height, width, model_path, num_classes,
+                bgr, threads, worker_cpus, batch_size, self._tasks, self._results))
+            process.daemon = True
+            process.start()
+            self._processes.append(process)
+
+        # Wait until every worker is warm, a worker which died during
+        # initialization (bad checkpoint, affinity error, OOM) never reports.
+        deadline = time.time() + start_timeout
+        warm = 0
+        while warm < workers:
+            try:
+                self._results.get(timeout=1.0)
+                warm += 1
+                continue
+            except queue.Empty:
+                pass
+
+            dead = [process for process in self._processes if not process.is_alive()]
+            if dead or time.time() > deadline:
+                self._terminate()
+                if dead:
+                    raise RuntimeError('Inference worker exited during initialization '
+                                       'with code %s.' % dead[0].exitcode)
+                raise RuntimeError('Inference workers did not start in %.0f s.'
+                                   % start_timeout)
+
+    def map(self, frames):
+        """Segment frames, label maps are yielded in the order of frames.
+
+        Args:
+            frames: iterable of numpy arrays, uint8 - [height, width, 3].
+
+        Yields:
+            prediction: numpy array, uint8 - [height, width].
+        """
+        order = collections.deque()
+        done = set()
+
+        for frame in frames:
+            while not self._free:
+                done.add(self._wait())
+                while order and order[0] in done:
+                    done.remove(order[0])
+                    yield self._release(order.popleft())
+            order.append(self._submit(frame))
+
+        while order:
+            while order[0] not in done:
+                done.add(self._wait())
+            done.remove(order[0])
+            yield self._release(order.popleft())
+
+    def close(self):
+        if self.memory is None:
+            # Terminated after a worker died.
+            return
+
+        for _ in self._processes:
+            self._tasks.put(None)
+        for process in self._processes:
+            process.join()
+
+        del self.frames, self.labels
+        self.memory.close()
+        self.memory.unlink()
+
+    def _terminate(self):
+        for process in self._processes:
+            if process.is_alive():
+                process.terminate()
+            process.join()
+
+        del self.frames, self.labels
+        self.memory.close()
+        self.memory.unlink()
+        self.memory = None
+
+    def _submit(self, frame):
+        slot = self._free.popleft()
+        if frame.shape[:2] == (self.height, self.width):
+            np.copyto(self.frames[slot], frame)
+        else:
+            cv2.resize(frame, (self.width, self.height), dst=self.frames[slot])
+        self._tasks.put(slot)
+        self._pending.add(slot)
+        return slot
+
+    def _wait(self):
+        slot, error = self._get_result()
+        self._pending.discard(slot)
+        if error is not None:
+            self._drain()
+            raise RuntimeError('Inference worker failed: ' + error)
+        return slot
+
+    def _get_result(self, timeout=1.0):
+        """Wait for the next result, fail if a worker died (OOM kill, crash)."""
+        while True:
+            try:
+                return self._results.get(timeout=timeout)
+            except queue.Empty:
+                pass
+
+            dead = [process for process in self._processes if not process.is_alive()]
+            if dead:
+                # Slots the dead worker took never complete.
+                self._terminate()
+                raise RuntimeError('Inference worker exited with code %s.'
+                                   % dead[0].exitcode)
+
+    def _drain(self):
+        """Discard results of slots still in flight after a failed map.
+
+        Otherwise the next map would take them for its own frames.
+        """
+        while self._pending:
+            slot, _ = self._get_result()
+            self._pending.discard(slot)
+        # The failed map never releases its slots.
+        self._free = collections.deque(range(self.slots))
+
+    def _release(self, slot):
+        prediction = self.labels[slot].copy()
+        self._free.append(slot)
+        return prediction
+
+
+def read_frames(path):
+    cap = cv2.VideoCapture(path)
+    while cap.isOpened():
+        ret, frame = cap.read()
+        if not ret:
+            break
+        yield frame
+    cap.release()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('video', help='Test video.')
+    parser.add_argument('--model', default='./models/model.ckpt')
+    parser.add_argument('--workers', type=int, default=2)
+    parser.add_argument('--threads', type=int, default=None,
+                        help='Session threads per worker.')
+    parser.add_argument('--batch-size', type=int, default=4)
+    parser.add_argument('--width', type=int, default=320)
+    parser.add_argument('--height', type=int, default=180)
+    args = parser.parse_args()
+
+    pool = InferencePool(args.model, args.height, args.width, workers=args.workers,
+                         threads=args.threads, batch_size=args.batch_size, bgr=True)
+
+    frames = 0
+    start_time = time.time()
+    for _ in pool.map(read_frames(args.video)):
+        frames += 1
+    elapsed = time.time() - start_time
+    pool.close()
+
+    print('Frames: %d' % frames)
+    print('Throughput: %.1f frames/s' % (frames / max(elapsed, 1e-6)))
+
+
+if __name__ == '__main__':
+    main()